@@ -1,166 +1,519 @@
 import random
-import json
+import threading
+import time
 from pathlib import Path
 
+import numpy as np
+
+from bitboard import bit_list, get_geometry, iter_bits
+from search import AlphaBetaSearch
+from mcts import MCTSSearch
+from solved import get_solved_table
+from opening_book import get_opening_book
+from qtable import MAX_CELLS, QTable, binary_path, convert_json_in_subprocess, import_json_q_values
+from qlog import QUpdateLog
+from convergence import ConvergenceMonitor
+import instrumentation
+
 class TicTacToeAgent:
-    def __init__(self, symbol, q_value_file="agent_q_values.json", epsilon=0.1, learning_rate=0.1, discount_factor=0.9):
+    def __init__(self, symbol, board_size=3, win_condition=3, q_value_file="agent_q_values.json", epsilon=0.1, learning_rate=0.1, discount_factor=0.9, canonical=False, search_time=1.0, search_nodes=None, q_table=None, stats=None, strategy="minimax", read_only=False, memory_budget=None, eviction="lru", value_dtype=np.float32, lazy=False, opening_book=True, track_usage=False):
+        if board_size < 1 or not 1 <= win_condition <= board_size:
+            raise ValueError(f"Invalid configuration: {win_condition}-in-a-row on a {board_size}x{board_size} board")
+        if board_size * board_size > MAX_CELLS:
+            # Position keys, used by the Q-table, replay buffer and batched selection, are 64-bit
+            raise ValueError(f"Boards of more than {MAX_CELLS} cells are not supported, got {board_size}x{board_size}")
         self.symbol = symbol
-        self.q_value = {} # Stores Q(s, a) - value of taking action 'a' in state 's'
+        self.is_x = symbol == "X"
+        self.board_size = board_size
+        self.win_condition = win_condition
+        self.geometry = get_geometry(board_size, win_condition)
+        self.n_cells = self.geometry.n_cells
+        self.lines, self.lines_by_cell = self.geometry.lines, self.geometry.lines_by_cell
+        self.q_value = None # Stores Q(s, a) - value of taking action 'a' in state 's', keyed by position key
         self.epsilon = epsilon # For exploration during training
         self.learning_rate = learning_rate # Alpha
         self.discount_factor = discount_factor # Gamma
         self.q_value_file = Path(q_value_file)
-        self.load_q_values()
+        # When enabled, the Q-table and the minimax memo are keyed by the symmetry-canonical
+        # form of each position so all 8 rotations/reflections share one entry
+        self.canonical = canonical
+        # Optional instrumentation.AgentStats; every measurement is skipped while it is None
+        self.stats = stats
+        self.value_dtype = value_dtype # float16 halves the Q-table's memory
+        # Bytes for the Q-table on boards too large for a preallocated table; the least
+        # recently (eviction="lru") or least often ("lfu") used states make room
+        self.memory_budget = memory_budget
+        self.eviction = eviction
+        # Count how often each state is used; the counts are saved with the table so that
+        # `python qtable.py compact --min-visits N` can drop rarely visited states
+        self.track_usage = track_usage
+        self.lazy = lazy
+        self.q_loaded = threading.Event() # Set once self.q_value holds the table to play with
+        if q_table is not None:
+            # An already built table (e.g. a training worker's copy) replaces loading from disk
+            self.q_value = q_table
+            self.canonical = q_table.canonical
+            self.configure_table(q_table)
+            self.q_loaded.set()
+        elif lazy:
+            # The agent is usable at once: until the background load swaps the table in, it
+            # plays on an empty one, i.e. every move comes from the solved table or search
+            self.q_value = QTable(self.n_cells, canonical=self.canonical, dtype=value_dtype)
+            threading.Thread(target=self.load_q_values, daemon=True).start()
+        else:
+            self.load_q_values()
         self.history = [] # To store (state, action) pairs during a game for learning
+        # Play never adds entries to the Q-table; with read_only=True training moves do not either
+        self.read_only = read_only
+        self.update_listener = None # Optional callback(states, actions, new_values) after each Q update
+        self.replay = None # Optional replay.ReplayBuffer; when set, games are learned from in minibatches
 
         # Memoization for minimax search (planning aspect)
         self.minimax_memo = {}
+        # Budgeted search used by select_move; exhaustive minimax_evaluate does not finish on
+        # boards larger than 3x3. With strategy="mcts" a tree search guided by the Q-table
+        # picks the move (search_nodes then counts playouts).
+        if strategy not in ("minimax", "mcts"):
+            raise ValueError(f"Unknown strategy: {strategy}")
+        self.strategy = strategy
+        if strategy == "mcts":
+            self.search_engine = MCTSSearch(self.geometry, time_limit=search_time, playout_limit=search_nodes,
+                                            prior=self.q_prior)
+        else:
+            self.search_engine = AlphaBetaSearch(self.geometry, time_limit=search_time, node_limit=search_nodes)
+        # Exact values and best moves for every reachable position on boards small enough
+        # to solve (3x3), shared by all agents in the process; None otherwise
+        self.solved_table = get_solved_table(board_size, win_condition)
+        # Prebuilt search results for the first moves (opening_book.py), read on first use
+        self.use_opening_book = opening_book
 
     def load_q_values(self):
-        if self.q_value_file.exists():
-            try:
-                with open(self.q_value_file, "r") as f:
-                    loaded_data = json.load(f)
-                    self.q_value = {
-                        state_str: {int(action_str): value for action_str, value in actions_dict.items()}
-                        for state_str, actions_dict in loaded_data.items()
-                    }
-            except Exception as e:
-                print(f"Error loading Q-values: {e}")
-        else:
-            print("No existing Q-value file found. Starting with an empty Q-table.")
+        # Q-values live in a binary table next to the configured file (same name, .qbin)
+        # that is memory-mapped on load; a legacy JSON file is converted the first time
+        start = time.perf_counter() if self.stats is not None else 0.0
+        binary_file = binary_path(self.q_value_file)
+        try:
+            if binary_file.exists():
+                table = QTable.open(binary_file, self.n_cells, dtype=self.value_dtype)
+            elif self.q_value_file.exists():
+                print(f"Converting {self.q_value_file} to {binary_file}...")
+                if self.lazy:
+                    # Keeps the threads playing meanwhile responsive; the file comes back
+                    # uncanonicalized and is canonicalized below when the agent needs it
+                    table = QTable.open(convert_json_in_subprocess(self.q_value_file), self.n_cells,
+                                        dtype=self.value_dtype)
+                else:
+                    table = import_json_q_values(self.q_value_file, self.geometry, self.canonical)
+                    table.save(binary_file)
+                    table.astype(self.value_dtype)
+            else:
+                print("No existing Q-value file found. Starting with an empty Q-table.")
+                table = QTable(self.n_cells, canonical=self.canonical, dtype=self.value_dtype)
+        except Exception as e:
+            print(f"Error loading Q-values: {e}")
+            table = QTable(self.n_cells, canonical=self.canonical, dtype=self.value_dtype)
 
-    def save_q_values(self):
+        if table.canonical != self.canonical:
+            if self.canonical:
+                table = self.canonicalize_table(table)
+            else:
+                # A canonical table cannot be expanded back, so the agent follows the table
+                print("Q-table was saved with canonical=True; enabling canonical keys.")
+        self.configure_table(table)
+        # The table goes in whole, before the keys change: a lazy agent playing meanwhile
+        # only ever finds a non-canonical key in a canonical table when the key is its own
+        # canonical form, so every lookup is right or misses
+        self.q_value = table
+        self.canonical = table.canonical
+        self.q_loaded.set()
+        if self.stats is not None:
+            self.stats.add_time(instrumentation.IO, time.perf_counter() - start)
+
+    def wait_for_q_values(self, timeout=None):
+        # Blocks until a lazy agent's table is loaded; False if the timeout ran out first
+        return self.q_loaded.wait(timeout)
+
+    def configure_table(self, table):
+        # Usage tracking and the memory budget of a table the agent is about to use
+        if self.track_usage:
+            table.track_usage()
+        if self.memory_budget is None:
+            return
+        if table.ranked:
+            print("Q-tables up to 3x3 are preallocated; the memory budget does not apply.")
+        else:
+            table.set_memory_budget(self.memory_budget, self.eviction)
+
+    def canonicalize_table(self, table):
+        canonical_table = QTable(self.n_cells, canonical=True, dtype=self.value_dtype)
+        for state in table:
+            canonical_state, to_frame, _ = self.q_state(*self.geometry.split_key(state))
+            if canonical_state in canonical_table:
+                continue # Another image of this position was already loaded
+            row = table.values[table.row(state)]
+            canonical_row = canonical_table.row(canonical_state, create=True)
+            canonical_table.values[canonical_row, list(to_frame)] = row
+        return canonical_table
+
+    def save_q_values(self, quantize=None):
+        # quantize="int16" or "float16" halves the file, see QTable.save. Returns whether
+        # the table reached the disk.
+        self.wait_for_q_values() # Never overwrite the file with a lazy agent's placeholder
+        start = time.perf_counter() if self.stats is not None else 0.0
+        saved = True
         try:
-            with open(self.q_value_file, "w") as f:
-                serializable_q_value = {
-                    state_str: {str(action_idx): value for action_idx, value in actions_dict.items()}
-                    for state_str, actions_dict in self.q_value.items()
-                }
-                json.dump(serializable_q_value, f)
+            self.q_value.save(binary_path(self.q_value_file), quantize)
         except Exception as e:
             print(f"Error saving Q-values: {e}")
+            saved = False
+        if self.stats is not None:
+            self.stats.add_time(instrumentation.IO, time.perf_counter() - start)
+        return saved
 
     def select_move(self, board, training_mode=False):
-        current_state_str = "".join(board)
-        available_moves = self.available_moves(board)
-
-        if not available_moves:
+        x_bits, o_bits = self.geometry.to_bits(board)
+        return self.select_move_bits(x_bits, o_bits, training_mode)
+
+    def q_state(self, x_bits, o_bits):
+        # Returns the Q-table key of a position plus the cell mappings into and out of the
+        # key's frame (both None when the agent does not canonicalize)
+        if self.canonical:
+            state, t = self.geometry.canonical(x_bits, o_bits)
+            return state, self.geometry.symmetries[t], self.geometry.inverse_symmetries[t]
+        return self.geometry.key(x_bits, o_bits), None, None
+
+    def select_move_bits(self, x_bits, o_bits, training_mode=False):
+        if self.stats is None:
+            return self.choose_move(x_bits, o_bits, training_mode)
+        start = time.perf_counter()
+        move = self.choose_move(x_bits, o_bits, training_mode)
+        self.stats.add_time(instrumentation.SELECT, time.perf_counter() - start)
+        return move
+
+    def choose_move(self, x_bits, o_bits, training_mode=False):
+        stats = self.stats
+        current_state, to_frame, from_frame = self.q_state(x_bits, o_bits)
+        available_moves = bit_list(self.geometry.empty_bits(x_bits, o_bits))
+
+        # Nothing to play on a full board, nor on a won one (its search has no moves to return)
+        if not available_moves or self.winner_bits(x_bits, o_bits) is not None:
             return None
 
-        best_minimax_score = -float('inf')
-        minimax_best_moves = []
-
-        for move in available_moves:
-            next_board = self.make_move(board, move, self.symbol)
-            score = self.minimax_evaluate(next_board, self.opponent(self.symbol))
-            if score > best_minimax_score:
-                best_minimax_score = score
-                minimax_best_moves = [move]
-            elif score == best_minimax_score:
-                minimax_best_moves.append(move)
+        own, other = (x_bits, o_bits) if self.is_x else (o_bits, x_bits)
+        start = time.perf_counter() if stats is not None else 0.0
+        solved = self.solved_table.lookup(own, other) if self.solved_table is not None else None
+        book = self.book_lookup(own, other) if solved is None else None
+        if solved is not None:
+            best_minimax_score, best_mask = solved
+            minimax_best_moves = bit_list(best_mask)
+            if stats is not None:
+                stats.count(instrumentation.SOLVED_LOOKUPS)
+        elif book is not None:
+            best_minimax_score, minimax_best_moves = book
+            if stats is not None:
+                stats.count(instrumentation.BOOK_LOOKUPS)
+        else:
+            # The search returns every root move tied for the best score; when the budget runs
+            # out before the game is solved it is the best found by the deepest finished iteration
+            result = self.search_engine.search(own, other)
+            best_minimax_score = result.outcome
+            minimax_best_moves = result.best_moves
+            if stats is not None:
+                stats.count(instrumentation.SEARCH_NODES, result.nodes)
+        if stats is not None:
+            stats.add_time(instrumentation.SEARCH, time.perf_counter() - start)
 
         if best_minimax_score == 1:
+            if stats is not None:
+                stats.count(instrumentation.FORCED_WIN)
             return random.choice(minimax_best_moves)
         elif best_minimax_score == -1 and not training_mode:
             pass
 
         if training_mode and random.uniform(0, 1) < self.epsilon:
             chosen_move = random.choice(available_moves)
+            if stats is not None:
+                stats.count(instrumentation.EXPLORATION)
+        elif solved is None and self.strategy == "mcts":
+            # The tree search already weighed the Q-values, its most visited move is final
+            chosen_move = random.choice(minimax_best_moves)
+            if stats is not None:
+                stats.count(instrumentation.MCTS)
         else:
-            if current_state_str not in self.q_value:
-                self.q_value[current_state_str] = {move: 0 for move in available_moves}
-
-            q_scores = self.q_value[current_state_str]
-            max_q = -float('inf')
-            q_best_moves = []
-
-            for move in available_moves:
-                if move not in q_scores:
-                    q_scores[move] = 0.0
-                if q_scores[move] > max_q:
-                    max_q = q_scores[move]
-                    q_best_moves = [move]
-                elif q_scores[move] == max_q:
-                    q_best_moves.append(move)
+            # Rows hold -inf for occupied cells, so the max and its ties are over legal moves only
+            # Only training adds states; in play a missing state means every move is worth 0
+            row = self.q_value.row(current_state, create=training_mode and not self.read_only) # May grow the table, so look up values after
+            # A state without an entry has every legal move at 0
+            q_scores = self.q_value.values[row] if row >= 0 else None
+            max_q = q_scores.max() if q_scores is not None else 0.0
 
             if max_q == 0.0 and best_minimax_score != 1:
                 chosen_move = random.choice(minimax_best_moves)
+                if stats is not None:
+                    stats.count(instrumentation.MINIMAX_FALLBACK)
             else:
-                chosen_move = random.choice(q_best_moves)
+                chosen_action = int(random.choice(np.flatnonzero(q_scores == max_q)))
+                chosen_move = chosen_action if from_frame is None else from_frame[chosen_action]
+                if stats is not None:
+                    stats.count(instrumentation.Q_GREEDY)
 
         if training_mode:
-            self.history.append((current_state_str, chosen_move))
+            # Actions are recorded in the same frame as the state they belong to
+            self.history.append((current_state, chosen_move if to_frame is None else to_frame[chosen_move]))
 
         return chosen_move
 
-    def minimax_evaluate(self, board, current_player_turn):
-        state_str = "".join(board)
-        if state_str in self.minimax_memo:
-            return self.minimax_memo[state_str]
-
-        winner_symbol = self.winner(board)
-        if winner_symbol == self.symbol:
-            return 1
-        elif winner_symbol == self.opponent(self.symbol):
-            return -1
-        elif " " not in board:
+    def select_moves(self, boards, return_scores=False):
+        # Batched select_move (play mode) for a list of boards or a 2-D array of cells
+        # (0 empty, 1 X, 2 O); see select_moves_bits
+        if isinstance(boards, np.ndarray) and boards.dtype.kind in "iu":
+            cells = boards.reshape(len(boards), self.n_cells).astype(np.uint64)
+            bit_weights = np.left_shift(np.uint64(1), np.arange(self.n_cells, dtype=np.uint64))
+            x_bits = (cells == 1).astype(np.uint64) @ bit_weights
+            o_bits = (cells == 2).astype(np.uint64) @ bit_weights
+        else:
+            bits = [self.geometry.to_bits(board) for board in boards]
+            x_bits = np.array([x for x, _ in bits], dtype=np.uint64)
+            o_bits = np.array([o for _, o in bits], dtype=np.uint64)
+        return self.select_moves_bits(x_bits, o_bits, return_scores)
+
+    def select_moves_bits(self, x_bits, o_bits, return_scores=False):
+        # Moves for many positions at once: keys, solved-table and Q lookups and tie sets are
+        # computed for the whole batch, solved positions and searches once per distinct
+        # position. Random choices are drawn board by board in order, so with the same seed
+        # the moves are those of select_move_bits on each position in turn (as long as the
+        # searches are repeatable, which they always are on solved boards).
+        # Returns an int array of moves, -1 where a board has none (full or won). With
+        # return_scores, also the minimax outcome of each position for the agent and the
+        # Q-value of the move played (nan when the state has no entry).
+        geometry = self.geometry
+        n_cells = self.n_cells
+        stats = self.stats
+        x_bits = np.asarray(x_bits, dtype=np.uint64)
+        o_bits = np.asarray(o_bits, dtype=np.uint64)
+        n_boards = len(x_bits)
+        own, other = (x_bits, o_bits) if self.is_x else (o_bits, x_bits)
+
+        # Q-table keys, and with canonical keys the transform of every board
+        transforms = None
+        if self.canonical:
+            shifts = np.arange(n_cells, dtype=np.uint64)
+            bit_weights = np.left_shift(np.uint64(1), shifts)
+            x_cells = (x_bits[:, None] >> shifts) & np.uint64(1)
+            o_cells = (o_bits[:, None] >> shifts) & np.uint64(1)
+            images = np.stack([(x_cells[:, perm] @ bit_weights) | ((o_cells[:, perm] @ bit_weights) << np.uint64(n_cells))
+                               for perm in geometry.inverse_symmetries], axis=1)
+            transforms = images.argmin(axis=1)
+            states = images[np.arange(n_boards), transforms]
+        else:
+            states = x_bits | (o_bits << np.uint64(n_cells))
+
+        # Solved values and best moves, looked up once per distinct position
+        solved_values = np.zeros(n_boards, dtype=np.int64)
+        solved_moves = [None] * n_boards
+        if self.solved_table is not None and n_boards:
+            solved = self.solved_table
+            rank_of = np.array(solved.rank_of, dtype=np.int64)
+            ranks, inverse = np.unique(rank_of[own.astype(np.int64)] + 2 * rank_of[other.astype(np.int64)],
+                                       return_inverse=True)
+            stored = np.frombuffer(solved.values, dtype=np.uint8)[ranks].astype(np.int64)
+            masks = np.frombuffer(solved.best_masks, dtype=np.uint16)[ranks]
+            unique_moves = [bit_list(int(mask)) if value else None for value, mask in zip(stored, masks)]
+            solved_values = (stored - 2)[inverse]
+            solved_moves = [unique_moves[i] for i in inverse.tolist()]
+
+        # Q rows that exist already, their maxima and the tied best actions (in the key's frame)
+        rows = self.q_value.rows(states) if n_boards else np.zeros(0, dtype=np.int64)
+        has_row = rows >= 0
+        q_rows = self.q_value.values[np.where(has_row, rows, 0)]
+        max_q = np.where(has_row, q_rows.max(axis=1, initial=-np.inf), 0.0)
+        ties = q_rows == max_q[:, None]
+
+        moves = np.full(n_boards, -1, dtype=np.int64)
+        minimax_scores = np.zeros(n_boards, dtype=np.int64)
+        q_scores = np.full(n_boards, np.nan, dtype=np.float32)
+        searched = {}
+        x_list, o_list, own_list, other_list = x_bits.tolist(), o_bits.tolist(), own.tolist(), other.tolist()
+        for i in range(n_boards):
+            if not geometry.empty_bits(x_list[i], o_list[i]) or self.winner_bits(x_list[i], o_list[i]) is not None:
+                continue
+            if solved_moves[i] is not None:
+                best_minimax_score, minimax_best_moves = int(solved_values[i]), solved_moves[i]
+                if stats is not None:
+                    stats.count(instrumentation.SOLVED_LOOKUPS)
+            else:
+                position = (own_list[i], other_list[i])
+                if position not in searched:
+                    book = self.book_lookup(*position)
+                    if book is not None:
+                        searched[position] = book
+                        if stats is not None:
+                            stats.count(instrumentation.BOOK_LOOKUPS)
+                    else:
+                        result = self.search_engine.search(*position)
+                        searched[position] = (result.outcome, result.best_moves)
+                        if stats is not None:
+                            stats.count(instrumentation.SEARCH_NODES, result.nodes)
+                best_minimax_score, minimax_best_moves = searched[position]
+            minimax_scores[i] = best_minimax_score
+            to_frame = None if transforms is None else geometry.symmetries[transforms[i]]
+            from_frame = None if transforms is None else geometry.inverse_symmetries[transforms[i]]
+
+            row = int(rows[i])
+            if best_minimax_score == 1:
+                move = random.choice(minimax_best_moves)
+                branch = instrumentation.FORCED_WIN
+            elif solved_moves[i] is None and self.strategy == "mcts":
+                move = random.choice(minimax_best_moves)
+                branch = instrumentation.MCTS
+            else:
+                if row < 0 or max_q[i] == 0.0:
+                    move = random.choice(minimax_best_moves)
+                    branch = instrumentation.MINIMAX_FALLBACK
+                else:
+                    action = int(random.choice(np.flatnonzero(ties[i])))
+                    move = action if from_frame is None else from_frame[action]
+                    branch = instrumentation.Q_GREEDY
+            moves[i] = move
+            if stats is not None:
+                stats.count(branch)
+            if return_scores and row >= 0:
+                q_scores[i] = self.q_value.values[row, move if to_frame is None else to_frame[move]]
+
+        if return_scores:
+            return moves, minimax_scores, q_scores
+        return moves
+
+    def book_lookup(self, own, other):
+        # (outcome, best moves) for an opening position in the book, else None. The book
+        # holds alpha-beta results, so MCTS agents keep their own search.
+        if not self.use_opening_book or self.strategy != "minimax":
+            return None
+        book = get_opening_book(self.board_size, self.win_condition)
+        return book.lookup(own, other) if book is not None else None
+
+    def q_prior(self, own, other):
+        # Q-values of the agent's moves in a position given from the agent's side, indexed
+        # by board cell, or None when the table has nothing for it
+        x_bits, o_bits = (own, other) if self.is_x else (other, own)
+        state, to_frame, _ = self.q_state(x_bits, o_bits)
+        row = self.q_value.row(state)
+        if row < 0:
+            return None
+        values = self.q_value.values[row]
+        if not values[np.isfinite(values)].any():
+            return None
+        return (values if to_frame is None else values[list(to_frame)]).tolist()
+
+    def minimax_evaluate(self, board, current_player_turn, last_move=None):
+        x_bits, o_bits = self.geometry.to_bits(board)
+        return self.minimax_bits(x_bits, o_bits, current_player_turn == "X", last_move)
+
+    def minimax_bits(self, x_bits, o_bits, x_to_move, last_move=None):
+        # Side to move is part of the key since either player may have started the game
+        position = self.geometry.canonical(x_bits, o_bits)[0] if self.canonical else self.geometry.key(x_bits, o_bits)
+        state = position | (x_to_move << (2 * self.n_cells))
+        stats = self.stats
+        if state in self.minimax_memo:
+            if stats is not None:
+                stats.count(instrumentation.MEMO_HITS)
+            return self.minimax_memo[state]
+        if stats is not None:
+            stats.count(instrumentation.MEMO_MISSES)
+
+        # Only the player who just moved can have completed a line
+        if last_move is not None:
+            if self.geometry.has_win(o_bits if x_to_move else x_bits, last_move):
+                return -1 if x_to_move == self.is_x else 1
+        elif self.geometry.has_win(x_bits):
+            return 1 if self.is_x else -1
+        elif self.geometry.has_win(o_bits):
+            return -1 if self.is_x else 1
+
+        empty = self.geometry.empty_bits(x_bits, o_bits)
+        if not empty:
             return 0
 
-        best_score_for_current_player = -float('inf') if current_player_turn == self.symbol else float('inf')
-
-        for move in self.available_moves(board):
-            next_board = self.make_move(board, move, current_player_turn)
-            score = self.minimax_evaluate(next_board, self.opponent(current_player_turn))
+        if stats is not None:
+            stats.count(instrumentation.MINIMAX_NODES)
+        maximizing = x_to_move == self.is_x
+        best_score_for_current_player = -float('inf') if maximizing else float('inf')
 
-            if current_player_turn == self.symbol:
-                best_score_for_current_player = max(best_score_for_current_player, score)
+        for move in iter_bits(empty):
+            bit = 1 << move
+            if x_to_move:
+                score = self.minimax_bits(x_bits | bit, o_bits, False, move)
             else:
-                best_score_for_current_player = min(best_score_for_current_player, score)
+                score = self.minimax_bits(x_bits, o_bits | bit, True, move)
 
-        self.minimax_memo[state_str] = best_score_for_current_player
+            if maximizing:
+                if score > best_score_for_current_player:
+                    best_score_for_current_player = score
+            elif score < best_score_for_current_player:
+                best_score_for_current_player = score
+
+        self.minimax_memo[state] = best_score_for_current_player
         return best_score_for_current_player
 
     def update_q_values(self, final_reward):
-        for i in reversed(range(len(self.history))):
-            state, action = self.history[i]
-
-            if i == len(self.history) - 1:
-                next_q_max = 0
-            else:
-                next_state_str, _ = self.history[i+1]
-                if next_state_str in self.q_value and self.q_value[next_state_str]:
-                    next_q_max = max(self.q_value[next_state_str].values())
-                else:
-                    next_q_max = 0
-
-            target = final_reward + self.discount_factor * next_q_max
-            if state not in self.q_value:
-                self.q_value[state] = {}
-            if action not in self.q_value[state]:
-                self.q_value[state][action] = 0.0
-
-            self.q_value[state][action] += self.learning_rate * (target - self.q_value[state][action])
+        if not self.history:
+            return
+        self.wait_for_q_values()
+        start = time.perf_counter() if self.stats is not None else 0.0
+        # All steps of the game are backed up at once: each target uses the best value of
+        # the next recorded state as it was before this update
+        states, actions = zip(*self.history)
+        if self.replay is not None:
+            # The game goes into the replay buffer, which updates in minibatches every few games
+            self.replay.add_game(states, actions, final_reward)
+            if self.replay.ready():
+                self.replay.learn(self)
+            self.history = []
+            if self.stats is not None:
+                self.stats.add_time(instrumentation.UPDATE, time.perf_counter() - start)
+            return
+        rows = np.array([self.q_value.row(state, create=True) for state in states])
+        actions = np.array(actions)
+        values = self.q_value.values
+
+        next_q_max = np.zeros(len(rows), dtype=np.float32)
+        next_q_max[:-1] = values[rows[1:]].max(axis=1)
+        targets = final_reward + self.discount_factor * next_q_max
+        values[rows, actions] += self.learning_rate * (targets - values[rows, actions])
+        if self.update_listener is not None:
+            self.update_listener(np.array(states, dtype=np.uint64), actions, values[rows, actions])
 
         self.history = []
+        if self.stats is not None:
+            self.stats.add_time(instrumentation.UPDATE, time.perf_counter() - start)
 
     def available_moves(self, board):
-        return [i for i in range(9) if board[i] == " "]
+        return [i for i in range(self.n_cells) if board[i] == " "]
 
     def make_move(self, board, index, player):
         new_board = list(board)
         new_board[index] = player
         return new_board
 
-    def game_over(self, board):
-        return self.winner(board) is not None or " " not in board
+    def game_over(self, board, last_move=None):
+        return self.winner(board, last_move) is not None or " " not in board
+
+    def winner(self, board, last_move=None):
+        return self.winner_bits(*self.geometry.to_bits(board), last_move=last_move)
 
-    def winner(self, board):
-        wins = [(0,1,2), (3,4,5), (6,7,8), (0,3,6),
-                (1,4,7), (2,5,8), (0,4,8), (2,4,6)]
-        for a, b, c in wins:
-            if board[a] == board[b] == board[c] and board[a] != " ":
-                return board[a]
+    def winner_bits(self, x_bits, o_bits, last_move=None):
+        # Only the lines through the last move can have been completed by it;
+        # without a last move every line on the board has to be checked
+        if last_move is not None:
+            if x_bits >> last_move & 1:
+                return "X" if self.geometry.has_win(x_bits, last_move) else None
+            if o_bits >> last_move & 1:
+                return "O" if self.geometry.has_win(o_bits, last_move) else None
+            return None
+        if self.geometry.has_win(x_bits):
+            return "X"
+        if self.geometry.has_win(o_bits):
+            return "O"
         return None
 
     def evaluate_result(self, board, player):
@@ -188,59 +541,136 @@ class TicTacToeAgent:
         return "O" if player == "X" else "X"
 
 # --- Training Function ---
-def train(agent, n_games=100000, opponent_type="random"):
-    print(f"Training agent for {n_games} games against a {opponent_type} opponent...")
-    win_count = 0
-    draw_count = 0
-    loss_count = 0
-
-    for i in range(n_games):
-        board = [" "] * 9
-        current_player_turn = "X"
-
-        agent.history = []
-
-        while True:
-            available_moves = agent.available_moves(board)
-            if not available_moves or agent.winner(board) is not None:
-                break
-
-            if current_player_turn == agent.symbol:
-                move = agent.select_move(board, training_mode=True)
-            else:
-                if opponent_type == "random":
-                    move = random.choice(available_moves)
-                elif opponent_type == "minimax":
-                    temp_opponent_agent = TicTacToeAgent(current_player_turn)
-                    move = temp_opponent_agent.select_move(board, training_mode=False)
+def play_training_game(agent, opponent_type="random", opponents=None):
+    # Plays one game with the agent in training mode, leaving its moves in agent.history.
+    # Returns the result for the agent: 1 win, 0 draw, -1 loss. `opponents` caches the
+    # searching opponent used on boards too large for the solved table.
+    geometry = agent.geometry
+    solved_table = agent.solved_table
+    opponents = {} if opponents is None else opponents
+
+    # The game is played directly on bitboards; X always starts in training
+    x_bits = 0
+    o_bits = 0
+    x_to_move = True
+    last_move = None
+
+    agent.history = []
+
+    while True:
+        if last_move is not None and geometry.has_win(o_bits if x_to_move else x_bits, last_move):
+            break
+        empty = geometry.empty_bits(x_bits, o_bits)
+        if not empty:
+            break
+
+        if x_to_move == agent.is_x:
+            move = agent.select_move_bits(x_bits, o_bits, training_mode=True)
+        else:
+            if opponent_type == "random":
+                move = random.choice(bit_list(empty))
+            elif opponent_type == "minimax":
+                own, other = (x_bits, o_bits) if x_to_move else (o_bits, x_bits)
+                solved = solved_table.lookup(own, other) if solved_table is not None else None
+                if solved is not None:
+                    move = random.choice(bit_list(solved[1]))
                 else:
-                    move = random.choice(available_moves)
-
-            if move is None:
-                break
-
-            board = agent.make_move(board, move, current_player_turn)
-            current_player_turn = agent.opponent(current_player_turn)
+                    # Boards too large to solve fall back to one searching opponent for the whole run
+                    symbol = "X" if x_to_move else "O"
+                    if symbol not in opponents:
+                        opponents[symbol] = TicTacToeAgent(symbol, board_size=agent.board_size,
+                                                           win_condition=agent.win_condition)
+                    move = opponents[symbol].select_move_bits(x_bits, o_bits, training_mode=False)
+            else:
+                move = random.choice(bit_list(empty))
 
-        final_result = agent.evaluate_result(board, agent.symbol)
-        agent.update_q_values(final_result)
+        if move is None:
+            break
 
-        if final_result == 1:
-            win_count += 1
-        elif final_result == 0:
-            draw_count += 1
+        if x_to_move:
+            x_bits |= 1 << move
         else:
-            loss_count += 1
-
-        if (i + 1) % 10000 == 0:
-            print(f"Game {i+1}/{n_games} - Wins: {win_count}, Draws: {draw_count}, Losses: {loss_count}")
-            win_count = 0
-            draw_count = 0
-            loss_count = 0
-
-    agent.save_q_values()
+            o_bits |= 1 << move
+        last_move = move
+        x_to_move = not x_to_move
+
+    w = agent.winner_bits(x_bits, o_bits, last_move)
+    return 0 if w is None else (1 if w == agent.symbol else -1)
+
+def train(agent, n_games=100000, opponent_type="random", resume=False, checkpoint_every=1000, snapshot_every=100000,
+          report_every=10000, convergence=None):
+    # Q changes are appended to an update log every checkpoint_every games and the full
+    # table is saved every snapshot_every games. With resume=True training continues from
+    # the last snapshot plus the log, at the game counter they reached. When agent.stats
+    # is set, its counters and timings are reported alongside the win/draw/loss counts.
+    # Every report_every games the window's Q changes are measured by `convergence` (a
+    # ConvergenceMonitor, which also decays epsilon and alpha); training stops before
+    # n_games once it reports the table converged.
+    convergence = convergence if convergence is not None else ConvergenceMonitor()
+    agent.wait_for_q_values()
+    update_log = QUpdateLog(agent.q_value_file, agent.n_cells)
+    start_game = 0
+    if resume:
+        start_game = update_log.restore(agent)
+        print(f"Resuming training at game {start_game}/{n_games}...")
+    else:
+        update_log.reset()
+        print(f"Training agent for {n_games} games against a {opponent_type} opponent...")
+    convergence.start(agent, start_game // report_every)
+    win_count = 0
+    draw_count = 0
+    loss_count = 0
+    opponents = {}
+    games_played = start_game
+    if agent.stats is not None:
+        agent.stats.reset(agent)
+    agent.update_listener = lambda states, actions, values: update_log.record(games_played, states, actions, values)
+
+    try:
+        for i in range(start_game, n_games):
+            games_played = i + 1
+            final_result = play_training_game(agent, opponent_type, opponents)
+            agent.update_q_values(final_result)
+
+            if final_result == 1:
+                win_count += 1
+            elif final_result == 0:
+                draw_count += 1
+            else:
+                loss_count += 1
+
+            if (i + 1) % report_every == 0:
+                window = convergence.end_window(agent, win_count, draw_count, loss_count)
+                print(f"Game {i+1}/{n_games} - Wins: {win_count}, Draws: {draw_count}, Losses: {loss_count} - "
+                      f"max |dQ| {window['max_dq']:.4f}, mean |dQ| {window['mean_dq']:.4f}, "
+                      f"policy changed {window['policy_change']:.2%}")
+                if agent.stats is not None:
+                    agent.stats.report(agent, games=i + 1, wins=win_count, draws=draw_count, losses=loss_count,
+                                       opponent_type=opponent_type, **window)
+                win_count = 0
+                draw_count = 0
+                loss_count = 0
+                if convergence.converged:
+                    print(f"Q-values stable for {convergence.stable_windows} windows; stopping at game {i+1}.")
+                    break
+
+            if (i + 1) % snapshot_every == 0:
+                update_log.snapshot(agent, i + 1)
+            elif (i + 1) % checkpoint_every == 0:
+                update_log.flush()
+
+        update_log.snapshot(agent, games_played)
+        if agent.stats is not None:
+            agent.stats.report(agent, games=games_played, wins=win_count, draws=draw_count, losses=loss_count,
+                               opponent_type=opponent_type, final=True)
+    finally:
+        agent.update_listener = None
+        update_log.close()
     print("Training complete and Q-values saved.")
 
 if __name__ == "__main__":
     agent_x = TicTacToeAgent("X", q_value_file="agent_q_values_X.json", epsilon=0.3, learning_rate=0.2, discount_factor=0.95)
-    train(agent_x, n_games=500000, opponent_type="random")
+    # Epsilon and alpha shrink by a fifth every 10,000 games; training stops once three
+    # windows in a row barely change the values and the policy
+    convergence = ConvergenceMonitor(patience=3, epsilon_decay=0.8, min_epsilon=0.01, alpha_decay=0.8, min_alpha=0.01)
+    train(agent_x, n_games=500000, opponent_type="random", convergence=convergence)
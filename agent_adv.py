@@ -1,6 +1,6 @@
 import streamlit as st
-import time
-from agent import TicTacToeAgent
+from model_cache import get_shared_agent
+from ponder import Ponderer
 
 st.set_page_config(layout="centered") # Use centered layout for better presentation of larger board
 
@@ -14,20 +14,15 @@ AI will respond within 1 second.
 # --- Game Configuration ---
 BOARD_SIZE = 5
 WIN_CONDITION = 4 # 4-in-a-row for a 5x5 board is common and more dynamic
+AI_MOVE_TIME = 0.9 # Seconds the AI may spend searching for a move
+PONDER_TIME = 3.0 # Seconds of background search per likely reply while the human thinks
+PONDER_CPU_SHARE = 0.5 # Fraction of a core pondering may use
 AGENT_Q_VALUE_FILE = f"agent_q_values_{BOARD_SIZE}x{BOARD_SIZE}_{WIN_CONDITION}inrow_X.json"
 # --------------------------
 
 # Initialize session state for game statistics if not already present
 if "board" not in st.session_state:
     st.session_state.board = [" "] * (BOARD_SIZE * BOARD_SIZE) # Initialize 5x5 board
-    # Initialize agent with correct board_size and win_condition
-    st.session_state.agent = TicTacToeAgent(
-        "X",
-        board_size=BOARD_SIZE,
-        win_condition=WIN_CONDITION,
-        q_value_file=AGENT_Q_VALUE_FILE,
-        epsilon=0.0 # Agent should be deterministic in play mode
-    )
     st.session_state.turn = "O"
     st.session_state.total_games = 0
     st.session_state.user_wins = 0
@@ -36,7 +31,23 @@ if "board" not in st.session_state:
     st.session_state.game_outcome_recorded = False
 
 board = st.session_state.board
-agent = st.session_state.agent # Reference to the agent from session state
+# Read-only agent created once per server process and shared by every session. The page
+# does not wait for the Q-table: it loads in the background while the opening book and the
+# search play.
+agent = get_shared_agent(
+    "X",
+    board_size=BOARD_SIZE,
+    win_condition=WIN_CONDITION,
+    q_value_file=AGENT_Q_VALUE_FILE,
+    search_time=AI_MOVE_TIME, # Search budget per move, keeps the "within 1 second" promise
+    lazy=True
+)
+
+# Per-session background search of the human's likely replies
+if "ponderer" not in st.session_state:
+    st.session_state.ponderer = Ponderer(agent, think_time=PONDER_TIME, cpu_share=PONDER_CPU_SHARE)
+    st.session_state.ponderer.start(board) # The human opens, so start thinking right away
+ponderer = st.session_state.ponderer
 
 # Helper function to play a user move
 def play_move(pos):
@@ -94,12 +105,16 @@ print_board(board)
 # Ensure AI only moves if game is NOT over and it's its turn
 if not agent.game_over(board) and st.session_state.turn == "X":
     with st.spinner("AI thinking..."):
-        time.sleep(1) # Reduced delay slightly for quicker testing, adjust as needed
-        move = agent.select_move(board)
+        # An answer worked out while the human was thinking, otherwise a search now
+        move = ponderer.lookup(board)
+        ponderer.cancel()
+        if move is None:
+            move = agent.select_move(board)
     if move is not None and board[move] == " ":
         board[move] = "X"
         if not agent.game_over(board):
             st.session_state.turn = "O"
+            ponderer.start(board)
         st.rerun()
     else:
         st.error("AI could not make a valid move. This shouldn't happen.")
@@ -132,6 +147,7 @@ if agent.game_over(board):
         st.session_state.board = [" "] * (BOARD_SIZE * BOARD_SIZE) # Reset board to 5x5
         st.session_state.turn = "O"
         st.session_state.game_outcome_recorded = False
+        ponderer.start(st.session_state.board) # Drops whatever was pondered for the old game
         st.rerun()
 
 # --- Display Statistics ---
@@ -1,6 +1,6 @@
 import streamlit as st
-import time
-from agent import TicTacToeAgent
+from model_cache import get_shared_agent
+from ponder import Ponderer
 
 st.title("Tic Tac Toe with AI master 🤖")
 st.markdown("""
@@ -12,7 +12,6 @@ AI will respond within 1 second.
 # Initialize session state for game statistics if not already present
 if "board" not in st.session_state:
     st.session_state.board = [" "] * 9
-    st.session_state.agent = TicTacToeAgent("X", q_value_file="agent_q_values_X.json", epsilon=0.0)
     st.session_state.turn = "O"
     st.session_state.total_games = 0
     st.session_state.user_wins = 0
@@ -21,7 +20,15 @@ if "board" not in st.session_state:
     st.session_state.game_outcome_recorded = False # Add this flag if not already there
 
 board = st.session_state.board
-agent = st.session_state.agent
+# One read-only agent per server process, shared by every session. It is created without
+# waiting for the Q-table, which loads in the background while the solved table plays.
+agent = get_shared_agent("X", q_value_file="agent_q_values_X.json", lazy=True)
+
+# Per-session background search of the human's likely replies, at most half a core
+if "ponderer" not in st.session_state:
+    st.session_state.ponderer = Ponderer(agent, cpu_share=0.5)
+    st.session_state.ponderer.start(board) # The human opens, so start thinking right away
+ponderer = st.session_state.ponderer
 
 # Helper function to check if the game is over
 def game_over(board):
@@ -96,12 +103,16 @@ print_board(board) # Call this to display the board
 # AI's turn
 # Ensure AI only moves if game is NOT over and it's its turn
 if not game_over(board) and st.session_state.turn == "X":
-    time.sleep(1) # Reduced delay slightly for quicker testing, adjust as needed
-    move = agent.select_move(board)
+    # An answer worked out while the human was thinking, otherwise a search now
+    move = ponderer.lookup(board)
+    ponderer.cancel()
+    if move is None:
+        move = agent.select_move(board)
     if move is not None and board[move] == " ":
         board[move] = "X"
         if not game_over(board): # <--- CHECK GAME OVER AFTER AI MOVE
             st.session_state.turn = "O"
+            ponderer.start(board)
         st.rerun()
     else:
         st.error("AI could not make a valid move. This shouldn't happen.")
@@ -133,6 +144,7 @@ if game_over(board):
         st.session_state.board = [" "] * 9
         st.session_state.turn = "O"
         st.session_state.game_outcome_recorded = False
+        ponderer.start(st.session_state.board) # Drops whatever was pondered for the old game
         st.rerun()
 
 # --- Display Statistics ---
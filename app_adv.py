@@ -1,6 +1,6 @@
 import streamlit as st
-import time
-from agent import TicTacToeAgent
+from model_cache import get_shared_agent
+from ponder import Ponderer
 
 st.set_page_config(layout="centered") # Use centered layout for better presentation of larger board
 
@@ -15,6 +15,9 @@ AI will respond within 1 second.
 # Define BOARD_SIZE and WIN_CONDITION for the 5x5 game
 BOARD_SIZE = 5
 WIN_CONDITION = 4 # 4-in-a-row for a 5x5 board is common and more dynamic
+AI_MOVE_TIME = 0.9 # Seconds the AI may spend searching for a move
+PONDER_TIME = 3.0 # Seconds of background search per likely reply while the human thinks
+PONDER_CPU_SHARE = 0.5 # Fraction of a core pondering may use
 AGENT_SYMBOL = "X"
 # The Q-value file name should match what the agent is configured to use for 5x5
 AGENT_Q_VALUE_FILE = f"agent_q_values_{BOARD_SIZE}x{BOARD_SIZE}_{WIN_CONDITION}inrow_{AGENT_SYMBOL}.json"
@@ -24,14 +27,6 @@ AGENT_Q_VALUE_FILE = f"agent_q_values_{BOARD_SIZE}x{BOARD_SIZE}_{WIN_CONDITION}i
 if "board" not in st.session_state:
     # Initialize board for 5x5
     st.session_state.board = [" "] * (BOARD_SIZE * BOARD_SIZE)
-    # Initialize TicTacToeAgent with the correct board_size and win_condition
-    st.session_state.agent = TicTacToeAgent(
-        AGENT_SYMBOL,
-        board_size=BOARD_SIZE,
-        win_condition=WIN_CONDITION,
-        q_value_file=AGENT_Q_VALUE_FILE,
-        epsilon=0.0 # Set epsilon to 0.0 for play mode (no exploration)
-    )
     st.session_state.turn = "O"
     st.session_state.total_games = 0
     st.session_state.user_wins = 0
@@ -40,7 +35,23 @@ if "board" not in st.session_state:
     st.session_state.game_outcome_recorded = False # Add this flag if not already there
 
 board = st.session_state.board
-agent = st.session_state.agent # Reference to the agent from session state
+# Read-only agent created once per server process and shared by every session (no exploration).
+# The page does not wait for the Q-table: it loads in the background while the opening book
+# and the search play.
+agent = get_shared_agent(
+    AGENT_SYMBOL,
+    board_size=BOARD_SIZE,
+    win_condition=WIN_CONDITION,
+    q_value_file=AGENT_Q_VALUE_FILE,
+    search_time=AI_MOVE_TIME, # Search budget per move, keeps the "within 1 second" promise
+    lazy=True
+)
+
+# Per-session background search of the human's likely replies
+if "ponderer" not in st.session_state:
+    st.session_state.ponderer = Ponderer(agent, think_time=PONDER_TIME, cpu_share=PONDER_CPU_SHARE)
+    st.session_state.ponderer.start(board) # The human opens, so start thinking right away
+ponderer = st.session_state.ponderer
 
 # Helper function to play a user move
 def play_move(pos):
@@ -103,13 +114,18 @@ print_board(board)
 # Ensure AI only moves if game is NOT over and it's its turn
 if not agent.game_over(board) and st.session_state.turn == AGENT_SYMBOL:
     with st.spinner("AI thinking..."):
-        time.sleep(1) # Delay for human readability
-        move = agent.select_move(board)
+        # An answer worked out while the human was thinking, otherwise a search now
+        # (already warm from pondering)
+        move = ponderer.lookup(board)
+        ponderer.cancel()
+        if move is None:
+            move = agent.select_move(board)
     if move is not None and board[move] == " ": # Ensure the selected move is valid and empty
         board[move] = AGENT_SYMBOL
         # After AI's move, check if game is over before changing turn
         if not agent.game_over(board):
             st.session_state.turn = agent.opponent(AGENT_SYMBOL) # Switch turn back to human player
+            ponderer.start(board)
         st.rerun()
     else:
         st.error("AI could not make a valid move. This shouldn't happen under normal circumstances.")
@@ -143,6 +159,7 @@ if agent.game_over(board):
         st.session_state.board = [" "] * (BOARD_SIZE * BOARD_SIZE)
         st.session_state.turn = agent.opponent(AGENT_SYMBOL) # User ('O') always starts
         st.session_state.game_outcome_recorded = False
+        ponderer.start(st.session_state.board) # Drops whatever was pondered for the old game
         st.rerun()
 
 # --- Display Statistics ---
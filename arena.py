@@ -0,0 +1,306 @@
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import random
+
+import numpy as np
+
+from agent import TicTacToeAgent
+from bitboard import bit_list, get_geometry
+
+# Round-robin matches between agent configurations, spread over a process pool.
+# Every pairing plays game pairs (same opening, colours swapped) in rounds until its
+# SPRT reaches a decision or max_games is played; ratings are then fitted to all results.
+#   python arena.py --player name=old,q=agent_q_values_X.json --player name=new,q=ckpt_X.json
+
+ELO_SCALE = 400.0 / math.log(10.0)
+
+# Specs are plain dicts so they can be sent to workers:
+#   name, q_value_file, strategy ("minimax", "mcts" or "random"), search_time, search_nodes, canonical
+DEFAULT_SPEC = {"q_value_file": "agent_q_values.json", "strategy": "minimax", "search_time": 0.05,
+                "search_nodes": None, "canonical": False}
+
+_worker = {}
+
+def init_worker(specs, board_size, win_condition, opening_plies):
+    _worker["specs"] = specs
+    _worker["board_size"] = board_size
+    _worker["win_condition"] = win_condition
+    _worker["opening_plies"] = opening_plies
+    _worker["geometry"] = get_geometry(board_size, win_condition)
+    _worker["agents"] = {}
+
+def worker_agent(index, symbol):
+    # One read-only agent per (player, colour) in each worker, built on first use
+    spec = _worker["specs"][index]
+    if spec["strategy"] == "random":
+        return None
+    key = (index, symbol)
+    if key not in _worker["agents"]:
+        agent = TicTacToeAgent(symbol, board_size=_worker["board_size"], win_condition=_worker["win_condition"],
+                               q_value_file=spec["q_value_file"], epsilon=0.0, canonical=spec["canonical"],
+                               search_time=spec["search_time"], search_nodes=spec["search_nodes"],
+                               strategy=spec["strategy"])
+        agent.read_only = True
+        _worker["agents"][key] = agent
+    return _worker["agents"][key]
+
+def play_game(x_player, o_player, opening):
+    # Result for X: 1 win, 0.5 draw, 0 loss
+    geometry = _worker["geometry"]
+    x_bits = o_bits = 0
+    for ply, move in enumerate(opening):
+        if ply % 2 == 0:
+            x_bits |= 1 << move
+        else:
+            o_bits |= 1 << move
+    x_to_move = len(opening) % 2 == 0
+    for agent in (x_player, o_player):
+        if agent is not None:
+            agent.search_engine.clear() # No tree or table carried over from the previous game
+    last_move = opening[-1] if opening else None
+
+    while True:
+        if last_move is not None and geometry.has_win(o_bits if x_to_move else x_bits, last_move):
+            return 0.0 if x_to_move else 1.0
+        empty = geometry.empty_bits(x_bits, o_bits)
+        if not empty:
+            return 0.5
+        agent = x_player if x_to_move else o_player
+        move = random.choice(bit_list(empty)) if agent is None else agent.select_move_bits(x_bits, o_bits)
+        if x_to_move:
+            x_bits |= 1 << move
+        else:
+            o_bits |= 1 << move
+        last_move = move
+        x_to_move = not x_to_move
+
+def random_opening(rng, geometry, plies):
+    # Random moves that do not end the game, so the pair starts from a live position
+    x_bits = o_bits = 0
+    opening = []
+    for ply in range(plies):
+        empty = bit_list(geometry.empty_bits(x_bits, o_bits))
+        rng.shuffle(empty)
+        for move in empty:
+            bits = (x_bits if ply % 2 == 0 else o_bits) | (1 << move)
+            if not geometry.has_win(bits, move) and len(empty) > 1:
+                break
+        else:
+            break
+        if ply % 2 == 0:
+            x_bits = bits
+        else:
+            o_bits = bits
+        opening.append(move)
+    return opening
+
+def play_pair(task):
+    # Two games between players a and b from the same opening, a playing X first.
+    # Returns a's score in each.
+    a, b, seed = task
+    rng = random.Random(seed)
+    random.seed(seed)
+    opening = random_opening(rng, _worker["geometry"], _worker["opening_plies"])
+    first = play_game(worker_agent(a, "X"), worker_agent(b, "O"), opening)
+    second = 1.0 - play_game(worker_agent(b, "X"), worker_agent(a, "O"), opening)
+    return first, second
+
+def expected_score(elo):
+    return 1.0 / (1.0 + 10.0 ** (-elo / 400.0))
+
+def score_to_elo(score):
+    score = min(max(score, 1e-6), 1.0 - 1e-6)
+    return -400.0 * math.log10(1.0 / score - 1.0)
+
+class MatchStats:
+    # Results of one pairing from the first player's side, with the Elo difference, its
+    # confidence interval and a sequential probability ratio test of H0: elo <= elo0 against
+    # H1: elo >= elo1. Both games of a pair share an opening, so the statistics are taken
+    # over pair scores (0, 0.5, ..., 2 points), which removes the opening's bias from the
+    # variance and lets balanced matches decide much sooner.
+    def __init__(self, elo0=0.0, elo1=10.0, alpha=0.05, beta=0.05):
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.lower_bound = math.log(beta / (1.0 - alpha))
+        self.upper_bound = math.log((1.0 - beta) / alpha)
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+        self.pair_counts = [0] * 5 # Pairs scoring 0, 0.5, 1, 1.5 and 2 points
+
+    def add_pair(self, first, second):
+        for score in (first, second):
+            if score == 1.0:
+                self.wins += 1
+            elif score == 0.5:
+                self.draws += 1
+            else:
+                self.losses += 1
+        self.pair_counts[int(2 * (first + second))] += 1
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    @property
+    def pairs(self):
+        return sum(self.pair_counts)
+
+    def score(self):
+        return (self.wins + 0.5 * self.draws) / self.games if self.games else 0.5
+
+    def variance(self):
+        # Variance of the mean score of a pair; kept above zero so matches of identical
+        # pairs (e.g. all draws) still decide
+        s = self.score()
+        pairs = max(self.pairs, 1)
+        variance = sum(count * (points / 4.0 - s) ** 2 for points, count in enumerate(self.pair_counts)) / pairs
+        return max(variance, 1e-3)
+
+    def elo(self, z=1.96):
+        # Elo difference and its confidence interval (normal approximation on the score)
+        s = self.score()
+        margin = z * math.sqrt(self.variance() / max(self.pairs, 1))
+        return score_to_elo(s), score_to_elo(s - margin), score_to_elo(s + margin)
+
+    def llr(self):
+        # Log-likelihood ratio of H1 to H0 under the normal approximation of the pair scores
+        s0 = expected_score(self.elo0)
+        s1 = expected_score(self.elo1)
+        return self.pairs * (s1 - s0) * (2.0 * self.score() - s0 - s1) / (2.0 * self.variance())
+
+    def decision(self):
+        # "H1" (first player stronger), "H0" (not stronger) or None while undecided
+        llr = self.llr()
+        if llr >= self.upper_bound:
+            return "H1"
+        if llr <= self.lower_bound:
+            return "H0"
+        return None
+
+def fit_ratings(n_players, matches, iterations=50):
+    # Maximum-likelihood Bradley-Terry ratings (draws count half) from the pairwise results,
+    # player 0 anchored at 0. Returns Elo ratings and their standard errors from the
+    # inverse of the observed information.
+    ratings = np.zeros(n_players)
+    pairs = [(a, b, stats.games, stats.wins + 0.5 * stats.draws) for (a, b), stats in matches.items() if stats.games]
+    if not pairs or n_players < 2:
+        return ratings, np.zeros(n_players)
+    # A weak prior (one drawn game against a 0-rated opponent) keeps unbeaten players finite
+    for _ in range(iterations):
+        gradient = -ratings / 4.0
+        hessian = np.diag(np.full(n_players, -0.25))
+        for a, b, games, points in pairs:
+            p = 1.0 / (1.0 + math.exp(ratings[b] - ratings[a]))
+            g = points - games * p
+            h = games * p * (1.0 - p)
+            gradient[a] += g
+            gradient[b] -= g
+            hessian[a, a] -= h
+            hessian[b, b] -= h
+            hessian[a, b] += h
+            hessian[b, a] += h
+        step = np.linalg.solve(hessian[1:, 1:], gradient[1:])
+        ratings[1:] -= step
+        if np.abs(step).max() < 1e-9:
+            break
+    errors = np.zeros(n_players)
+    errors[1:] = np.sqrt(np.diag(np.linalg.inv(-hessian[1:, 1:])))
+    return ratings * ELO_SCALE, errors * ELO_SCALE
+
+def run_arena(specs, board_size=3, win_condition=3, n_workers=None, pairs_per_round=None, max_games=2000,
+              opening_plies=2, elo0=0.0, elo1=10.0, alpha=0.05, beta=0.05, seed=0):
+    # Plays every pairing of `specs` until its SPRT decides or it reaches max_games; rounds
+    # give each undecided pairing pairs_per_round game pairs and run them all in the pool
+    specs = [dict(DEFAULT_SPEC, **spec) for spec in specs]
+    for index, spec in enumerate(specs):
+        spec.setdefault("name", f"player{index}")
+    n_workers = n_workers or multiprocessing.cpu_count()
+    pairs_per_round = pairs_per_round or 4 * n_workers
+    matches = {pair: MatchStats(elo0, elo1, alpha, beta) for pair in itertools.combinations(range(len(specs)), 2)}
+    decisions = {}
+    seeds = itertools.count(seed * 1000003)
+
+    with multiprocessing.Pool(n_workers, initializer=init_worker,
+                              initargs=(specs, board_size, win_condition, opening_plies)) as pool:
+        while True:
+            running = [pair for pair in matches if pair not in decisions]
+            if not running:
+                break
+            tasks = [(a, b, next(seeds)) for a, b in running
+                     for _ in range(min(pairs_per_round, (max_games - matches[a, b].games + 1) // 2))]
+            chunksize = max(1, len(tasks) // (4 * n_workers))
+            for (a, b, _), scores in zip(tasks, pool.imap(play_pair, tasks, chunksize=chunksize)):
+                matches[a, b].add_pair(*scores)
+            for pair in running:
+                stats = matches[pair]
+                decision = stats.decision()
+                if decision is not None or stats.games >= max_games:
+                    decisions[pair] = decision or "max_games"
+
+    ratings, errors = fit_ratings(len(specs), matches)
+    return {
+        "players": [{"name": spec["name"], "elo": float(rating), "elo_error": float(error)}
+                    for spec, rating, error in zip(specs, ratings, errors)],
+        "matches": [{"first": specs[a]["name"], "second": specs[b]["name"], "games": stats.games,
+                     "wins": stats.wins, "draws": stats.draws, "losses": stats.losses,
+                     "elo": stats.elo()[0], "elo_low": stats.elo()[1], "elo_high": stats.elo()[2],
+                     "llr": stats.llr(), "decision": decisions[a, b]}
+                    for (a, b), stats in matches.items()],
+    }
+
+def parse_player(text):
+    # "name=new,q=ckpt_X.json,strategy=mcts,time=0.1,nodes=2000,canonical=1"
+    spec = {}
+    for item in text.split(","):
+        key, _, value = item.partition("=")
+        if key == "name":
+            spec["name"] = value
+        elif key == "q":
+            spec["q_value_file"] = value
+        elif key == "strategy":
+            spec["strategy"] = value
+        elif key == "time":
+            spec["search_time"] = float(value) if value != "none" else None
+        elif key == "nodes":
+            spec["search_nodes"] = int(value) if value != "none" else None
+        elif key == "canonical":
+            spec["canonical"] = value not in ("0", "false", "")
+        else:
+            raise argparse.ArgumentTypeError(f"Unknown player setting: {key}")
+    return spec
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Round-robin arena with Elo ratings and SPRT early stopping")
+    parser.add_argument("--player", type=parse_player, action="append", required=True,
+                        help="name=..,q=..,strategy=minimax|mcts|random,time=..,nodes=..,canonical=0|1")
+    parser.add_argument("--board-size", type=int, default=3)
+    parser.add_argument("--win-condition", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--pairs-per-round", type=int, default=None)
+    parser.add_argument("--max-games", type=int, default=2000, help="Games per pairing at most")
+    parser.add_argument("--opening-plies", type=int, default=2, help="Random moves before the players take over")
+    parser.add_argument("--elo0", type=float, default=0.0)
+    parser.add_argument("--elo1", type=float, default=10.0)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+    if len(args.player) < 2:
+        parser.error("The arena needs at least two players")
+
+    results = run_arena(args.player, args.board_size, args.win_condition, args.workers, args.pairs_per_round,
+                        args.max_games, args.opening_plies, args.elo0, args.elo1, args.alpha, args.beta, args.seed)
+    for match in results["matches"]:
+        print(f"{match['first']} vs {match['second']}: +{match['wins']} ={match['draws']} -{match['losses']} "
+              f"({match['games']} games) Elo {match['elo']:+.0f} [{match['elo_low']:+.0f}, {match['elo_high']:+.0f}] "
+              f"LLR {match['llr']:.2f} -> {match['decision']}")
+    for player in sorted(results["players"], key=lambda player: -player["elo"]):
+        print(f"{player['name']:>20} {player['elo']:+7.0f} ± {1.96 * player['elo_error']:.0f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,162 @@
+import time
+
+import numpy as np
+
+# Cell contents in the batched board arrays
+EMPTY, X, O = 0, 1, 2
+
+class BatchedSelfPlay:
+    # Plays a batch of games in lock-step on an int8 (batch, n_cells) board array.
+    # The agent picks moves epsilon-greedily straight from its Q-table (no search) and
+    # the opponent plays uniformly random legal moves.
+    def __init__(self, agent, rng):
+        self.agent = agent
+        self.rng = rng
+        geometry = agent.geometry
+        self.n_cells = geometry.n_cells
+        self.lines = np.array(geometry.lines, dtype=np.int64) # (n_lines, win_condition)
+        self.bit_weights = np.left_shift(1, np.arange(self.n_cells, dtype=np.int64))
+        self.on_update = None # Optional callback(cells, counts) run before each batched update
+        if agent.canonical:
+            # transforms[t] gathers the transformed board: cell symmetries[t][c] takes board[c]
+            self.transforms = np.array(geometry.inverse_symmetries, dtype=np.int64)
+            self.to_frame = np.array(geometry.symmetries, dtype=np.int64)
+
+    def keys(self, boards):
+        x_bits = (boards == X).astype(np.int64) @ self.bit_weights
+        o_bits = (boards == O).astype(np.int64) @ self.bit_weights
+        return (x_bits | (o_bits << self.n_cells)).astype(np.uint64)
+
+    def q_states(self, boards):
+        # Batched TicTacToeAgent.q_state: keys and, when canonicalizing, the transform per board
+        if not self.agent.canonical:
+            return self.keys(boards), None
+        images = np.stack([self.keys(boards[:, transform]) for transform in self.transforms], axis=1)
+        t = images.argmin(axis=1)
+        return images[np.arange(len(boards)), t], t
+
+    def winners(self, boards, player):
+        return (boards[:, self.lines] == player).all(axis=2).any(axis=1)
+
+    def random_legal(self, legal):
+        # Uniform choice among the legal cells of every row
+        scores = np.where(legal, self.rng.random(legal.shape), -1.0)
+        return scores.argmax(axis=1)
+
+    def play(self, batch_size):
+        agent = self.agent
+        table = agent.q_value
+        boards = np.zeros((batch_size, self.n_cells), dtype=np.int8)
+        done = np.zeros(batch_size, dtype=bool)
+        winner = np.zeros(batch_size, dtype=np.int8)
+        agent_piece = X if agent.is_x else O
+
+        max_steps = (self.n_cells + 1) // 2
+        history_rows = np.zeros((batch_size, max_steps), dtype=np.int64)
+        history_actions = np.zeros((batch_size, max_steps), dtype=np.int64)
+        history_len = np.zeros(batch_size, dtype=np.int64)
+
+        # X always starts in training
+        piece = X
+        while not done.all():
+            active = np.flatnonzero(~done)
+            legal = boards[active] == EMPTY
+            if piece == agent_piece:
+                states, t = self.q_states(boards[active])
+                rows = table.rows(states, create=True)
+                if table.max_rows is not None:
+                    table.pin(rows) # Updated by index at the end of the batch, eviction must wait
+                q = table.values[rows]
+                if t is not None:
+                    # Frame rows back onto the board: board cell c reads q[to_frame[t][c]]
+                    q = np.take_along_axis(q, self.to_frame[t], axis=1)
+                # Random tie-breaking: uniform choice among the cells equal to the row max
+                greedy = self.random_legal(q == q.max(axis=1, keepdims=True))
+                explore = self.rng.random(len(active)) < agent.epsilon
+                moves = np.where(explore, self.random_legal(legal), greedy)
+
+                step = history_len[active]
+                history_rows[active, step] = rows
+                history_actions[active, step] = moves if t is None else self.to_frame[t, moves]
+                history_len[active] += 1
+            else:
+                moves = self.random_legal(legal)
+
+            boards[active, moves] = piece
+            won = self.winners(boards[active], piece)
+            winner[active[won]] = piece
+            full = ~(boards[active] == EMPTY).any(axis=1)
+            done[active[won | full]] = True
+            piece = O if piece == X else X
+
+        rewards = np.where(winner == agent_piece, 1, np.where(winner == EMPTY, 0, -1)).astype(np.float32)
+        self.update(rewards, history_rows, history_actions, history_len)
+        table.unpin()
+        return rewards
+
+    def update(self, rewards, history_rows, history_actions, history_len):
+        # Batched form of TicTacToeAgent.update_q_values: every step of every game gets
+        # target = reward + gamma * max Q(next recorded state), all read before the update
+        agent = self.agent
+        values = agent.q_value.values
+        steps = np.arange(history_rows.shape[1])
+        valid = steps[None, :] < history_len[:, None]
+        has_next = steps[None, :] < (history_len - 1)[:, None]
+
+        next_rows = np.roll(history_rows, -1, axis=1)
+        next_q_max = np.where(has_next, values[next_rows].max(axis=2), 0.0)
+        targets = rewards[:, None] + agent.discount_factor * next_q_max
+
+        rows = history_rows[valid]
+        actions = history_actions[valid]
+        targets = targets[valid]
+
+        # The same (state, action) shows up in many games of a batch. Each pair moves
+        # towards its mean target as far as `count` sequential updates would.
+        cells = rows * self.n_cells + actions
+        unique_cells, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+        target_sums = np.zeros(len(unique_cells), dtype=np.float64)
+        np.add.at(target_sums, inverse, targets)
+        mean_targets = target_sums / counts
+        if self.on_update is not None:
+            self.on_update(unique_cells, counts)
+        flat_values = values.reshape(-1)
+        current = flat_values[unique_cells]
+        step_size = 1.0 - (1.0 - agent.learning_rate) ** counts
+        flat_values[unique_cells] = current + step_size * (mean_targets - current)
+
+def train_batched(agent, n_games=100000, batch_size=4096, seed=None, report_every=10000):
+    # Vectorized counterpart of train(agent, opponent_type="random")
+    print(f"Batched training for {n_games} games against a random opponent ({batch_size} games per batch)...")
+    selfplay = BatchedSelfPlay(agent, np.random.default_rng(seed))
+    win_count = 0
+    draw_count = 0
+    loss_count = 0
+    played = 0
+    start = time.perf_counter()
+
+    while played < n_games:
+        # Batches stop at reporting boundaries so every report covers exactly report_every games
+        next_report = (played // report_every + 1) * report_every
+        size = min(batch_size, n_games - played, next_report - played)
+        rewards = selfplay.play(size)
+        win_count += int((rewards == 1).sum())
+        draw_count += int((rewards == 0).sum())
+        loss_count += int((rewards == -1).sum())
+        played += size
+
+        if played % report_every == 0:
+            games_per_sec = played / (time.perf_counter() - start)
+            print(f"Game {played}/{n_games} - Wins: {win_count}, Draws: {draw_count}, Losses: {loss_count} ({games_per_sec:.0f} games/sec)")
+            win_count = 0
+            draw_count = 0
+            loss_count = 0
+
+    agent.save_q_values()
+    print("Training complete and Q-values saved.")
+
+if __name__ == "__main__":
+    from agent import TicTacToeAgent
+
+    agent_x = TicTacToeAgent("X", q_value_file="agent_q_values_X.json", epsilon=0.3, learning_rate=0.2, discount_factor=0.95)
+    train_batched(agent_x, n_games=500000)
@@ -0,0 +1,410 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+import opening_book
+from agent import TicTacToeAgent, train
+from bitboard import bit_list
+from qtable import QTable, binary_path
+
+# Usage:
+#   python bench.py                              run everything, write bench_results.json
+#   python bench.py --quick --config 3x3         smaller run of one configuration
+#   python bench.py --compare bench_baseline.json
+#       run, then flag metrics that got worse than the baseline by more than --threshold
+#   python bench.py --current bench_results.json --compare bench_baseline.json
+#       compare two saved result files without running anything
+# Exit status is 1 when a comparison finds a regression or startup misses its targets.
+
+CONFIGS = {
+    # name: (board_size, win_condition, search node budget per move)
+    "3x3": (3, 3, None),
+    "5x5": (5, 4, 20000),
+}
+OPPONENT_TYPES = ("random", "minimax")
+
+# Sample counts per configuration: (full run, --quick)
+SELECT_POSITIONS = {"3x3": (300, 50), "5x5": (30, 5)}
+MINIMAX_EMPTIES = {"3x3": 9, "5x5": 9} # Empty cells left in the positions minimax_evaluate solves
+MINIMAX_POSITIONS = {"3x3": (5, 2), "5x5": (5, 2)}
+TRAIN_GAMES = {("3x3", "random"): (5000, 500), ("3x3", "minimax"): (5000, 500),
+               ("5x5", "random"): (500, 50), ("5x5", "minimax"): (3, 1)}
+TABLE_SIZES = {"3x3": (100, 1000, 5000), "5x5": (1000, 10000, 100000)}
+STARTUP_STATES = {"3x3": (5000, 1000), "5x5": (50000, 5000)} # States in the legacy JSON file apps start from
+STARTUP_REPEATS = (5, 2)
+
+# Startup latencies an app session must stay under (p90, milliseconds): until the agent
+# exists and the page can paint, and for the agent's answer to the human's opening move
+STARTUP_TARGETS = {"first_paint": 100.0, "first_move": 250.0}
+
+DEFAULT_THRESHOLD = 0.25
+
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def percentiles(samples):
+    samples = np.asarray(samples) * 1000.0
+    return {
+        "count": len(samples),
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p90_ms": float(np.percentile(samples, 90)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "max_ms": float(samples.max()),
+    }
+
+def random_positions(agent, count, n_empty, rng):
+    # Non-terminal positions reached by random play with n_empty cells left. n_empty
+    # must leave an even number of moves played so that X, the agent, is to move.
+    geometry = agent.geometry
+    positions = []
+    while len(positions) < count:
+        x_bits = o_bits = 0
+        for ply in range(geometry.n_cells - n_empty):
+            move = rng.choice(bit_list(geometry.empty_bits(x_bits, o_bits)))
+            if ply % 2 == 0:
+                x_bits |= 1 << move
+            else:
+                o_bits |= 1 << move
+            if agent.winner_bits(x_bits, o_bits, move) is not None:
+                break
+        else:
+            positions.append((x_bits, o_bits))
+    return positions
+
+def make_agent(name, q_value_file, **kwargs):
+    board_size, win_condition, search_nodes = CONFIGS[name]
+    with quiet():
+        return TicTacToeAgent("X", board_size=board_size, win_condition=win_condition, q_value_file=q_value_file,
+                              search_nodes=search_nodes, **kwargs)
+
+def bench_select_move(name, workdir, quick, rng):
+    agent = make_agent(name, workdir / f"select_{name}.json", epsilon=0.0)
+    geometry = agent.geometry
+    n_positions = SELECT_POSITIONS[name][quick]
+    # Agent to move from a range of game stages
+    positions = []
+    for n_empty in range(geometry.n_cells, 0, -2):
+        positions += random_positions(agent, max(1, n_positions // ((geometry.n_cells + 1) // 2)), n_empty, rng)
+    boards = [geometry.to_board(x_bits, o_bits) for x_bits, o_bits in positions]
+
+    cold = []
+    for board in boards:
+        agent.search_engine.clear()
+        agent.minimax_memo.clear()
+        start = time.perf_counter()
+        agent.select_move(board)
+        cold.append(time.perf_counter() - start)
+
+    # Warm: the same positions again with the search tables filled by a first pass
+    for board in boards:
+        agent.select_move(board)
+    warm = []
+    for board in boards:
+        start = time.perf_counter()
+        agent.select_move(board)
+        warm.append(time.perf_counter() - start)
+    return {"cold": percentiles(cold), "warm": percentiles(warm)}
+
+def bench_minimax(name, workdir, quick, rng):
+    agent = make_agent(name, workdir / f"minimax_{name}.json")
+    n_empty = MINIMAX_EMPTIES[name]
+    positions = random_positions(agent, MINIMAX_POSITIONS[name][quick], n_empty, rng)
+
+    # minimax_bits recurses through self, so an instance attribute sees every node
+    nodes = 0
+    minimax_bits = agent.minimax_bits
+    def counting_minimax_bits(*args):
+        nonlocal nodes
+        nodes += 1
+        return minimax_bits(*args)
+    agent.minimax_bits = counting_minimax_bits
+
+    elapsed = 0.0
+    memo_sizes = []
+    for x_bits, o_bits in positions:
+        agent.minimax_memo.clear()
+        board = agent.geometry.to_board(x_bits, o_bits)
+        start = time.perf_counter()
+        agent.minimax_evaluate(board, "X")
+        elapsed += time.perf_counter() - start
+        memo_sizes.append(len(agent.minimax_memo))
+    return {
+        "positions": len(positions),
+        "empty_cells": n_empty,
+        "nodes": nodes,
+        "seconds": elapsed,
+        "nodes_per_sec": nodes / elapsed if elapsed else 0.0,
+        "memo_size": int(np.mean(memo_sizes)),
+    }
+
+def bench_train(name, workdir, quick):
+    results = {}
+    for opponent_type in OPPONENT_TYPES:
+        n_games = TRAIN_GAMES[(name, opponent_type)][quick]
+        agent = make_agent(name, workdir / f"train_{name}_{opponent_type}.json", epsilon=0.3)
+        start = time.perf_counter()
+        with quiet():
+            train(agent, n_games=n_games, opponent_type=opponent_type)
+        elapsed = time.perf_counter() - start
+        results[opponent_type] = {"games": n_games, "seconds": elapsed, "games_per_sec": n_games / elapsed}
+    return results
+
+def synthetic_table(n_cells, n_states, rng):
+    # n_states distinct random positions with random values on their legal moves
+    keys = set()
+    weights = np.left_shift(1, np.arange(n_cells, dtype=np.int64))
+    while len(keys) < n_states:
+        boards = rng.integers(0, 3, size=(2 * n_states, n_cells))
+        x_bits = (boards == 1).astype(np.int64) @ weights
+        o_bits = (boards == 2).astype(np.int64) @ weights
+        keys.update((x_bits | (o_bits << n_cells)).tolist())
+    keys = np.array(sorted(keys)[:n_states], dtype=np.uint64)
+    table = QTable(n_cells, capacity=max(1024, n_states))
+    rows = table.rows(keys, create=True)
+    legal = np.isfinite(table.values[rows])
+    table.values[rows] = np.where(legal, rng.standard_normal(legal.shape).astype(np.float32), table.values[rows])
+    return table
+
+def bench_persistence(name, workdir, quick, rng):
+    results = {}
+    for n_states in TABLE_SIZES[name]:
+        q_value_file = workdir / f"persist_{name}_{n_states}.json"
+        agent = make_agent(name, q_value_file)
+        agent.q_value = synthetic_table(agent.n_cells, n_states, rng)
+
+        repeats = 3 if quick else 10
+        save_times = []
+        load_times = []
+        read_times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            agent.save_q_values()
+            save_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            agent.load_q_values()
+            load_times.append(time.perf_counter() - start)
+            # Loading maps the file lazily; touching every value is the cost of the first full pass
+            start = time.perf_counter()
+            float(agent.q_value.values[agent.q_value.used_rows()].sum())
+            read_times.append(time.perf_counter() - start)
+
+        # Peak memory in a separate pass, tracing distorts the timings
+        tracemalloc.start()
+        agent.save_q_values()
+        save_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        agent.load_q_values()
+        load_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results[str(n_states)] = {
+            "states": n_states,
+            "file_bytes": binary_path(q_value_file).stat().st_size,
+            "save_ms": float(np.median(save_times) * 1000.0),
+            "load_ms": float(np.median(load_times) * 1000.0),
+            "first_read_ms": float(np.median(read_times) * 1000.0),
+            "save_peak_bytes": save_peak,
+            "load_peak_bytes": load_peak,
+        }
+    return results
+
+def write_legacy_json(table, geometry, path):
+    # The {board string: {action: value}} files written before the binary format
+    data = {geometry.key_to_str(key): {str(action): float(value) for action, value in table.actions(key).items()}
+            for key in table}
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+def bench_startup(name, workdir, quick, rng):
+    # A new app session on a legacy JSON Q-file. Eagerly the agent exists once the file is
+    # converted; lazily at once, and it answers the human's opening move while the table
+    # still loads (q_ready is when it has). The opening book is dropped before each run
+    # since it is read on demand by the first move.
+    q_value_file = workdir / f"startup_{name}.json"
+    agent = make_agent(name, workdir / f"startup_{name}_empty.json")
+    geometry = agent.geometry
+    n_states = STARTUP_STATES[name][quick]
+    write_legacy_json(synthetic_table(agent.n_cells, n_states, rng), geometry, q_value_file)
+
+    samples = {"eager_paint": [], "first_paint": [], "first_move": [], "q_ready": []}
+    for _ in range(STARTUP_REPEATS[quick]):
+        for lazy in (False, True):
+            binary_path(q_value_file).unlink(missing_ok=True)
+            opening_book._BOOKS.clear()
+            start = time.perf_counter()
+            agent = make_agent(name, q_value_file, epsilon=0.0, lazy=lazy)
+            paint = time.perf_counter() - start
+            if not lazy:
+                samples["eager_paint"].append(paint)
+                continue
+            samples["first_paint"].append(paint)
+            # The human (O) opens, the agent answers
+            opening = 1 << int(rng.integers(geometry.n_cells))
+            move_start = time.perf_counter()
+            agent.select_move_bits(0, opening)
+            samples["first_move"].append(time.perf_counter() - move_start)
+            with quiet():
+                agent.wait_for_q_values()
+            samples["q_ready"].append(time.perf_counter() - start)
+    results = {"states": n_states}
+    results.update((metric, percentiles(times)) for metric, times in samples.items())
+    return results
+
+def missed_targets(report):
+    # Startup metrics above STARTUP_TARGETS as (metric, value, target)
+    missed = []
+    for name, config in report["results"].items():
+        startup = config.get("startup")
+        if startup is None:
+            continue
+        for metric, target in STARTUP_TARGETS.items():
+            value = startup[metric]["p90_ms"]
+            if value > target:
+                missed.append((f"{name}.startup.{metric}.p90_ms", value, target))
+    return missed
+
+def run(config_names, quick, seed):
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
+    py_rng = random.Random(seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        for name in config_names:
+            print(f"[{name}] select_move...")
+            config = {"select_move": bench_select_move(name, workdir, quick, py_rng)}
+            print(f"[{name}] minimax_evaluate...")
+            config["minimax_evaluate"] = bench_minimax(name, workdir, quick, py_rng)
+            print(f"[{name}] train...")
+            config["train"] = bench_train(name, workdir, quick)
+            print(f"[{name}] load/save...")
+            config["persistence"] = bench_persistence(name, workdir, quick, rng)
+            print(f"[{name}] startup...")
+            config["startup"] = bench_startup(name, workdir, quick, rng)
+            results[name] = config
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "quick": quick,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        else:
+            flat[path] = value
+    return flat
+
+def direction(metric):
+    # +1 when larger is better, -1 when smaller is better, 0 for counts that are not judged
+    if metric.endswith("_per_sec"):
+        return 1
+    if metric.endswith("_ms") or (metric.endswith("_bytes") and not metric.endswith("file_bytes")):
+        return -1
+    return 0
+
+def compare(baseline, current, threshold):
+    # Returns the regressed metrics as (metric, baseline value, current value, relative change)
+    base_flat = flatten(baseline["results"])
+    current_flat = flatten(current["results"])
+    regressions = []
+    for metric in sorted(base_flat.keys() & current_flat.keys()):
+        sign = direction(metric)
+        old, new = base_flat[metric], current_flat[metric]
+        if not sign or not old:
+            continue
+        change = (new - old) / abs(old)
+        marker = ""
+        if sign * change < -threshold:
+            regressions.append((metric, old, new, change))
+            marker = "  REGRESSION"
+        elif sign * change > threshold:
+            marker = "  improved"
+        print(f"{metric:55s} {old:14.3f} {new:14.3f} {change:+8.1%}{marker}")
+    missing = sorted(base_flat.keys() - current_flat.keys())
+    if missing:
+        print(f"{len(missing)} baseline metrics not in the current results, e.g. {missing[0]}")
+    return regressions
+
+def print_summary(report):
+    for name, config in report["results"].items():
+        select = config["select_move"]
+        print(f"[{name}] select_move cold p50 {select['cold']['p50_ms']:.2f} ms, p99 {select['cold']['p99_ms']:.2f} ms; "
+              f"warm p50 {select['warm']['p50_ms']:.2f} ms, p99 {select['warm']['p99_ms']:.2f} ms")
+        minimax = config["minimax_evaluate"]
+        print(f"[{name}] minimax_evaluate {minimax['nodes_per_sec']:.0f} nodes/sec, memo size {minimax['memo_size']}")
+        for opponent_type, stats in config["train"].items():
+            print(f"[{name}] train vs {opponent_type}: {stats['games_per_sec']:.1f} games/sec")
+        for stats in config["persistence"].values():
+            print(f"[{name}] {stats['states']} states: save {stats['save_ms']:.2f} ms, load {stats['load_ms']:.2f} ms, "
+                  f"peak {stats['save_peak_bytes'] / 1e6:.1f}/{stats['load_peak_bytes'] / 1e6:.1f} MB")
+        startup = config.get("startup")
+        if startup is not None:
+            print(f"[{name}] startup from {startup['states']} JSON states: first paint p90 "
+                  f"{startup['first_paint']['p90_ms']:.1f} ms (eager {startup['eager_paint']['p90_ms']:.1f} ms), "
+                  f"first move p90 {startup['first_move']['p90_ms']:.1f} ms, Q-table ready {startup['q_ready']['p50_ms']:.0f} ms")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark agent search, selection, training and persistence")
+    parser.add_argument("--config", action="append", choices=sorted(CONFIGS),
+                        help="Configuration to run (repeatable, default: all)")
+    parser.add_argument("--quick", action="store_true", help="Fewer samples, for a fast sanity check")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the results")
+    parser.add_argument("--current", help="Compare this saved results file instead of running")
+    parser.add_argument("--compare", metavar="BASELINE", help="Baseline results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative change that counts as a regression (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.current:
+        with open(args.current, "r") as f:
+            report = json.load(f)
+    else:
+        report = run(args.config or list(CONFIGS), args.quick, args.seed)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print_summary(report)
+        print(f"Results written to {args.output}")
+
+    missed = missed_targets(report)
+    for metric, value, target in missed:
+        print(f"{metric} = {value:.1f} ms, target {target:.0f} ms  MISSED")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("quick") != report["meta"].get("quick"):
+            print("Warning: comparing a --quick run with a full run")
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            return 1
+        print("No regressions")
+    return 1 if missed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
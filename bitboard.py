@@ -0,0 +1,241 @@
+import random
+
+EMPTY = " "
+ZOBRIST_SEED = 20250101 # Fixed so hashes are the same in every process
+
+# Winning lines only depend on (board_size, win_condition), so they are built once
+# per configuration and shared by every agent using it.
+_LINES_CACHE = {}
+_GEOMETRY_CACHE = {}
+_RANK_TABLES = {}
+
+def winning_lines(board_size, win_condition):
+    key = (board_size, win_condition)
+    if key not in _LINES_CACHE:
+        lines = []
+        for row in range(board_size):
+            for col in range(board_size):
+                # Right, down, down-right and down-left starting from (row, col)
+                for d_row, d_col in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                    end_row = row + d_row * (win_condition - 1)
+                    end_col = col + d_col * (win_condition - 1)
+                    if 0 <= end_row < board_size and 0 <= end_col < board_size:
+                        lines.append(tuple((row + d_row * i) * board_size + col + d_col * i
+                                           for i in range(win_condition)))
+
+        # Group the lines by the cells they pass through so a win check after a move
+        # only has to look at the lines touching that move
+        lines_by_cell = [[] for _ in range(board_size * board_size)]
+        for line in lines:
+            for cell in line:
+                lines_by_cell[cell].append(line)
+
+        _LINES_CACHE[key] = (tuple(lines), tuple(tuple(cell_lines) for cell_lines in lines_by_cell))
+    return _LINES_CACHE[key]
+
+def iter_bits(mask):
+    # Yields the indices of the set bits, lowest first
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+# _CHUNK_BITS[chunk][byte] lists the cell indices of the bits set in byte `chunk` of a mask
+_CHUNK_BITS = tuple(
+    tuple(tuple(8 * chunk + i for i in range(8) if byte >> i & 1) for byte in range(256))
+    for chunk in range(8)
+)
+
+def bit_list(mask):
+    # Same cells as iter_bits but as a list built a byte at a time, which is much
+    # cheaper for move generation than a generator step per bit
+    if mask < 256:
+        return list(_CHUNK_BITS[0][mask])
+    cells = []
+    chunk = 0
+    while mask:
+        if chunk >= len(_CHUNK_BITS):
+            cells.extend(iter_bits(mask << (8 * chunk)))
+            break
+        cells.extend(_CHUNK_BITS[chunk][mask & 0xFF])
+        mask >>= 8
+        chunk += 1
+    return cells
+
+def ternary_rank_table(n_cells):
+    # rank_of[bits] is the base-3 number with a 1 in every digit set in `bits`, so
+    # rank_of[first] + 2 * rank_of[second] is a perfect hash of a position into
+    # 3 ** n_cells slots. Only practical for small boards.
+    if n_cells not in _RANK_TABLES:
+        powers = [3 ** cell for cell in range(n_cells)]
+        _RANK_TABLES[n_cells] = [sum(powers[cell] for cell in iter_bits(bits)) for bits in range(1 << n_cells)]
+    return _RANK_TABLES[n_cells]
+
+class BoardGeometry:
+    # A position is a pair of integers (x_bits, o_bits): bit i is set when that
+    # player owns cell i. Every line is stored as a mask so a win test is one AND.
+    def __init__(self, board_size, win_condition):
+        self.board_size = board_size
+        self.win_condition = win_condition
+        self.n_cells = board_size * board_size
+        self.full_mask = (1 << self.n_cells) - 1
+        self.lines, self.lines_by_cell = winning_lines(board_size, win_condition)
+        self.line_masks = tuple(self.line_to_mask(line) for line in self.lines)
+        self.line_masks_by_cell = tuple(
+            tuple(self.line_to_mask(line) for line in cell_lines) for cell_lines in self.lines_by_cell
+        )
+        # Zobrist keys for the pieces of the side to move and of the other side; see zobrist()
+        rng = random.Random(ZOBRIST_SEED)
+        self.zobrist_own = tuple(rng.getrandbits(64) for _ in range(self.n_cells))
+        self.zobrist_other = tuple(rng.getrandbits(64) for _ in range(self.n_cells))
+        self._symmetries = None
+
+    def line_to_mask(self, line):
+        mask = 0
+        for cell in line:
+            mask |= 1 << cell
+        return mask
+
+    def has_win(self, player_bits, last_move=None):
+        # Only the lines through the last move can have been completed by it
+        masks = self.line_masks if last_move is None else self.line_masks_by_cell[last_move]
+        for mask in masks:
+            if player_bits & mask == mask:
+                return True
+        return False
+
+    def empty_bits(self, x_bits, o_bits):
+        return self.full_mask & ~(x_bits | o_bits)
+
+    def key(self, x_bits, o_bits):
+        # Single integer identifying a position, used for the memo and the Q-table
+        return x_bits | (o_bits << self.n_cells)
+
+    def zobrist(self, own, other):
+        # 64-bit hash of a position seen from the side to move. After `own` plays `move`
+        # the child's hash is zobrist(other, own) ^ zobrist_other[move], so a search that
+        # carries both orientations updates them with one XOR each per move.
+        h = 0
+        for cell in iter_bits(own):
+            h ^= self.zobrist_own[cell]
+        for cell in iter_bits(other):
+            h ^= self.zobrist_other[cell]
+        return h
+
+    def split_key(self, key):
+        return key & self.full_mask, key >> self.n_cells
+
+    # --- Dihedral symmetries (4 rotations x optional reflection) ---
+    @property
+    def symmetries(self):
+        # symmetries[t][cell] is the cell that `cell` maps to under transform t.
+        # Built on first use since only canonicalizing agents need it.
+        if self._symmetries is None:
+            self._build_symmetries()
+        return self._symmetries
+
+    @property
+    def inverse_symmetries(self):
+        if self._symmetries is None:
+            self._build_symmetries()
+        return self._inverse_symmetries
+
+    def _build_symmetries(self):
+        n = self.board_size
+        perms = []
+        for reflect in (False, True):
+            for rotations in range(4):
+                perm = []
+                for cell in range(self.n_cells):
+                    row, col = divmod(cell, n)
+                    if reflect:
+                        col = n - 1 - col
+                    for _ in range(rotations):
+                        row, col = col, n - 1 - row
+                    perm.append(row * n + col)
+                perms.append(tuple(perm))
+        self._symmetries = tuple(perms)
+
+        inverse = []
+        for perm in perms:
+            inv = [0] * self.n_cells
+            for cell, image in enumerate(perm):
+                inv[image] = cell
+            inverse.append(tuple(inv))
+        self._inverse_symmetries = tuple(inverse)
+
+        # Transforming a mask bit by bit is slow, so each transform gets a lookup
+        # table per 8-bit chunk of the mask and a mask is mapped a byte at a time
+        n_chunks = (self.n_cells + 7) // 8
+        self._chunk_tables = tuple(
+            tuple(
+                tuple(self._permute_bits(byte << (8 * chunk), perm) for byte in range(256))
+                for chunk in range(n_chunks)
+            )
+            for perm in perms
+        )
+
+    def _permute_bits(self, bits, perm):
+        result = 0
+        for cell in iter_bits(bits & self.full_mask):
+            result |= 1 << perm[cell]
+        return result
+
+    def transform_bits(self, bits, t):
+        if self._symmetries is None:
+            self._build_symmetries()
+        tables = self._chunk_tables[t]
+        result = 0
+        chunk = 0
+        while bits:
+            result |= tables[chunk][bits & 0xFF]
+            bits >>= 8
+            chunk += 1
+        return result
+
+    def canonical(self, x_bits, o_bits):
+        # Returns (key, t): the smallest position key over the 8 symmetric images of
+        # the position, and the transform that maps the position onto it
+        if self._symmetries is None:
+            self._build_symmetries()
+        best_key = self.key(x_bits, o_bits)
+        best_t = 0
+        for t in range(1, 8):
+            key = self.key(self.transform_bits(x_bits, t), self.transform_bits(o_bits, t))
+            if key < best_key:
+                best_key = key
+                best_t = t
+        return best_key, best_t
+
+    # --- Conversion layer for list-of-strings boards used by the Streamlit apps ---
+    def to_bits(self, board):
+        x_bits = 0
+        o_bits = 0
+        for i, cell in enumerate(board):
+            if cell == "X":
+                x_bits |= 1 << i
+            elif cell == "O":
+                o_bits |= 1 << i
+        return x_bits, o_bits
+
+    def to_board(self, x_bits, o_bits):
+        board = [EMPTY] * self.n_cells
+        for i in iter_bits(x_bits):
+            board[i] = "X"
+        for i in iter_bits(o_bits):
+            board[i] = "O"
+        return board
+
+    def key_to_str(self, key):
+        return "".join(self.to_board(*self.split_key(key)))
+
+    def str_to_key(self, state_str):
+        if len(state_str) != self.n_cells:
+            raise ValueError(f"Expected a board of {self.n_cells} cells, got {len(state_str)}")
+        return self.key(*self.to_bits(state_str))
+
+def get_geometry(board_size, win_condition):
+    key = (board_size, win_condition)
+    if key not in _GEOMETRY_CACHE:
+        _GEOMETRY_CACHE[key] = BoardGeometry(board_size, win_condition)
+    return _GEOMETRY_CACHE[key]
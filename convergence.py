@@ -0,0 +1,83 @@
+import numpy as np
+
+class ConvergenceMonitor:
+    # Follows train() one reporting window at a time. At the end of each window it compares
+    # the Q-table with its copy from the start of the window:
+    #   max_dq / mean_dq - largest and mean |change| over the (state, action) values that
+    #                      changed (new states count from 0)
+    #   policy_change    - fraction of the states in both copies whose greedy move changed
+    # A window is stable when mean_dq <= value_tolerance and policy_change <= policy_tolerance
+    # (the max follows the noisiest state and rarely settles against a random opponent);
+    # after `patience` stable windows in a row training can stop (patience=None never stops).
+    # Epsilon and the learning rate are multiplied by their decay after every window, down
+    # to their minimum.
+    def __init__(self, patience=None, value_tolerance=0.02, policy_tolerance=0.005, epsilon_decay=1.0,
+                 min_epsilon=0.0, alpha_decay=1.0, min_alpha=0.0):
+        self.patience = patience
+        self.value_tolerance = value_tolerance
+        self.policy_tolerance = policy_tolerance
+        self.epsilon_decay = epsilon_decay
+        self.min_epsilon = min_epsilon
+        self.alpha_decay = alpha_decay
+        self.min_alpha = min_alpha
+        self.stable_windows = 0
+        self.windows = 0
+        self.initial_epsilon = None
+        self.initial_alpha = None
+        self.keys = None
+        self.values = None
+
+    def start(self, agent, windows_done=0):
+        # windows_done > 0 when resuming: the schedule picks up where it stopped, counting
+        # from the rates the agent was built with
+        self.initial_epsilon = agent.epsilon
+        self.initial_alpha = agent.learning_rate
+        self.windows = windows_done
+        self.stable_windows = 0
+        self.apply_schedule(agent)
+        self.keys, self.values = self.copy_table(agent.q_value)
+
+    def apply_schedule(self, agent):
+        agent.epsilon = max(self.min_epsilon, self.initial_epsilon * self.epsilon_decay ** self.windows)
+        agent.learning_rate = max(self.min_alpha, self.initial_alpha * self.alpha_decay ** self.windows)
+
+    def copy_table(self, table):
+        keys, values = table.snapshot()
+        order = np.argsort(keys, kind="stable")
+        return keys[order], values[order].astype(np.float32)
+
+    def end_window(self, agent, wins, draws, losses):
+        # Returns the window's record and starts the next window
+        keys, values = self.copy_table(agent.q_value)
+        previous = np.searchsorted(self.keys, keys)
+        previous = np.minimum(previous, max(len(self.keys) - 1, 0))
+        found = (self.keys[previous] == keys) if len(self.keys) else np.zeros(len(keys), dtype=bool)
+        legal = np.isfinite(values)
+        old_values = np.where(legal, 0.0, values)
+        if len(self.keys):
+            old_values[found] = self.values[previous[found]]
+        deltas = np.abs(np.where(legal, values, 0.0) - np.where(legal, old_values, 0.0))
+        changed = deltas > 0
+        max_dq = float(deltas.max()) if deltas.size else 0.0
+        mean_dq = float(deltas[changed].mean()) if changed.any() else 0.0
+        if found.any():
+            policy_change = float((values[found].argmax(axis=1) != old_values[found].argmax(axis=1)).mean())
+        else:
+            policy_change = 0.0
+
+        games = max(wins + draws + losses, 1)
+        stable = mean_dq <= self.value_tolerance and policy_change <= self.policy_tolerance
+        self.stable_windows = self.stable_windows + 1 if stable else 0
+        record = {
+            "win_rate": wins / games, "draw_rate": draws / games, "loss_rate": losses / games,
+            "max_dq": max_dq, "mean_dq": mean_dq, "policy_change": policy_change,
+            "epsilon": agent.epsilon, "learning_rate": agent.learning_rate, "stable_windows": self.stable_windows,
+        }
+        self.windows += 1
+        self.apply_schedule(agent)
+        self.keys, self.values = keys, values
+        return record
+
+    @property
+    def converged(self):
+        return self.patience is not None and self.stable_windows >= self.patience
@@ -0,0 +1,380 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agent import TicTacToeAgent
+
+# Headless game service on plain asyncio streams (no web framework needed):
+#   POST   /games              {"human": "O"}  new game; the AI opens when it plays X
+#   GET    /games/<id>                          state of a game
+#   POST   /games/<id>/move    {"cell": 7}      human move, answered with the AI's reply
+#   DELETE /games/<id>
+#   GET    /stats                               server counters
+#   GET    /ws                                  WebSocket taking the same operations as
+#                                               JSON messages: {"op": "new" | "state" |
+#                                               "move" | "delete", "game": id, ...}
+# Every reply is a JSON object; errors carry {"error": ...} (HTTP 4xx/503).
+
+WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC11D65"
+OP_TEXT, OP_CLOSE, OP_PING, OP_PONG = 0x1, 0x8, 0x9, 0xA
+MAX_BODY = 1 << 16
+
+class GameError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class MoveBatcher:
+    # Collects the AI moves requested by all games for up to `window` seconds (or until
+    # `max_batch` are waiting) and evaluates them in one go on a single worker thread.
+    # Identical positions in a batch are searched once. More than `max_pending` waiting
+    # requests is overload: new ones are refused instead of queued.
+    def __init__(self, agent, window=0.002, max_batch=256, max_pending=4096):
+        self.agent = agent
+        self.window = window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.pending = []
+        self.flush_handle = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.in_flight = 0
+        self.batches = 0
+        self.batched_moves = 0
+
+    async def request(self, x_bits, o_bits):
+        if len(self.pending) + self.in_flight >= self.max_pending:
+            raise GameError(503, "Server overloaded, retry later")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((x_bits, o_bits, future))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        self.in_flight += len(batch)
+        loop = asyncio.get_running_loop()
+        positions = [(x_bits, o_bits) for x_bits, o_bits, _ in batch]
+        done = loop.run_in_executor(self.executor, self.evaluate, positions)
+        done.add_done_callback(lambda result: self.resolve(batch, result))
+
+    def evaluate(self, positions):
+        moves = self.agent.select_moves_bits([x for x, _ in positions], [o for _, o in positions])
+        return [move if move >= 0 else None for move in moves.tolist()]
+
+    def resolve(self, batch, result):
+        self.in_flight -= len(batch)
+        self.batches += 1
+        self.batched_moves += len(batch)
+        error = result.exception()
+        for i, (_, _, future) in enumerate(batch):
+            if future.cancelled():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result.result()[i])
+
+class GameServer:
+    # Games are stored as one packed position key each (x_bits | o_bits << n_cells);
+    # whose turn it is and whether the game is over follow from the position
+    def __init__(self, agent, batcher, max_games=100000):
+        self.agent = agent
+        self.geometry = agent.geometry
+        self.batcher = batcher
+        self.max_games = max_games
+        self.games = {}
+        self.busy = set() # Games waiting for an AI move
+        self.ids = itertools.count(1)
+        self.moves = 0
+        self.started = time.time()
+
+    def state(self, game_id):
+        geometry = self.geometry
+        x_bits, o_bits = geometry.split_key(self.games[game_id])
+        winner = self.agent.winner_bits(x_bits, o_bits)
+        over = winner is not None or not geometry.empty_bits(x_bits, o_bits)
+        turn = None if over else ("X" if bin(x_bits).count("1") == bin(o_bits).count("1") else "O")
+        return {"game": game_id, "board": "".join(geometry.to_board(x_bits, o_bits)), "turn": turn,
+                "winner": winner, "over": over}
+
+    def lookup(self, game_id):
+        if game_id not in self.games:
+            raise GameError(404, f"No game {game_id}")
+        return game_id
+
+    async def new_game(self, human="O"):
+        if human not in ("X", "O"):
+            raise GameError(400, "human must be X or O")
+        if human == self.agent.symbol:
+            raise GameError(400, f"The AI plays {self.agent.symbol}")
+        if len(self.games) >= self.max_games:
+            raise GameError(503, "Too many games, retry later")
+        game_id = next(self.ids)
+        self.games[game_id] = 0
+        state = self.state(game_id)
+        if state["turn"] == self.agent.symbol:
+            return await self.ai_move(game_id)
+        return state
+
+    async def play(self, game_id, cell):
+        self.lookup(game_id)
+        if game_id in self.busy:
+            raise GameError(409, "The AI is still moving in this game")
+        state = self.state(game_id)
+        if state["over"]:
+            raise GameError(409, "The game is over")
+        if state["turn"] == self.agent.symbol:
+            raise GameError(409, "Not your turn")
+        # JSON true/false decode to bools, which are ints too
+        if not isinstance(cell, int) or isinstance(cell, bool) or not 0 <= cell < self.geometry.n_cells:
+            raise GameError(400, "cell must be a board index")
+        x_bits, o_bits = self.geometry.split_key(self.games[game_id])
+        if (x_bits | o_bits) >> cell & 1:
+            raise GameError(409, "Cell already taken")
+        if state["turn"] == "X":
+            x_bits |= 1 << cell
+        else:
+            o_bits |= 1 << cell
+        self.games[game_id] = self.geometry.key(x_bits, o_bits)
+        self.moves += 1
+        state = self.state(game_id)
+        if state["over"]:
+            return state
+        return await self.ai_move(game_id)
+
+    async def ai_move(self, game_id):
+        x_bits, o_bits = self.geometry.split_key(self.games[game_id])
+        self.busy.add(game_id)
+        try:
+            move = await self.batcher.request(x_bits, o_bits)
+        finally:
+            self.busy.discard(game_id)
+        if game_id not in self.games:
+            raise GameError(404, f"Game {game_id} was deleted")
+        if self.agent.is_x:
+            x_bits |= 1 << move
+        else:
+            o_bits |= 1 << move
+        self.games[game_id] = self.geometry.key(x_bits, o_bits)
+        self.moves += 1
+        state = self.state(game_id)
+        state["ai_move"] = move
+        return state
+
+    def delete(self, game_id):
+        del self.games[self.lookup(game_id)]
+        return {"game": game_id, "deleted": True}
+
+    def stats(self):
+        batcher = self.batcher
+        return {
+            "games": len(self.games),
+            "moves": self.moves,
+            "pending": len(batcher.pending) + batcher.in_flight,
+            "batches": batcher.batches,
+            "mean_batch": batcher.batched_moves / batcher.batches if batcher.batches else 0.0,
+            "uptime": time.time() - self.started,
+        }
+
+    async def dispatch(self, op, message):
+        # Shared by the HTTP routes and the WebSocket messages
+        if op == "new":
+            return await self.new_game(message.get("human", "O"))
+        if op == "stats":
+            return self.stats()
+        game_id = message.get("game")
+        if op == "state":
+            return self.state(self.lookup(game_id))
+        if op == "move":
+            return await self.play(game_id, message.get("cell"))
+        if op == "delete":
+            return self.delete(game_id)
+        raise GameError(400, f"Unknown op {op!r}")
+
+    # --- HTTP ---
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                    await self.handle_websocket(reader, writer, headers)
+                    break
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, {"error": "Request body too large"})
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status, reply = await self.route(method, path, body)
+                await self.respond(writer, status, reply)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        try:
+            message = json.loads(body) if body else {}
+            if not isinstance(message, dict):
+                raise GameError(400, "Expected a JSON object")
+            if parts == ["games"] and method == "POST":
+                return 201, await self.dispatch("new", message)
+            if parts == ["stats"] and method == "GET":
+                return 200, self.stats()
+            if len(parts) >= 2 and parts[0] == "games":
+                message["game"] = int(parts[1])
+                if len(parts) == 2 and method == "GET":
+                    return 200, await self.dispatch("state", message)
+                if len(parts) == 2 and method == "DELETE":
+                    return 200, await self.dispatch("delete", message)
+                if parts[2:] == ["move"] and method == "POST":
+                    return 200, await self.dispatch("move", message)
+            raise GameError(404, f"No route for {method} {path}")
+        except GameError as e:
+            return e.status, {"error": str(e)}
+        except ValueError as e:
+            return 400, {"error": str(e)}
+
+    async def respond(self, writer, status, reply):
+        body = json.dumps(reply).encode()
+        headers = [f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}", "Content-Type: application/json",
+                   f"Content-Length: {len(body)}"]
+        if status == 503:
+            headers.append("Retry-After: 1")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+    # --- WebSocket ---
+    async def handle_websocket(self, reader, writer, headers):
+        key = headers.get("sec-websocket-key")
+        if not key:
+            await self.respond(writer, 400, {"error": "Missing Sec-WebSocket-Key"})
+            return
+        accept = base64.b64encode(hashlib.sha1(key.encode() + WS_GUID).digest())
+        writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        await writer.drain()
+        tasks = set()
+        try:
+            while True:
+                opcode, payload = await read_frame(reader)
+                if opcode == OP_CLOSE:
+                    writer.write(encode_frame(OP_CLOSE, b""))
+                    break
+                if opcode == OP_PING:
+                    writer.write(encode_frame(OP_PONG, payload))
+                elif opcode == OP_TEXT:
+                    # Messages are answered as they complete, so one slow game does not hold up the others
+                    task = asyncio.create_task(self.ws_message(writer, payload))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def ws_message(self, writer, payload):
+        message = None
+        try:
+            message = json.loads(payload)
+            if not isinstance(message, dict):
+                raise GameError(400, "Expected a JSON object")
+            reply = await self.dispatch(message.get("op"), message)
+        except GameError as e:
+            reply = {"error": str(e), "status": e.status}
+        except ValueError as e:
+            reply = {"error": str(e), "status": 400}
+        if isinstance(message, dict) and "id" in message:
+            reply["id"] = message["id"] # Lets clients match replies to requests
+        writer.write(encode_frame(OP_TEXT, json.dumps(reply).encode()))
+        await writer.drain()
+
+async def read_frame(reader):
+    # One WebSocket frame, unmasked; fragmented messages are not supported
+    head = await reader.readexactly(2)
+    opcode = head[0] & 0x0F
+    masked = head[1] & 0x80
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+    if length > MAX_BODY:
+        raise ValueError("WebSocket frame too large")
+    mask = await reader.readexactly(4) if masked else None
+    payload = await reader.readexactly(length)
+    if mask:
+        key = int.from_bytes((mask * (length // 4 + 1))[:length], "big")
+        payload = (int.from_bytes(payload, "big") ^ key).to_bytes(length, "big")
+    return opcode, payload
+
+def encode_frame(opcode, payload, mask=None):
+    # Servers send unmasked frames; clients must pass a 4-byte mask
+    length = len(payload)
+    head = bytes((0x80 | opcode,))
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        head += bytes((mask_bit | length,))
+    elif length < 1 << 16:
+        head += bytes((mask_bit | 126,)) + struct.pack("!H", length)
+    else:
+        head += bytes((mask_bit | 127,)) + struct.pack("!Q", length)
+    if mask:
+        key = int.from_bytes((mask * (length // 4 + 1))[:length], "big")
+        payload = mask + (int.from_bytes(payload, "big") ^ key).to_bytes(length, "big")
+    return head + payload
+
+async def serve(agent, host="127.0.0.1", port=8765, window=0.002, max_batch=256, max_pending=4096, max_games=100000):
+    server = GameServer(agent, MoveBatcher(agent, window, max_batch, max_pending), max_games)
+    listener = await asyncio.start_server(server.handle_connection, host, port)
+    print(f"Serving {agent.board_size}x{agent.board_size} games on http://{host}:{port} (WebSocket at /ws)")
+    async with listener:
+        await listener.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless Tic Tac Toe game server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--board-size", type=int, default=3)
+    parser.add_argument("--win-condition", type=int, default=3)
+    parser.add_argument("--q-value-file", default="agent_q_values_X.json")
+    parser.add_argument("--search-time", type=float, default=0.05, help="Seconds of search per AI move")
+    parser.add_argument("--window", type=float, default=0.002, help="Seconds to collect a batch of AI moves")
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--max-pending", type=int, default=4096, help="Waiting AI moves before refusing more")
+    parser.add_argument("--max-games", type=int, default=100000)
+    args = parser.parse_args()
+
+    agent = TicTacToeAgent("X", board_size=args.board_size, win_condition=args.win_condition,
+                           q_value_file=args.q_value_file, epsilon=0.0, search_time=args.search_time)
+    agent.read_only = True
+    try:
+        asyncio.run(serve(agent, args.host, args.port, args.window, args.max_batch, args.max_pending, args.max_games))
+    except KeyboardInterrupt:
+        pass
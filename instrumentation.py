@@ -0,0 +1,73 @@
+import json
+import time
+
+# Counter names used by TicTacToeAgent
+MINIMAX_NODES = "minimax_nodes" # Positions expanded by minimax_evaluate
+MEMO_HITS = "memo_hits"
+MEMO_MISSES = "memo_misses"
+SEARCH_NODES = "search_nodes" # Nodes visited by the alpha-beta search in select_move
+SOLVED_LOOKUPS = "solved_lookups"
+BOOK_LOOKUPS = "book_lookups" # Moves taken from the opening book instead of a search
+FORCED_WIN = "select_forced_win" # select_move branches
+EXPLORATION = "select_exploration"
+Q_GREEDY = "select_q_greedy"
+MINIMAX_FALLBACK = "select_minimax_fallback"
+MCTS = "select_mcts"
+
+# Phase timers
+SEARCH = "search"
+SELECT = "select"
+UPDATE = "update"
+IO = "io"
+
+class AgentStats:
+    # Counters and per-phase wall-clock totals collected while attached to an agent
+    # (agent.stats). Agents skip every measurement when agent.stats is None. report()
+    # sends the numbers gathered since the previous report to `callback(record)` and/or
+    # appends them as one JSON line to `sink` (a path or a writable file), then resets them.
+    def __init__(self, sink=None, callback=None):
+        self.sink = sink
+        self.callback = callback
+        self.counters = {}
+        self.seconds = {}
+        self.q_entries = None # Q-table size at the last report, to count the entries created since
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def snapshot(self, agent=None, **extra):
+        record = {"time": time.time()}
+        record.update(extra)
+        record["counters"] = dict(self.counters)
+        record["seconds"] = dict(self.seconds)
+        if agent is not None:
+            q_entries = len(agent.q_value)
+            record["q_entries"] = q_entries
+            if self.q_entries is not None:
+                record["counters"]["q_entries_created"] = q_entries - self.q_entries
+            record["memo_size"] = len(agent.minimax_memo)
+        return record
+
+    def reset(self, agent=None):
+        self.counters = {}
+        self.seconds = {}
+        if agent is not None:
+            self.q_entries = len(agent.q_value)
+
+    def report(self, agent=None, **extra):
+        record = self.snapshot(agent, **extra)
+        if self.callback is not None:
+            self.callback(record)
+        if self.sink is not None:
+            line = json.dumps(record) + "\n"
+            if hasattr(self.sink, "write"):
+                self.sink.write(line)
+                self.sink.flush()
+            else:
+                with open(self.sink, "a") as f:
+                    f.write(line)
+        self.reset(agent)
+        return record
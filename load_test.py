@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import time
+
+import numpy as np
+
+from game_server import OP_TEXT, encode_frame, read_frame
+
+# Load generator for game_server.py: N concurrent games, each playing random human
+# moves as fast as the server answers, for a fixed duration. Reports moves/sec and the
+# latency of each move request (human move + AI reply round trip).
+#   python load_test.py --games 200 --duration 10 [--transport http]
+
+class WebSocketClient:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.waiting = {}
+        self.ids = 0
+        self.listener = asyncio.create_task(self.listen())
+
+    @classmethod
+    async def connect(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write((f"GET /ws HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+        await writer.drain()
+        while (await reader.readline()) not in (b"\r\n", b""):
+            pass
+        return cls(reader, writer)
+
+    async def listen(self):
+        while True:
+            opcode, payload = await read_frame(self.reader)
+            if opcode == OP_TEXT:
+                reply = json.loads(payload)
+                self.waiting.pop(reply.get("id")).set_result(reply)
+
+    async def call(self, message):
+        self.ids += 1
+        message["id"] = self.ids
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[self.ids] = future
+        self.writer.write(encode_frame(OP_TEXT, json.dumps(message).encode(), mask=os.urandom(4)))
+        await self.writer.drain()
+        return await future
+
+class HttpClient:
+    # One keep-alive connection per game
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.connection = None
+
+    async def request(self, method, path, message):
+        if self.connection is None:
+            self.connection = await asyncio.open_connection(self.host, self.port)
+        reader, writer = self.connection
+        body = json.dumps(message).encode()
+        writer.write((f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                      f"Content-Length: {len(body)}\r\n\r\n").encode() + body)
+        await writer.drain()
+        await reader.readline()
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return json.loads(await reader.readexactly(length))
+
+    async def call(self, message):
+        op = message["op"]
+        if op == "new":
+            return await self.request("POST", "/games", message)
+        if op == "move":
+            return await self.request("POST", f"/games/{message['game']}/move", message)
+        return await self.request("DELETE", f"/games/{message['game']}", message)
+
+async def play_games(client, deadline, latencies, counts, rng):
+    while time.perf_counter() < deadline:
+        state = await client.call({"op": "new"})
+        if "error" in state:
+            counts["refused"] += 1
+            await asyncio.sleep(0.05)
+            continue
+        game_id = state["game"]
+        while not state.get("over") and time.perf_counter() < deadline:
+            cell = rng.choice([i for i, c in enumerate(state["board"]) if c == " "])
+            start = time.perf_counter()
+            reply = await client.call({"op": "move", "game": game_id, "cell": cell})
+            if "error" in reply:
+                counts["refused"] += 1
+                await asyncio.sleep(0.05) # Backpressure: back off and retry
+                continue
+            latencies.append(time.perf_counter() - start)
+            counts["moves"] += 1 + ("ai_move" in reply)
+            state = reply
+        counts["games"] += state.get("over", False)
+        await client.call({"op": "delete", "game": game_id})
+
+async def run(host, port, n_games, duration, transport, seed):
+    rng = random.Random(seed)
+    latencies = []
+    counts = {"moves": 0, "games": 0, "refused": 0}
+    if transport == "ws":
+        # Games share a handful of connections, like browser tabs behind a proxy
+        clients = [await WebSocketClient.connect(host, port) for _ in range(min(n_games, 16))]
+    else:
+        clients = [HttpClient(host, port) for _ in range(n_games)]
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(play_games(clients[i % len(clients)], deadline, latencies, counts,
+                                      random.Random(rng.random())) for i in range(n_games)))
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000.0
+    return {
+        "transport": transport,
+        "concurrent_games": n_games,
+        "seconds": elapsed,
+        "moves_per_sec": counts["moves"] / elapsed,
+        "games_finished": counts["games"],
+        "refused": counts["refused"],
+        "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+        "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for game_server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--games", type=int, default=100, help="Concurrent games")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    parser.add_argument("--transport", choices=("ws", "http"), default="ws")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    report = asyncio.run(run(args.host, args.port, args.games, args.duration, args.transport, args.seed))
+    print(json.dumps(report, indent=2))
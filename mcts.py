@@ -0,0 +1,182 @@
+import math
+import random
+import time
+
+from bitboard import bit_list
+from search import WIN_SCORE, SearchResult
+
+# Node values are kept from the point of view of the player who moved into the node:
+# a win counts 1, a draw 0.5, a loss 0
+WIN, DRAW, LOSS = 1.0, 0.5, 0.0
+
+class Node:
+    __slots__ = ("own", "other", "move", "parent", "children", "untried", "visits", "value", "terminal",
+                 "agent_turn", "prior")
+
+    def __init__(self, own, other, move, parent, untried, terminal, agent_turn):
+        self.own = own # Pieces of the side to move in this node
+        self.other = other
+        self.move = move # Move that led here from the parent
+        self.parent = parent
+        self.children = []
+        self.untried = untried # Moves not expanded yet, the next one is popped off the end
+        self.visits = 0
+        self.value = 0.0
+        self.terminal = terminal # WIN/DRAW for the player who just moved when the game is over here
+        self.agent_turn = agent_turn
+        self.prior = None # Q-values of the agent's moves from here, fetched on first expansion
+
+class MCTSSearch:
+    # Monte Carlo tree search with UCT selection and random playouts on bitboards, a
+    # drop-in alternative to AlphaBetaSearch for TicTacToeAgent (strategy="mcts").
+    # `prior(own, other)` may return the agent's Q-values for a position (indexed by cell,
+    # None when unknown); new children of the agent's nodes then start with `prior_visits`
+    # virtual visits at that value. The tree below the position actually reached is kept
+    # between the moves of a game.
+    def __init__(self, geometry, time_limit=1.0, playout_limit=None, exploration=1.4, prior=None, prior_visits=10):
+        self.geometry = geometry
+        self.time_limit = time_limit # Seconds per search, None for no limit
+        self.playout_limit = playout_limit # Playouts per search, None for no limit
+        self.exploration = exploration
+        self.prior = prior
+        self.prior_visits = prior_visits
+        # Cells on more winning lines are expanded first (popped off the end)
+        self.expand_order = sorted(range(geometry.n_cells), key=lambda cell: len(geometry.lines_by_cell[cell]))
+        self.root = None
+        self.playouts = 0
+        self.deadline = None
+        self.stopped = False # Set by stop(); unlike the deadline, search() never clears it
+
+    def spawn(self):
+        # Same settings, separate tree (e.g. for another thread)
+        return MCTSSearch(self.geometry, self.time_limit, self.playout_limit, self.exploration, self.prior,
+                          self.prior_visits)
+
+    def stop(self):
+        # Called from another thread: the running search, and any started after it (a stop
+        # may land just before search() sets its deadline), ends as if its time had run out
+        self.stopped = True
+        self.deadline = 0.0
+
+    def clear(self):
+        self.root = None
+
+    def search(self, own, other, time_limit=None, node_limit=None):
+        time_limit = self.time_limit if time_limit is None else time_limit
+        playout_limit = self.playout_limit if node_limit is None else node_limit
+        if time_limit is None and playout_limit is None:
+            raise ValueError("MCTS needs a time or playout limit")
+        self.deadline = None if time_limit is None else time.perf_counter() + time_limit
+        geometry = self.geometry
+
+        empty = geometry.empty_bits(own, other)
+        if not empty:
+            return SearchResult(0, [], 0, 0, True)
+        # Immediate wins need no search
+        wins = [move for move in bit_list(empty) if geometry.has_win(own | (1 << move), move)]
+        if wins:
+            return SearchResult(WIN_SCORE - 1, wins, 1, 0, True)
+
+        root = self.find_root(own, other)
+        self.root = root
+        self.playouts = 0
+        while True:
+            self.iterate(root)
+            self.playouts += 1
+            if self.stopped or (playout_limit is not None and self.playouts >= playout_limit):
+                break
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                break
+
+        most_visits = max(child.visits for child in root.children)
+        best = [child for child in root.children if child.visits == most_visits]
+        # Only a move that wins on the spot is a proven result; everything else is an estimate
+        score = WIN_SCORE - 1 if any(child.terminal == WIN for child in best) else 0
+        return SearchResult(score, [child.move for child in best], 0, self.playouts, False)
+
+    def find_root(self, own, other):
+        # The position after our last move and the opponent's reply is a grandchild of the
+        # previous root; reuse its subtree when it was explored
+        root = self.root
+        if root is not None:
+            if root.own == own and root.other == other:
+                return root
+            for child in root.children:
+                for grandchild in child.children:
+                    if grandchild.own == own and grandchild.other == other:
+                        grandchild.parent = None
+                        grandchild.move = None
+                        return grandchild
+        return self.new_node(own, other, None, None, None, True)
+
+    def new_node(self, own, other, move, parent, terminal, agent_turn):
+        empty = self.geometry.empty_bits(own, other)
+        untried = [cell for cell in self.expand_order if empty >> cell & 1] if terminal is None else []
+        return Node(own, other, move, parent, untried, terminal, agent_turn)
+
+    def expand(self, node):
+        move = node.untried.pop()
+        bit = 1 << move
+        mover = node.own | bit
+        if self.geometry.has_win(mover, move):
+            terminal = WIN
+        elif not self.geometry.empty_bits(mover, node.other):
+            terminal = DRAW
+        else:
+            terminal = None
+        child = self.new_node(node.other, mover, move, node, terminal, not node.agent_turn)
+
+        if node.agent_turn and self.prior is not None:
+            if node.prior is None:
+                node.prior = self.prior(node.own, node.other) or ()
+            if node.prior:
+                # Q-values are rewards in [-1, 1]; virtual visits at the matching win rate
+                q = min(1.0, max(-1.0, node.prior[move]))
+                child.visits = self.prior_visits
+                child.value = self.prior_visits * (q + 1.0) / 2.0
+        node.children.append(child)
+        return child
+
+    def iterate(self, root):
+        node = root
+        # Selection: descend through fully expanded nodes by UCT
+        exploration = self.exploration
+        while not node.untried and node.children:
+            log_visits = math.log(node.visits)
+            best_score = -1.0
+            for child in node.children:
+                score = child.value / child.visits + exploration * math.sqrt(log_visits / child.visits)
+                if score > best_score:
+                    best_score = score
+                    best = child
+            node = best
+        if node.terminal is None and node.untried:
+            node = self.expand(node)
+
+        # Simulation, scored for the player who moved into `node`
+        if node.terminal is not None:
+            result = node.terminal
+        else:
+            result = 1.0 - self.playout(node.own, node.other)
+
+        # Backpropagation, flipping the point of view at every level
+        while node is not None:
+            node.visits += 1
+            node.value += result
+            result = 1.0 - result
+            node = node.parent
+
+    def playout(self, own, other):
+        # Uniformly random game to the end; result for the side to move (`own`)
+        geometry = self.geometry
+        cells = bit_list(geometry.empty_bits(own, other))
+        random.shuffle(cells)
+        players = [own, other]
+        turn = 0
+        for cell in cells:
+            bits = players[turn] | (1 << cell)
+            if geometry.has_win(bits, cell):
+                return WIN if turn == 0 else LOSS
+            players[turn] = bits
+            turn ^= 1
+        return DRAW
@@ -0,0 +1,62 @@
+import os
+import threading
+from pathlib import Path
+
+from agent import TicTacToeAgent
+
+# When set, agents attach to the model_server.py publisher of that name instead of
+# loading their Q-file
+MODEL_SERVER_ENV = "TICTACTOE_MODEL_SERVER"
+
+_MODELS = {}
+_MODELS_LOCK = threading.Lock()
+
+class SharedAgent(TicTacToeAgent):
+    # Play-only agent shared by every session of a process. The Q-table, minimax memo and
+    # transposition table are loaded or allocated once; each thread searches with its own
+    # engine (deadline, node count, history) spawned from the first one.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.read_only = True
+
+    @property
+    def search_engine(self):
+        engine = getattr(self.local, "engine", None)
+        if engine is None:
+            engine = self.template_engine.spawn()
+            self.local.engine = engine
+        return engine
+
+    @search_engine.setter
+    def search_engine(self, engine):
+        # The engine built by TicTacToeAgent.__init__ provides the settings and the shared table
+        self.template_engine = engine
+        self.local = threading.local()
+
+    def use_engine(self, engine):
+        # Makes the calling thread search with this engine (e.g. one with its own budget)
+        self.local.engine = engine
+
+    def update_q_values(self, final_reward):
+        raise RuntimeError("Shared agents are read-only; train a TicTacToeAgent instead")
+
+def get_shared_agent(symbol, board_size=3, win_condition=3, q_value_file="agent_q_values.json", search_time=1.0,
+                     search_nodes=None, strategy="minimax", lazy=False):
+    # One read-only agent per (board size, win length, symbol, Q-file) in the process,
+    # created on first use. The search budget of the first caller applies to everyone.
+    # With lazy=True it returns before the Q-table is read: the agent plays from the
+    # search until the table is loaded in the background (see TicTacToeAgent).
+    key = (board_size, win_condition, symbol, str(Path(q_value_file).resolve()))
+    if key in _MODELS:
+        return _MODELS[key]
+    with _MODELS_LOCK:
+        if key not in _MODELS and os.environ.get(MODEL_SERVER_ENV):
+            from model_server import attach_agent
+            _MODELS[key] = attach_agent(os.environ[MODEL_SERVER_ENV], symbol, board_size=board_size,
+                                        win_condition=win_condition, search_time=search_time,
+                                        search_nodes=search_nodes, strategy=strategy)
+        if key not in _MODELS:
+            _MODELS[key] = SharedAgent(symbol, board_size=board_size, win_condition=win_condition,
+                                       q_value_file=q_value_file, epsilon=0.0, search_time=search_time,
+                                       search_nodes=search_nodes, strategy=strategy, lazy=lazy)
+    return _MODELS[key]
@@ -0,0 +1,263 @@
+import argparse
+import struct
+import threading
+import time
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from bitboard import get_geometry
+from model_cache import SharedAgent
+from qtable import QTable, binary_path
+from solved import SolvedTable, get_solved_table, register_solved_table
+
+# One loader process publishes a model (Q-table plus, on small boards, the solved table)
+# in shared memory and app workers map it read-only. Two kinds of segments per model:
+#   <prefix>        control: the current generation (uint64)
+#   <prefix>_<gen>  data:    header, then the arrays below, each 8-byte aligned
+# A reload writes a complete new data segment before bumping the generation, so a
+# reader always maps a finished table; readers check the generation before every move.
+MAGIC = b"TTTM"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIQ") # magic, version, flags, n_cells, n_rows
+FLAG_CANONICAL = 1
+FLAG_RANKED = 2 # Rows are base-3 ranks and a `present` array follows the values
+FLAG_SOLVED = 4 # Solved values and best-move masks follow
+CONTROL_SIZE = 8
+
+def segment_prefix(server, board_size, win_condition, symbol):
+    return f"{server}_{board_size}x{board_size}_{win_condition}_{symbol}"
+
+def attach_segment(name):
+    # Readers must not let Python's resource tracker unlink the publisher's segments when
+    # they exit (Python < 3.13 registers every attached segment)
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        segment = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
+
+def layout(flags, n_cells, n_rows):
+    # Offsets of each array in a data segment and the total size
+    offsets = {}
+    offset = HEADER.size
+    def place(name, nbytes):
+        nonlocal offset
+        offset = (offset + 7) & ~7
+        offsets[name] = offset
+        offset += nbytes
+    place("keys", 8 * n_rows)
+    place("values", 4 * n_rows * n_cells)
+    if flags & FLAG_RANKED:
+        place("present", n_rows)
+    if flags & FLAG_SOLVED:
+        place("solved_values", 3 ** n_cells)
+        place("solved_masks", 2 * 3 ** n_cells)
+    return offsets, offset
+
+def map_arrays(buffer, flags, n_cells, n_rows):
+    offsets, _ = layout(flags, n_cells, n_rows)
+    arrays = {
+        "keys": np.ndarray((n_rows,), dtype="<u8", buffer=buffer, offset=offsets["keys"]),
+        "values": np.ndarray((n_rows, n_cells), dtype="<f4", buffer=buffer, offset=offsets["values"]),
+    }
+    if flags & FLAG_RANKED:
+        arrays["present"] = np.ndarray((n_rows,), dtype=bool, buffer=buffer, offset=offsets["present"])
+    if flags & FLAG_SOLVED:
+        size = 3 ** n_cells
+        arrays["solved_values"] = np.ndarray((size,), dtype=np.uint8, buffer=buffer, offset=offsets["solved_values"])
+        arrays["solved_masks"] = np.ndarray((size,), dtype="<u2", buffer=buffer, offset=offsets["solved_masks"])
+    return arrays
+
+class ModelPublisher:
+    # Owns the segments of one model; publish() loads the Q-table file and swaps it in
+    def __init__(self, server, board_size=3, win_condition=3, symbol="X"):
+        self.prefix = segment_prefix(server, board_size, win_condition, symbol)
+        self.geometry = get_geometry(board_size, win_condition)
+        try:
+            self.control = shared_memory.SharedMemory(name=self.prefix, create=True, size=CONTROL_SIZE)
+            self.control.buf[:CONTROL_SIZE] = bytes(CONTROL_SIZE)
+        except FileExistsError:
+            # Left behind by a publisher that did not shut down; generations carry on from it
+            self.control = shared_memory.SharedMemory(name=self.prefix)
+        self.generation_view = np.ndarray((1,), dtype="<u8", buffer=self.control.buf)
+        self.segment = None
+
+    def publish(self, table):
+        geometry = self.geometry
+        n_cells = geometry.n_cells
+        solved = get_solved_table(geometry.board_size, geometry.win_condition)
+        flags = (FLAG_CANONICAL if table.canonical else 0) | (FLAG_SOLVED if solved is not None else 0)
+        if table.ranked:
+            flags |= FLAG_RANKED
+            rows = slice(None)
+            n_rows = len(table.keys)
+        else:
+            # Sorted like a saved file so readers can binary-search the keys
+            rows = table.used_rows()
+            rows = rows[np.argsort(table.keys[rows], kind="stable")]
+            n_rows = len(rows)
+
+        generation = int(self.generation_view[0]) + 1
+        _, size = layout(flags, n_cells, n_rows)
+        segment = shared_memory.SharedMemory(name=f"{self.prefix}_{generation}", create=True, size=size)
+        HEADER.pack_into(segment.buf, 0, MAGIC, VERSION, flags, n_cells, n_rows)
+        arrays = map_arrays(segment.buf, flags, n_cells, n_rows)
+        arrays["keys"][:] = table.keys[rows]
+        arrays["values"][:] = table.values[rows]
+        if table.ranked:
+            arrays["present"][:] = table.present
+        if solved is not None:
+            arrays["solved_values"][:] = np.frombuffer(solved.values, dtype=np.uint8)
+            arrays["solved_masks"][:] = np.frombuffer(solved.best_masks, dtype=np.uint16)
+        del arrays
+
+        # The swap: readers pick up the new segment from their next move on. Unlinking the
+        # old one only removes its name; workers still mapping it keep a valid table.
+        self.generation_view[0] = generation
+        if self.segment is not None:
+            self.segment.close()
+            self.segment.unlink()
+        self.segment = segment
+        return generation
+
+    def publish_file(self, q_value_file):
+        table = QTable.open(binary_path(q_value_file), self.geometry.n_cells)
+        return self.publish(table)
+
+    def close(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment.unlink()
+            self.segment = None
+        del self.generation_view
+        self.control.close()
+        self.control.unlink()
+
+class ModelClient:
+    # Worker side: maps the current data segment and swaps agent.q_value when the
+    # publisher moves to a new generation
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.control = attach_segment(prefix)
+        self.generation_view = np.ndarray((1,), dtype="<u8", buffer=self.control.buf)
+        self.generation = None
+        self.lock = threading.Lock()
+
+    def attach(self):
+        # Returns (table, solved table or None) of the current generation
+        while True:
+            generation = int(self.generation_view[0])
+            try:
+                segment = attach_segment(f"{self.prefix}_{generation}")
+                break
+            except FileNotFoundError:
+                # Replaced between reading the generation and mapping it, or not published yet
+                time.sleep(0.01)
+        magic, version, flags, n_cells, n_rows = HEADER.unpack_from(segment.buf)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Shared memory segment {segment.name} is not a published model")
+        arrays = map_arrays(segment.buf, flags, n_cells, n_rows)
+        for array in arrays.values():
+            array.flags.writeable = False
+        self.unmap_when_unused(segment, arrays)
+        table = QTable.view(n_cells, arrays["keys"], arrays["values"], arrays.get("present"),
+                            canonical=bool(flags & FLAG_CANONICAL))
+        solved = None
+        if flags & FLAG_SOLVED:
+            # SolvedTable indexes plain integer buffers
+            solved = (memoryview(arrays["solved_values"]), memoryview(arrays["solved_masks"].view(np.uint16)))
+        self.generation = generation
+        return table, solved
+
+    def unmap_when_unused(self, segment, arrays):
+        # numpy does not pin the mapping, so closing a segment under a live array would
+        # crash. A replaced segment stays mapped until every array over it (and with them
+        # any view or table still in use) has been garbage collected.
+        remaining = [len(arrays)]
+        def release():
+            remaining[0] -= 1
+            if not remaining[0]:
+                segment.close()
+        for array in arrays.values():
+            weakref.finalize(array, release)
+
+    def refresh(self, agent):
+        if int(self.generation_view[0]) == self.generation:
+            return
+        with self.lock:
+            if int(self.generation_view[0]) != self.generation:
+                table = self.attach()[0]
+                # The new generation may differ in canonical keys, and memoized scores
+                # belong to the old one
+                agent.q_value = table
+                agent.canonical = table.canonical
+                agent.minimax_memo.clear()
+
+class ServedAgent(SharedAgent):
+    # SharedAgent reading its Q-table from a ModelPublisher instead of a file
+    def __init__(self, client, *args, **kwargs):
+        self.client = client
+        super().__init__(*args, **kwargs)
+
+    # Every public move API picks up a newly published table before playing
+    def refresh(self):
+        self.client.refresh(self)
+
+    def select_move(self, board, training_mode=False):
+        self.refresh()
+        return super().select_move(board, training_mode)
+
+    def select_move_bits(self, x_bits, o_bits, training_mode=False):
+        self.refresh()
+        return super().select_move_bits(x_bits, o_bits, training_mode)
+
+    def select_moves(self, boards, return_scores=False):
+        self.refresh()
+        return super().select_moves(boards, return_scores)
+
+    def select_moves_bits(self, x_bits, o_bits, return_scores=False):
+        self.refresh()
+        return super().select_moves_bits(x_bits, o_bits, return_scores)
+
+def attach_agent(server, symbol, board_size=3, win_condition=3, search_time=1.0, search_nodes=None, strategy="minimax"):
+    client = ModelClient(segment_prefix(server, board_size, win_condition, symbol))
+    table, solved = client.attach()
+    if solved is not None:
+        geometry = get_geometry(board_size, win_condition)
+        register_solved_table(board_size, win_condition, SolvedTable(geometry, *solved))
+    return ServedAgent(client, symbol, board_size=board_size, win_condition=win_condition, epsilon=0.0,
+                       search_time=search_time, search_nodes=search_nodes, strategy=strategy, q_table=table)
+
+if __name__ == "__main__":
+    # Usage: python model_server.py agent_q_values_X.json [--board-size 3 --win-condition 3]
+    # Publishes the table and republishes it whenever its .qbin file changes
+    parser = argparse.ArgumentParser(description="Serve a Q-table to app workers through shared memory")
+    parser.add_argument("q_value_file")
+    parser.add_argument("--server", default="tictactoe", help="Name the workers attach to")
+    parser.add_argument("--symbol", default="X")
+    parser.add_argument("--board-size", type=int, default=3)
+    parser.add_argument("--win-condition", type=int, default=3)
+    parser.add_argument("--poll", type=float, default=5.0, help="Seconds between checks for a new table")
+    args = parser.parse_args()
+
+    publisher = ModelPublisher(args.server, args.board_size, args.win_condition, args.symbol)
+    path = binary_path(args.q_value_file)
+    try:
+        mtime = path.stat().st_mtime_ns
+        print(f"Published {path} as {publisher.prefix}, generation {publisher.publish_file(args.q_value_file)}")
+        while True:
+            time.sleep(args.poll)
+            try:
+                new_mtime = path.stat().st_mtime_ns
+            except OSError:
+                continue
+            if new_mtime != mtime:
+                mtime = new_mtime
+                print(f"Reloaded {path}, generation {publisher.publish_file(args.q_value_file)}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        publisher.close()
@@ -0,0 +1,151 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from array import array
+from pathlib import Path
+
+from bitboard import get_geometry, iter_bits
+from search import AlphaBetaSearch
+
+BOOK_DIR = Path(__file__).resolve().parent
+MAGIC = b"TTTB"
+DEFAULT_PLIES = 3 # Positions with up to this many pieces on the board
+DEFAULT_SEARCH_TIME = 2.0 # Seconds of search per position when building
+
+_BOOKS = {}
+_BOOKS_LOCK = threading.Lock()
+
+class OpeningBook:
+    # Search results for every position of the first `plies` moves, worked out offline with
+    # a far larger budget than a move gets in play, so the opening moves cost a lookup.
+    # Like the solved table, positions are seen from the side to move (one book serves X
+    # and O), and they are stored under their canonical symmetric image with the best
+    # moves in that image's frame. entries maps key -> (outcome, best moves mask), outcome
+    # being 1 (forced win), -1 (forced loss) or 0.
+    def __init__(self, geometry, plies, entries=None):
+        self.geometry = geometry
+        self.plies = plies
+        self.entries = entries if entries is not None else {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, own, other):
+        # Returns (outcome, best moves) for the side to move, or None outside the book
+        if bin(own | other).count("1") > self.plies:
+            return None
+        key, t = self.geometry.canonical(own, other)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        outcome, mask = entry
+        from_frame = self.geometry.inverse_symmetries[t]
+        return outcome, [from_frame[cell] for cell in iter_bits(mask)]
+
+    def build(self, search_time=DEFAULT_SEARCH_TIME, node_limit=None, verbose=True):
+        # Searches each distinct position once, ply by ply from the empty board; positions
+        # that are already won or full are left out since nothing is played there
+        geometry = self.geometry
+        engine = AlphaBetaSearch(geometry, time_limit=search_time, node_limit=node_limit, tt_size=1 << 20)
+        level = {geometry.canonical(0, 0)[0]}
+        for ply in range(self.plies + 1):
+            start = time.perf_counter()
+            next_level = set()
+            for key in sorted(level):
+                own, other = geometry.split_key(key)
+                result = engine.search(own, other)
+                mask = 0
+                for move in result.best_moves:
+                    mask |= 1 << move
+                self.entries[key] = (result.outcome, mask)
+                if ply == self.plies:
+                    continue
+                for move in iter_bits(geometry.empty_bits(own, other)):
+                    child_other = own | (1 << move)
+                    if geometry.has_win(child_other, move) or not geometry.empty_bits(other, child_other):
+                        continue
+                    next_level.add(geometry.canonical(other, child_other)[0])
+            if verbose:
+                print(f"Ply {ply}: {len(level)} positions in {time.perf_counter() - start:.1f}s")
+            level = next_level
+
+    # --- On-disk format: magic, board size, win length, plies, entry count, keys, masks, outcomes ---
+    def save(self, path):
+        path = Path(path)
+        keys = array("Q", sorted(self.entries))
+        masks = array("Q", (self.entries[key][1] for key in keys))
+        outcomes = array("b", (self.entries[key][0] for key in keys))
+        if sys.byteorder != "little":
+            keys.byteswap()
+            masks.byteswap()
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(bytes((self.geometry.board_size, self.geometry.win_condition, self.plies)))
+            f.write(len(keys).to_bytes(4, "little"))
+            keys.tofile(f)
+            masks.tofile(f)
+            outcomes.tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, geometry, path):
+        data = Path(path).read_bytes()
+        header = MAGIC + bytes((geometry.board_size, geometry.win_condition))
+        if data[:len(header)] != header or len(data) < len(header) + 5:
+            raise ValueError(f"{path} is not an opening book for this board")
+        plies = data[len(header)]
+        count = int.from_bytes(data[len(header) + 1:len(header) + 5], "little")
+        offset = len(header) + 5
+        if len(data) != offset + 17 * count:
+            raise ValueError(f"{path} is truncated")
+        keys = array("Q")
+        keys.frombytes(data[offset:offset + 8 * count])
+        masks = array("Q")
+        masks.frombytes(data[offset + 8 * count:offset + 16 * count])
+        outcomes = array("b")
+        outcomes.frombytes(data[offset + 16 * count:])
+        if sys.byteorder != "little":
+            keys.byteswap()
+            masks.byteswap()
+        return cls(geometry, plies, dict(zip(keys, zip(outcomes, masks))))
+
+def opening_book_path(board_size, win_condition):
+    return BOOK_DIR / f"opening_{board_size}x{board_size}_{win_condition}inrow.bin"
+
+def get_opening_book(board_size, win_condition):
+    # Read on first use and shared by every agent in the process; None when no book was
+    # built for the board. Unlike the solved table it is never built on the fly.
+    key = (board_size, win_condition)
+    if key in _BOOKS:
+        return _BOOKS[key]
+    with _BOOKS_LOCK:
+        if key not in _BOOKS:
+            book = None
+            path = opening_book_path(board_size, win_condition)
+            if path.exists():
+                try:
+                    book = OpeningBook.load(get_geometry(board_size, win_condition), path)
+                except (OSError, ValueError) as e:
+                    print(f"Error loading opening book: {e}")
+            _BOOKS[key] = book
+    return _BOOKS[key]
+
+# Usage:
+#   python opening_book.py 5 4 --plies 3 --time 2.0    build opening_5x5_4inrow.bin
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the opening book of a board")
+    parser.add_argument("board_size", type=int)
+    parser.add_argument("win_condition", type=int)
+    parser.add_argument("--plies", type=int, default=DEFAULT_PLIES, help="Pieces on the deepest positions")
+    parser.add_argument("--time", type=float, default=DEFAULT_SEARCH_TIME, help="Seconds of search per position")
+    parser.add_argument("--nodes", type=int, help="Node budget per position instead of a time limit")
+    args = parser.parse_args()
+
+    book = OpeningBook(get_geometry(args.board_size, args.win_condition), args.plies)
+    book.build(search_time=None if args.nodes else args.time, node_limit=args.nodes)
+    path = opening_book_path(args.board_size, args.win_condition)
+    book.save(path)
+    print(f"{len(book)} positions saved to {path}")
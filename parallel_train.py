@@ -0,0 +1,179 @@
+import multiprocessing
+import random
+
+import numpy as np
+
+from agent import TicTacToeAgent, play_training_game
+from batch_train import BatchedSelfPlay
+from qtable import QTable
+
+class DeltaTracker:
+    # Records, for every (row, action) a worker updates during a sync round, the value
+    # it had at the start of the round and how many updates it received
+    def __init__(self, table):
+        self.table = table
+        self.start_values = {}
+        self.visits = {}
+
+    def record(self, rows, actions, counts=None):
+        values = self.table.values
+        n_cells = self.table.n_cells
+        if counts is None:
+            counts = [1] * len(rows)
+        for row, action, count in zip(rows, actions, counts):
+            cell = row * n_cells + action
+            if cell not in self.visits:
+                self.start_values[cell] = float(values[row, action])
+                self.visits[cell] = 0
+            self.visits[cell] += count
+
+    def collect(self):
+        # Returns (states, actions, deltas, visits) for the round and starts a new one
+        table = self.table
+        cells = np.array(sorted(self.visits), dtype=np.int64)
+        rows, actions = np.divmod(cells, table.n_cells)
+        start = np.array([self.start_values[cell] for cell in cells.tolist()], dtype=np.float32)
+        visits = np.array([self.visits[cell] for cell in cells.tolist()], dtype=np.float64)
+        deltas = table.values[rows, actions] - start
+        self.start_values = {}
+        self.visits = {}
+        return table.keys[rows].copy(), actions, deltas, visits
+
+def worker_main(conn, config, keys, values, seed, batch_size):
+    # Each worker owns a full copy of the master Q-table and plays the games it is sent
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
+    table = QTable.from_arrays(config["n_cells"], keys, values, canonical=config["canonical"])
+    agent = TicTacToeAgent(config["symbol"], board_size=config["board_size"], win_condition=config["win_condition"],
+                           epsilon=config["epsilon"], learning_rate=config["learning_rate"],
+                           discount_factor=config["discount_factor"], q_table=table)
+    tracker = DeltaTracker(table)
+    opponent_type = config["opponent_type"]
+    selfplay = None
+    if config["batched"]:
+        selfplay = BatchedSelfPlay(agent, rng)
+        # Batched updates hand over their unique (row, action) cells and visit counts
+        selfplay.on_update = lambda cells, counts: tracker.record(*np.divmod(cells, table.n_cells), counts.tolist())
+    opponents = {}
+
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        n_games, states, actions, new_values = message
+
+        # Bring the local copy in line with the merged master values
+        if len(states):
+            rows = table.rows(states, create=True)
+            table.values[rows, actions] = new_values
+
+        results = []
+        if selfplay is not None:
+            played = 0
+            while played < n_games:
+                size = min(batch_size, n_games - played)
+                results.append(selfplay.play(size))
+                played += size
+        else:
+            for _ in range(n_games):
+                result = play_training_game(agent, opponent_type, opponents)
+                rows = [table.row(state, create=True) for state, _ in agent.history]
+                tracker.record(rows, [action for _, action in agent.history])
+                agent.update_q_values(result)
+                results.append(np.array([result], dtype=np.float32))
+
+        results = np.concatenate(results) if results else np.zeros(0, dtype=np.float32)
+        counts = (int((results == 1).sum()), int((results == 0).sum()), int((results == -1).sum()))
+        conn.send((counts, tracker.collect()))
+    conn.close()
+
+def merge_deltas(table, worker_deltas):
+    # Visit-weighted average of the workers' deltas per (state, action), applied to the
+    # master table. The sums run in a fixed order so the result is reproducible.
+    states = np.concatenate([worker[0] for worker in worker_deltas])
+    actions = np.concatenate([worker[1] for worker in worker_deltas])
+    if not len(states):
+        return states, actions, np.zeros(0, dtype=np.float32)
+    deltas = np.concatenate([worker[2] for worker in worker_deltas]).astype(np.float64)
+    visits = np.concatenate([worker[3] for worker in worker_deltas])
+
+    order = np.lexsort((actions, states))
+    states = states[order]
+    actions = actions[order]
+    first = np.ones(len(states), dtype=bool)
+    first[1:] = (states[1:] != states[:-1]) | (actions[1:] != actions[:-1])
+    group = np.cumsum(first) - 1
+    weighted = np.bincount(group, weights=(visits * deltas)[order])
+    total_weight = np.bincount(group, weights=visits[order])
+
+    states = states[first]
+    actions = actions[first]
+    rows = table.rows(states, create=True)
+    table.values[rows, actions] += (weighted / total_weight).astype(np.float32)
+    return states, actions, table.values[rows, actions].copy()
+
+def train_parallel(agent, n_games=100000, n_workers=None, sync_every=10000, seed=0, opponent_type="random",
+                   batched=True, batch_size=4096):
+    # Spreads self-play over n_workers processes. Every sync_every games (in total) the
+    # workers send back their deltas, which are merged into agent.q_value and pushed back
+    # out. Results are reproducible for a fixed seed and worker count.
+    n_workers = n_workers or multiprocessing.cpu_count()
+    if batched and opponent_type != "random":
+        raise ValueError("Batched workers only play against a random opponent; pass batched=False")
+    print(f"Parallel training for {n_games} games against a {opponent_type} opponent on {n_workers} workers...")
+
+    config = {
+        "symbol": agent.symbol, "board_size": agent.board_size, "win_condition": agent.win_condition,
+        "n_cells": agent.n_cells, "canonical": agent.canonical, "epsilon": agent.epsilon,
+        "learning_rate": agent.learning_rate, "discount_factor": agent.discount_factor,
+        "opponent_type": opponent_type, "batched": batched,
+    }
+    keys, values = agent.q_value.snapshot()
+    seeds = np.random.SeedSequence(seed).generate_state(n_workers).tolist()
+
+    connections = []
+    processes = []
+    for worker_id in range(n_workers):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=worker_main, daemon=True,
+                                          args=(child_conn, config, keys, values, seeds[worker_id], batch_size))
+        process.start()
+        child_conn.close()
+        connections.append(parent_conn)
+        processes.append(process)
+
+    try:
+        played = 0
+        states = np.zeros(0, dtype=np.uint64)
+        actions = np.zeros(0, dtype=np.int64)
+        new_values = np.zeros(0, dtype=np.float32)
+        while played < n_games:
+            round_games = min(sync_every, n_games - played)
+            shares = [round_games // n_workers + (1 if i < round_games % n_workers else 0) for i in range(n_workers)]
+            for conn, share in zip(connections, shares):
+                conn.send((share, states, actions, new_values))
+
+            win_count = draw_count = loss_count = 0
+            worker_deltas = []
+            for conn in connections:
+                (wins, draws, losses), deltas = conn.recv()
+                win_count += wins
+                draw_count += draws
+                loss_count += losses
+                worker_deltas.append(deltas)
+            states, actions, new_values = merge_deltas(agent.q_value, worker_deltas)
+            played += round_games
+            print(f"Game {played}/{n_games} - Wins: {win_count}, Draws: {draw_count}, Losses: {loss_count}")
+    finally:
+        for conn in connections:
+            conn.send(None)
+            conn.close()
+        for process in processes:
+            process.join()
+
+    agent.save_q_values()
+    print("Training complete and Q-values saved.")
+
+if __name__ == "__main__":
+    agent_x = TicTacToeAgent("X", q_value_file="agent_q_values_X.json", epsilon=0.3, learning_rate=0.2, discount_factor=0.95)
+    train_parallel(agent_x, n_games=500000)
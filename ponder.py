@@ -0,0 +1,93 @@
+import threading
+import time
+
+class Ponderer:
+    # Thinks on the human's time: after the AI has moved, a background thread works out
+    # the AI's answer to each likely human reply and caches it, so the answer to the real
+    # reply is usually ready when it arrives. The agent must let each thread search with
+    # an engine of its own (model_cache.SharedAgent.use_engine); the thread searches
+    # `think_time` seconds per reply and then rests so it uses at most `cpu_share` of a core.
+    def __init__(self, agent, think_time=None, cpu_share=0.5):
+        self.agent = agent
+        self.think_time = think_time
+        self.cpu_share = cpu_share
+        self.cache = {} # (x_bits, o_bits) after the human's reply -> AI move
+        self.thread = None
+        self.stop_event = None
+        self.engine = None
+
+    def start(self, board):
+        # `board` is a position with the human to move
+        self.cancel()
+        x_bits, o_bits = self.agent.geometry.to_bits(board)
+        self.cache = {}
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(x_bits, o_bits, self.stop_event, self.cache),
+                                       daemon=True)
+        self.thread.start()
+
+    def cancel(self):
+        # Stops the thread and interrupts the search it is running, without waiting for it
+        if self.stop_event is not None:
+            self.stop_event.set()
+            engine = self.engine
+            if engine is not None:
+                engine.stop()
+        self.thread = None
+        self.stop_event = None
+        self.engine = None
+
+    def lookup(self, board):
+        # The cached AI move for this position, or None
+        return self.cache.get(self.agent.geometry.to_bits(board))
+
+    def likely_replies(self, x_bits, o_bits):
+        # Human replies, most likely first: blocks of an immediate AI win, then cells next
+        # to the pieces already on the board, then the rest, central cells first
+        agent = self.agent
+        geometry = agent.geometry
+        ai_bits = x_bits if agent.is_x else o_bits
+        pieces = x_bits | o_bits
+        size = geometry.board_size
+        replies = []
+        for cell in range(geometry.n_cells):
+            if pieces >> cell & 1:
+                continue
+            row, col = divmod(cell, size)
+            neighbours = sum(pieces >> (r * size + c) & 1
+                             for r in range(max(0, row - 1), min(size, row + 2))
+                             for c in range(max(0, col - 1), min(size, col + 2)))
+            block = geometry.has_win(ai_bits | (1 << cell), cell)
+            replies.append((not block, -neighbours, -len(geometry.lines_by_cell[cell]), cell))
+        replies.sort()
+        return [cell for *_, cell in replies]
+
+    def run(self, x_bits, o_bits, stop_event, cache):
+        agent = self.agent
+        geometry = agent.geometry
+        # A fresh engine for this thread: its own budget and the handle cancel() interrupts,
+        # so neither the time limit nor the sticky stop reaches the engine the game plays with
+        engine = agent.search_engine.spawn()
+        if self.think_time is not None:
+            engine.time_limit = self.think_time
+        agent.use_engine(engine)
+        if self.stop_event is stop_event:
+            self.engine = engine
+        human_is_x = not agent.is_x
+
+        for reply in self.likely_replies(x_bits, o_bits):
+            if stop_event.is_set():
+                return
+            bit = 1 << reply
+            x, o = (x_bits | bit, o_bits) if human_is_x else (x_bits, o_bits | bit)
+            if geometry.has_win(x if human_is_x else o, reply) or not geometry.empty_bits(x, o):
+                continue # The game ends with this reply, nothing to answer
+            start = time.perf_counter()
+            move = agent.select_move_bits(x, o)
+            if stop_event.is_set():
+                return # Possibly cut short, do not cache it
+            cache[(x, o)] = move
+            # Rest in proportion to the work done to stay within the CPU share
+            elapsed = time.perf_counter() - start
+            if stop_event.wait(elapsed * (1.0 - self.cpu_share) / self.cpu_share):
+                return
@@ -0,0 +1,131 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+from qtable import binary_path
+
+# Append-only log of Q-table changes. After a file header, each record is
+#   game counter (uint64), entry count (uint32), entries
+# and each entry is (state uint64, action uint16, new value float32). Entries hold the
+# value a cell was set to, so replaying a record twice is harmless.
+MAGIC = b"TTTL"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sHH")
+RECORD_HEADER = struct.Struct("<QI")
+ENTRY = np.dtype([("state", "<u8"), ("action", "<u2"), ("value", "<f4")])
+
+class QUpdateLog:
+    # Checkpointing for train(): per-game Q changes are buffered and appended to
+    # <q file>.qlog every flush, and every snapshot the full table is saved, the game
+    # counter recorded in <q file>.ckpt and the log started afresh. Flushes cost the
+    # size of the changes; only snapshots cost the size of the table.
+    def __init__(self, q_value_file, n_cells):
+        self.snapshot_path = binary_path(q_value_file)
+        self.log_path = self.snapshot_path.with_suffix(".qlog")
+        self.meta_path = self.snapshot_path.with_suffix(".ckpt")
+        self.n_cells = n_cells
+        self.buffer = bytearray()
+        self.file = None
+
+    def snapshot_games(self):
+        # Game counter stored with the last snapshot, 0 when there is none
+        try:
+            with open(self.meta_path, "r") as f:
+                return int(json.load(f)["games"])
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def read_records(self):
+        # Yields (games, entries) for every complete record; a record cut short by a
+        # crash ends the log
+        try:
+            with open(self.log_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+        if len(data) < FILE_HEADER.size:
+            return
+        magic, version, n_cells = FILE_HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION or n_cells != self.n_cells:
+            raise ValueError(f"{self.log_path} is not an update log for this board")
+        offset = FILE_HEADER.size
+        while offset + RECORD_HEADER.size <= len(data):
+            games, n_entries = RECORD_HEADER.unpack_from(data, offset)
+            end = offset + RECORD_HEADER.size + n_entries * ENTRY.itemsize
+            if end > len(data):
+                break
+            entries = np.frombuffer(data, dtype=ENTRY, count=n_entries, offset=offset + RECORD_HEADER.size)
+            yield games, entries, end
+            offset = end
+
+    def restore(self, agent):
+        # Replays the log on top of the snapshot the agent loaded and returns the number
+        # of games already played
+        games = self.snapshot_games()
+        valid_end = FILE_HEADER.size
+        table = agent.q_value
+        for record_games, entries, end in self.read_records():
+            valid_end = end
+            # Records older than the snapshot are already part of it
+            if record_games <= games:
+                continue
+            rows = table.rows(entries["state"], create=True)
+            table.values[rows, entries["action"].astype(np.int64)] = entries["value"]
+            games = record_games
+        if self.log_path.exists() and self.log_path.stat().st_size > valid_end:
+            # Drop a partially written record before appending after it
+            with open(self.log_path, "r+b") as f:
+                f.truncate(valid_end)
+        return games
+
+    def record(self, games, states, actions, values):
+        entries = np.empty(len(states), dtype=ENTRY)
+        entries["state"] = states
+        entries["action"] = actions
+        entries["value"] = values
+        self.buffer += RECORD_HEADER.pack(games, len(entries))
+        self.buffer += entries.tobytes()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.file is None:
+            new_file = not self.log_path.exists() or self.log_path.stat().st_size == 0
+            self.file = open(self.log_path, "ab")
+            if new_file:
+                self.file.write(FILE_HEADER.pack(MAGIC, VERSION, self.n_cells))
+        self.file.write(self.buffer)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.buffer = bytearray()
+
+    def snapshot(self, agent, games):
+        # Compaction: the full table replaces the log. The log is made complete first so
+        # a crash before the counter is written still replays to the same table. When the
+        # table cannot be saved, the counter and the log are left as they are: the last good
+        # snapshot plus the log still replay every update.
+        self.flush()
+        if not agent.save_q_values():
+            print("Snapshot failed; keeping the update log.")
+            return False
+        tmp_path = self.meta_path.with_name(self.meta_path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"games": games}, f)
+        os.replace(tmp_path, self.meta_path)
+        self.close()
+        self.log_path.unlink(missing_ok=True)
+        return True
+
+    def reset(self):
+        # A fresh run counts games from 0, so the old counter and log no longer apply
+        self.buffer = bytearray()
+        self.close()
+        self.log_path.unlink(missing_ok=True)
+        self.meta_path.unlink(missing_ok=True)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,556 @@
+import json
+import math
+import os
+import struct
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from bitboard import get_geometry, ternary_rank_table
+
+# Binary Q-table layout (little-endian):
+#   header: magic, format version, flags, n_cells, n_states
+#   scale:  float32 + 4 reserved bytes, only with FLAG_INT16
+#   keys:   n_states x uint64 position keys, sorted ascending
+#   values: n_states x n_cells float32, -inf in the cells that are not legal moves
+#           (float16 with FLAG_FLOAT16; int16 times the scale with FLAG_INT16, where
+#           INT16_ILLEGAL marks illegal cells)
+#   visits: n_states x uint32 use counts, only with FLAG_VISITS
+# Version 1 files stored NaN for any action without an entry and are converted on load;
+# version 2 files are version 3 files without the optional parts.
+MAGIC = b"TTTQ"
+VERSION = 3
+HEADER = struct.Struct("<4sHHIQ")
+SCALE = struct.Struct("<fI")
+FLAG_CANONICAL = 1
+FLAG_INT16 = 2
+FLAG_FLOAT16 = 4
+FLAG_VISITS = 8
+INT16_ILLEGAL = -32768
+
+# Boards up to this size index states by their base-3 rank (perfect hash, every row
+# preallocated); larger boards use a growable index
+MAX_RANKED_CELLS = 9
+# Position keys (x_bits | o_bits << n_cells) are stored as uint64, two bits per cell
+MAX_CELLS = 32
+ILLEGAL = -np.inf
+
+# Under a row limit, one eviction pass frees this fraction of the rows, chosen among the
+# half least recently used so rows touched by the update in progress are never taken
+EVICT_FRACTION = 8
+# Rough cost of an in-memory index entry (dict slot plus the int key object)
+INDEX_ENTRY_BYTES = 104
+
+class QTable:
+    # Dense Q-table: row r of `values` holds Q(s, .) for one state. Occupied cells are
+    # stored as -inf, so a plain max/argmax over a row only ever sees legal moves.
+    # `dtype` may be float16 to halve the values in memory.
+    def __init__(self, n_cells, canonical=False, capacity=1024, allocate=True, dtype=np.float32):
+        if n_cells > MAX_CELLS:
+            raise ValueError(f"Q-table keys hold at most {MAX_CELLS} cells, got {n_cells}")
+        self.n_cells = n_cells
+        self.canonical = canonical
+        self.dtype = np.dtype(dtype)
+        # Per-row use counts and last-use clock, None until track_usage(); see compact() and
+        # limit_rows()
+        self.visits = None
+        self.last_used = None
+        self.clock = 0
+        self.max_rows = None
+        self.eviction = None
+        self.free_rows = [] # Rows of an indexed table released by eviction, reused first
+        self.pinned = set() # Rows evict() must leave alone, see pin()
+        self.full_mask = (1 << n_cells) - 1
+        self.bit_weights = np.left_shift(1, np.arange(n_cells, dtype=np.int64))
+        self.ranked = n_cells <= MAX_RANKED_CELLS
+        self.count = 0
+        if self.ranked:
+            self.rank_of = ternary_rank_table(n_cells)
+        if not allocate:
+            return # The caller provides the arrays, see view()
+        if self.ranked:
+            size = 3 ** n_cells
+            self.values = np.full((size, n_cells), ILLEGAL, dtype=self.dtype)
+            self.keys = np.zeros(size, dtype=np.uint64)
+            self.present = np.zeros(size, dtype=bool)
+        else:
+            self.values = np.empty((capacity, n_cells), dtype=self.dtype)
+            self.keys = np.zeros(capacity, dtype=np.uint64)
+            self.index = {} # State -> row for states added in memory
+            self.n_base = 0 # Leading rows backed by the mapped file, found by binary search
+            self.n_rows = 0
+
+    @classmethod
+    def open(cls, path, n_cells=None, dtype=np.float32):
+        # n_cells=None accepts the board size stored in the file
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size + SCALE.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f"{path} is too short to be a Q-table")
+        magic, version, flags, file_cells, n_states = HEADER.unpack_from(header)
+        if magic != MAGIC or version not in (1, 2, VERSION):
+            raise ValueError(f"{path} is not a Q-table this version can read")
+        if n_cells is None:
+            n_cells = file_cells
+        if file_cells != n_cells:
+            raise ValueError(f"{path} holds a {file_cells}-cell board, expected {n_cells}")
+
+        table = cls(n_cells, canonical=bool(flags & FLAG_CANONICAL), dtype=dtype)
+        if not n_states:
+            return table
+        offset = HEADER.size
+        if flags & FLAG_INT16:
+            scale = SCALE.unpack_from(header, HEADER.size)[0]
+            offset += SCALE.size
+        keys = np.memmap(path, dtype="<u8", mode="r", offset=offset, shape=(n_states,))
+        offset += 8 * n_states
+        if flags & FLAG_INT16:
+            stored = np.fromfile(path, dtype="<i2", count=n_states * n_cells, offset=offset).reshape(n_states, n_cells)
+            values = np.where(stored == INT16_ILLEGAL, ILLEGAL, stored * np.float32(scale)).astype(table.dtype)
+            offset += 2 * n_states * n_cells
+        elif flags & FLAG_FLOAT16:
+            values = np.fromfile(path, dtype="<f2", count=n_states * n_cells, offset=offset)
+            values = values.reshape(n_states, n_cells).astype(table.dtype)
+            offset += 2 * n_states * n_cells
+        else:
+            # Copy-on-write mapping: pages are read on demand and updates stay private
+            values = np.memmap(path, dtype="<f4", mode="c", offset=offset, shape=(n_states, n_cells))
+            if table.dtype != np.float32:
+                values = np.array(values, dtype=table.dtype)
+            offset += 4 * n_states * n_cells
+        if version == 1:
+            values = table.fill_missing(keys, np.array(values))
+        visits = None
+        if flags & FLAG_VISITS:
+            visits = np.fromfile(path, dtype="<u4", count=n_states, offset=offset).astype(np.uint32)
+
+        if table.ranked:
+            rows = table.rows_for(keys)
+            table.values[rows] = values
+            table.keys[rows] = keys
+            table.present[rows] = True
+            table.count = n_states
+        else:
+            table.keys = keys
+            table.values = values
+            table.n_base = table.n_rows = table.count = n_states
+            rows = np.arange(n_states)
+        if visits is not None:
+            table.track_usage()
+            table.visits[rows] = visits
+        return table
+
+    @classmethod
+    def from_arrays(cls, n_cells, keys, values, canonical=False):
+        table = cls(n_cells, canonical=canonical, capacity=max(1024, len(keys)))
+        rows = table.rows(keys, create=True)
+        table.values[rows] = values
+        return table
+
+    @classmethod
+    def view(cls, n_cells, keys, values, present=None, canonical=False):
+        # Table over existing arrays (e.g. shared memory) without copying them. Ranked
+        # tables take the full rank-indexed keys/values/present arrays, others sorted keys
+        # as in a saved file. Meant for lookups only: rows cannot be added.
+        table = cls(n_cells, canonical=canonical, allocate=False)
+        table.keys = keys
+        table.values = values
+        if table.ranked:
+            table.present = present
+            table.count = int(np.count_nonzero(present))
+        else:
+            table.index = {}
+            table.n_base = table.n_rows = table.count = len(keys)
+        return table
+
+    def track_usage(self):
+        # Starts counting row uses (lookups, creations) and when each row was last used
+        if self.visits is None:
+            self.visits = np.zeros(len(self.keys), dtype=np.uint32)
+            self.last_used = np.zeros(len(self.keys), dtype=np.uint64)
+
+    def touch(self, row):
+        self.visits[row] += 1
+        self.last_used[row] = self.clock
+        self.clock += 1
+
+    def snapshot(self):
+        # (keys, values) copies of every stored state, the inverse of from_arrays
+        rows = self.used_rows()
+        return self.keys[rows].copy(), self.values[rows].copy()
+
+    def fill_missing(self, keys, values):
+        # Version 1 rows: NaN meant "no entry", which play treats as 0 for legal moves
+        for i, state in enumerate(keys.tolist()):
+            row = values[i]
+            legal = self.legal_mask(state)
+            row[np.isnan(row) & legal] = 0.0
+            row[~legal] = ILLEGAL
+        return values
+
+    def legal_mask(self, state):
+        empty = self.full_mask & ~((state & self.full_mask) | (state >> self.n_cells))
+        return np.bitwise_and(empty, self.bit_weights) != 0
+
+    def legal_masks(self, keys):
+        # Vectorized legal_mask for an array of position keys
+        keys = np.asarray(keys, dtype=np.uint64)
+        full = np.uint64(self.full_mask)
+        empty = full & ~((keys & full) | (keys >> np.uint64(self.n_cells)))
+        return (empty[:, None] & self.bit_weights.astype(np.uint64)) != 0
+
+    def rows(self, keys, create=False):
+        # Vectorized row() for an array of position keys; -1 where a state has no entry
+        # and create is False
+        keys = np.asarray(keys, dtype=np.uint64)
+        if not self.ranked:
+            if self.max_rows is None:
+                return np.array([self.row(state, create) for state in keys.tolist()], dtype=np.int64)
+            # Under a row limit the rows already handed out stay pinned until the call
+            # returns, so the evictions that later creations trigger cannot take them
+            rows = []
+            pinned = self.pinned
+            new_pins = []
+            for state in keys.tolist():
+                row = self.row(state, create)
+                rows.append(row)
+                if row >= 0 and row not in pinned:
+                    pinned.add(row)
+                    new_pins.append(row)
+            pinned.difference_update(new_pins)
+            return np.array(rows, dtype=np.int64)
+        rows = self.rows_for(keys)
+        missing = ~self.present[rows]
+        if missing.any():
+            if not create:
+                rows[missing] = -1
+                return rows
+            new_rows, first = np.unique(rows[missing], return_index=True)
+            new_keys = keys[missing][first]
+            self.present[new_rows] = True
+            self.keys[new_rows] = new_keys
+            self.values[new_rows] = np.where(self.legal_masks(new_keys), 0.0, ILLEGAL)
+            self.count += len(new_rows)
+        if self.visits is not None:
+            used = rows[rows >= 0]
+            np.add.at(self.visits, used, 1)
+            self.last_used[used] = self.clock + np.arange(len(used), dtype=np.uint64)
+            self.clock += len(used)
+        return rows
+
+    def pin(self, rows):
+        # Keeps rows from being evicted until unpin(), for callers that hold row indices
+        # across calls that may create rows (e.g. a batch of games updated at its end).
+        # While too many rows are pinned to free any, the table grows past its limit.
+        self.pinned.update(row for row in np.asarray(rows).ravel().tolist() if row >= 0)
+
+    def unpin(self):
+        self.pinned.clear()
+
+    def rows_for(self, keys):
+        # Vectorized base-3 ranks of an array of position keys (ranked tables only)
+        keys = np.asarray(keys, dtype=np.uint64)
+        ranks = np.zeros(len(keys), dtype=np.int64)
+        power = 1
+        for cell in range(self.n_cells):
+            ranks += power * (((keys >> np.uint64(cell)) & np.uint64(1)).astype(np.int64)
+                              + 2 * ((keys >> np.uint64(cell + self.n_cells)) & np.uint64(1)).astype(np.int64))
+            power *= 3
+        return ranks
+
+    def row(self, state, create=False):
+        # Row index of a state, or -1 when it has no entry and create is False. New rows
+        # start at 0 for every legal move.
+        if self.ranked:
+            row = self.rank_of[state & self.full_mask] + 2 * self.rank_of[state >> self.n_cells]
+            if not self.present[row]:
+                if not create:
+                    return -1
+                self.present[row] = True
+                self.keys[row] = state
+                self.values[row] = np.where(self.legal_mask(state), 0.0, ILLEGAL)
+                self.count += 1
+            if self.visits is not None:
+                self.touch(row)
+            return row
+
+        row = self.index.get(state)
+        if row is None and self.n_base:
+            i = int(np.searchsorted(self.keys[:self.n_base], state))
+            if i < self.n_base and int(self.keys[i]) == state:
+                row = i
+        if row is None:
+            if not create:
+                return -1
+            row = self.new_row()
+            self.keys[row] = state
+            self.values[row] = np.where(self.legal_mask(state), 0.0, ILLEGAL)
+            self.index[state] = row
+            self.count += 1
+            if self.visits is not None:
+                self.visits[row] = 0
+        if self.visits is not None:
+            self.touch(row)
+        return row
+
+    def new_row(self):
+        # A free row of an indexed table: released by eviction, past the last row, or
+        # freed by an eviction pass once the row limit is reached (and some row is unpinned)
+        if self.max_rows is not None and self.count >= self.max_rows and self.count > len(self.pinned):
+            self.evict()
+        if self.free_rows:
+            return self.free_rows.pop()
+        if self.n_rows == len(self.keys):
+            self._grow()
+        self.n_rows += 1
+        return self.n_rows - 1
+
+    def _grow(self, capacity=None):
+        # Doubling copy, never past the row limit unless pinned rows already fill it; the
+        # first growth also moves the mapped base into memory
+        if capacity is None:
+            capacity = max(1024, 2 * len(self.keys))
+            if self.max_rows is not None and self.n_rows < self.max_rows:
+                capacity = min(capacity, self.max_rows)
+        keys = np.zeros(capacity, dtype=np.uint64)
+        values = np.empty((capacity, self.n_cells), dtype=self.dtype)
+        keys[:self.n_rows] = self.keys[:self.n_rows]
+        values[:self.n_rows] = self.values[:self.n_rows]
+        self.keys = keys
+        self.values = values
+        if self.visits is not None:
+            visits = np.zeros(capacity, dtype=np.uint32)
+            last_used = np.zeros(capacity, dtype=np.uint64)
+            visits[:self.n_rows] = self.visits[:self.n_rows]
+            last_used[:self.n_rows] = self.last_used[:self.n_rows]
+            self.visits = visits
+            self.last_used = last_used
+
+    def used_rows(self):
+        if self.ranked:
+            return np.flatnonzero(self.present)
+        if self.free_rows:
+            return np.setdiff1d(np.arange(self.n_rows), self.free_rows)
+        return np.arange(self.n_rows)
+
+    def row_bytes(self):
+        # Approximate memory per row of an indexed table, with usage tracking
+        return self.n_cells * self.dtype.itemsize + 8 + 4 + 8 + INDEX_ENTRY_BYTES
+
+    def limit_rows(self, max_rows, eviction="lru"):
+        # Caps an indexed table at max_rows states. When a new state needs a row past the
+        # cap, an eviction pass drops the least recently used ("lru") or least often used
+        # ("lfu") states. Ranked tables are preallocated and cannot be limited.
+        if self.ranked:
+            raise ValueError("Ranked Q-tables are preallocated; a row limit only applies to larger boards")
+        if eviction not in ("lru", "lfu"):
+            raise ValueError(f"Unknown eviction policy: {eviction}")
+        if max_rows < EVICT_FRACTION:
+            raise ValueError(f"A row limit below {EVICT_FRACTION} rows leaves nothing to evict")
+        self.track_usage()
+        self.max_rows = max_rows
+        self.eviction = eviction
+        if self.count > max_rows:
+            self.evict()
+        if len(self.keys) > max_rows >= self.n_rows:
+            self._grow(max_rows) # Give back the capacity past the limit
+
+    def set_memory_budget(self, budget_bytes, eviction="lru"):
+        self.limit_rows(budget_bytes // self.row_bytes(), eviction)
+
+    def evict(self):
+        # Frees max_rows / EVICT_FRACTION rows (or the excess over the limit, if larger).
+        # Base rows are moved into the in-memory index first, since freed rows are reused
+        # and the base must stay sorted.
+        if self.n_base:
+            self.keys = np.array(self.keys)
+            self.values = np.array(self.values)
+            self.index.update(zip(self.keys[:self.n_base].tolist(), range(self.n_base)))
+            self.n_base = 0
+        rows = self.used_rows()
+        if self.pinned:
+            rows = np.setdiff1d(rows, np.fromiter(self.pinned, dtype=np.int64, count=len(self.pinned)))
+        n_evict = min(len(rows), max(self.max_rows // EVICT_FRACTION, self.count - self.max_rows))
+        # Only the older half by last use is considered
+        candidates = rows[np.argsort(self.last_used[rows], kind="stable")[:max(n_evict, len(rows) // 2)]]
+        if self.eviction == "lfu":
+            # Fewest uses first, least recent among equals
+            order = np.lexsort((self.last_used[candidates], self.visits[candidates]))
+            victims = candidates[order[:n_evict]]
+            # Halving the counts lets states that were popular long ago age out
+            self.visits >>= 1
+        else:
+            victims = candidates[:n_evict]
+        for state in self.keys[victims].tolist():
+            del self.index[state]
+        self.values[victims] = ILLEGAL
+        self.free_rows.extend(victims.tolist())
+        self.count -= len(victims)
+
+    def compact(self, min_visits=0):
+        # Drops states whose legal moves are all 0 (worth no more than a missing state) and,
+        # when usage is tracked, states used fewer than min_visits times. Indexed tables
+        # are rebuilt as a sorted base with no per-state index. Returns the number dropped.
+        if min_visits and self.visits is None:
+            raise ValueError("The table has no visit counts to compare with min_visits; "
+                             "train with TicTacToeAgent(track_usage=True) to record them")
+        rows = self.used_rows()
+        values = self.values[rows]
+        keep = ((values != 0.0) & np.isfinite(values)).any(axis=1)
+        if min_visits:
+            keep &= self.visits[rows] >= min_visits
+        dropped = rows[~keep]
+        rows = rows[keep]
+        if self.ranked:
+            self.present[dropped] = False
+            self.keys[dropped] = 0
+            self.values[dropped] = ILLEGAL
+            if self.visits is not None:
+                self.visits[dropped] = 0
+            self.count -= len(dropped)
+            return len(dropped)
+
+        rows = rows[np.argsort(self.keys[rows], kind="stable")]
+        self.keys = self.keys[rows].copy()
+        self.values = np.array(self.values[rows], dtype=self.dtype)
+        if self.visits is not None:
+            self.visits = self.visits[rows].copy()
+            self.last_used = self.last_used[rows].copy()
+        self.index = {}
+        self.free_rows = []
+        self.n_base = self.n_rows = self.count = len(rows)
+        return len(dropped)
+
+    def astype(self, dtype):
+        # Converts the stored values in place, e.g. to float16 to halve their memory
+        self.dtype = np.dtype(dtype)
+        self.values = self.values.astype(self.dtype)
+
+    def __contains__(self, state):
+        return self.row(state) >= 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self.keys[self.used_rows()].tolist())
+
+    def actions(self, state):
+        # {action: value} over the legal moves of a state, for tools and debugging
+        row = self.row(state)
+        if row < 0:
+            return {}
+        values = self.values[row]
+        return {int(action): float(values[action]) for action in np.flatnonzero(np.isfinite(values))}
+
+    def set_action(self, state, action, value):
+        row = self.row(state, create=True) # May grow (reallocate) the values first
+        self.values[row, action] = value
+
+    def save(self, path, quantize=None):
+        # Written to a temporary file and renamed into place so readers never see a
+        # half-written table; an existing mapping of the old file stays valid.
+        # quantize="float16" or "int16" (one scale for the whole table, max |Q| maps to
+        # 32767) stores the values in half the space; only float32 files are memory-mapped.
+        path = Path(path)
+        rows = self.used_rows()
+        rows = rows[np.argsort(self.keys[rows], kind="stable")]
+        values = self.values[rows]
+        flags = FLAG_CANONICAL if self.canonical else 0
+        if self.visits is not None:
+            flags |= FLAG_VISITS
+        if quantize == "int16":
+            flags |= FLAG_INT16
+            finite = np.isfinite(values)
+            peak = float(np.abs(values[finite]).max()) if finite.any() else 0.0
+            scale = peak / 32767 if peak > 0 else 1.0
+            encoded = np.where(finite, np.rint(np.where(finite, values, 0.0) / scale), INT16_ILLEGAL).astype("<i2")
+        elif quantize == "float16":
+            flags |= FLAG_FLOAT16
+            encoded = values.astype("<f2")
+        elif quantize is None:
+            encoded = values.astype("<f4")
+        else:
+            raise ValueError(f"Unknown quantization: {quantize}")
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, flags, self.n_cells, len(rows)))
+            if quantize == "int16":
+                f.write(SCALE.pack(scale, 0))
+            self.keys[rows].astype("<u8").tofile(f)
+            encoded.tofile(f)
+            if self.visits is not None:
+                self.visits[rows].astype("<u4").tofile(f)
+            f.flush()
+            os.fsync(f.fileno()) # On disk before it replaces the previous table
+        os.replace(tmp_path, path)
+
+def binary_path(q_value_file):
+    return Path(q_value_file).with_suffix(".qbin")
+
+def import_json_q_values(json_path, geometry, canonical=False):
+    # One-time conversion of a legacy agent_q_values_*.json file into a QTable
+    with open(json_path, "r") as f:
+        loaded_data = json.load(f)
+    table = QTable(geometry.n_cells, canonical=canonical)
+    imported = set()
+    for state_str, actions_dict in loaded_data.items():
+        x_bits, o_bits = geometry.to_bits(state_str)
+        if canonical:
+            state, t = geometry.canonical(x_bits, o_bits)
+            to_frame = geometry.symmetries[t]
+        else:
+            state, to_frame = geometry.key(x_bits, o_bits), None
+        for action_str, value in actions_dict.items():
+            action = int(action_str)
+            action = action if to_frame is None else to_frame[action]
+            # Tables saved without canonicalization can hold several images of one
+            # position; the first one loaded wins
+            if (state, action) not in imported:
+                imported.add((state, action))
+                table.set_action(state, action, value)
+    return table
+
+def convert_json_in_subprocess(json_path):
+    # The command-line conversion below, run in a child process: json.load holds the
+    # interpreter lock for the whole parse, which would stall every other thread here
+    subprocess.run([sys.executable, str(Path(__file__).resolve()), str(json_path)], check=True,
+                   stdout=subprocess.DEVNULL)
+    return binary_path(json_path)
+
+def compact_file(path, output=None, min_visits=0, quantize=None):
+    table = QTable.open(path)
+    before = len(table)
+    dropped = table.compact(min_visits)
+    output = output or path
+    table.save(output, quantize)
+    print(f"{path}: kept {before - dropped} of {before} states, {os.path.getsize(output)} bytes written to {output}")
+
+if __name__ == "__main__":
+    # Usage: python qtable.py agent_q_values_X.json [more.json ...]
+    #        python qtable.py compact table.qbin [--output out.qbin] [--min-visits N] [--quantize int16|float16]
+    if sys.argv[1:2] == ["compact"]:
+        import argparse
+        parser = argparse.ArgumentParser(description="Drop unused Q-table states and optionally quantize the values")
+        parser.add_argument("command")
+        parser.add_argument("path")
+        parser.add_argument("--output")
+        parser.add_argument("--min-visits", type=int, default=0,
+                            help="Also drop states used fewer times (tables trained with track_usage=True)")
+        parser.add_argument("--quantize", choices=("int16", "float16"))
+        args = parser.parse_args()
+        try:
+            compact_file(args.path, args.output, args.min_visits, args.quantize)
+        except ValueError as e:
+            print(f"{args.path}: {e}")
+            sys.exit(1)
+        sys.exit()
+    for json_file in sys.argv[1:]:
+        with open(json_file, "r") as f:
+            first_state = next(iter(json.load(f)), "")
+        board_size = math.isqrt(len(first_state)) or 3
+        table = import_json_q_values(json_file, get_geometry(board_size, board_size))
+        table.save(binary_path(json_file))
+        print(f"Converted {len(table)} states from {json_file} to {binary_path(json_file)}")
@@ -0,0 +1,116 @@
+import numpy as np
+
+class ReplayBuffer:
+    # Fixed-capacity ring buffer of transitions, one slot per array entry: Q-table keys of
+    # the state and of the next recorded state (uint64), the action in the key's frame,
+    # the reward and whether the step ended the agent's game. The oldest transitions are
+    # overwritten once it is full.
+    #
+    # With prioritized=True transitions are sampled in proportion to priority ** alpha,
+    # priorities being the last |TD error| (new ones get the current maximum), and updates
+    # are weighted by (N * P(i)) ** -beta. Sampling scans the priority array once per
+    # minibatch, which costs less than a Python sum tree at the batch sizes used here.
+    def __init__(self, capacity=100000, batch_size=1024, learn_every=16, prioritized=False, alpha=0.6, beta=0.4,
+                 min_priority=1e-3, seed=None):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.learn_every = learn_every # Games added between two minibatch updates
+        self.prioritized = prioritized
+        self.alpha = alpha
+        self.beta = beta
+        self.min_priority = min_priority
+        self.rng = np.random.default_rng(seed)
+        self.states = np.zeros(capacity, dtype=np.uint64)
+        self.next_states = np.zeros(capacity, dtype=np.uint64)
+        self.actions = np.zeros(capacity, dtype=np.uint8)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.priorities = np.zeros(capacity, dtype=np.float32)
+        self.max_priority = 1.0
+        self.position = 0 # Next slot to write
+        self.size = 0
+        self.games_since_learn = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, states, actions, rewards, next_states, dones):
+        n = len(states)
+        if n > self.capacity:
+            states, actions, rewards, next_states, dones = (array[-self.capacity:] for array in
+                                                            (states, actions, rewards, next_states, dones))
+            n = self.capacity
+        slots = (self.position + np.arange(n)) % self.capacity
+        self.states[slots] = states
+        self.actions[slots] = actions
+        self.rewards[slots] = rewards
+        self.next_states[slots] = next_states
+        self.dones[slots] = dones
+        self.priorities[slots] = self.max_priority
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def add_game(self, states, actions, final_reward):
+        # The agent's (state, action) steps of one game. Rewards follow update_q_values:
+        # every step is backed up towards the game's result plus the discounted value of
+        # the next recorded state, and the last step has none.
+        n = len(states)
+        if not n:
+            return
+        states = np.asarray(states, dtype=np.uint64)
+        next_states = np.zeros(n, dtype=np.uint64)
+        next_states[:-1] = states[1:]
+        dones = np.zeros(n, dtype=bool)
+        dones[-1] = True
+        self.add(states, actions, np.full(n, final_reward, dtype=np.float32), next_states, dones)
+        self.games_since_learn += 1
+
+    def ready(self):
+        return self.games_since_learn >= self.learn_every and self.size >= min(self.batch_size, self.capacity)
+
+    def sample(self, batch_size):
+        # Slot indices and importance weights (all 1 for uniform sampling)
+        if not self.prioritized:
+            return self.rng.integers(0, self.size, batch_size), np.ones(batch_size, dtype=np.float32)
+        probabilities = self.priorities[:self.size].astype(np.float64) ** self.alpha
+        probabilities /= probabilities.sum()
+        slots = self.rng.choice(self.size, batch_size, p=probabilities)
+        weights = (self.size * probabilities[slots]) ** -self.beta
+        return slots, (weights / weights.max()).astype(np.float32)
+
+    def learn(self, agent, batch_size=None):
+        # One vectorized Q update from a sampled minibatch. Targets are all computed from
+        # the values before the update; a (state, action) drawn several times moves
+        # towards its mean weighted TD error as far as that many sequential updates would.
+        self.games_since_learn = 0
+        if not self.size:
+            return
+        slots, weights = self.sample(batch_size or self.batch_size)
+        table = agent.q_value
+        dones = self.dones[slots]
+        # One call for the states and next states: under a row limit, creating the later
+        # rows cannot evict the earlier ones
+        all_rows = table.rows(np.concatenate([self.states[slots], self.next_states[slots][~dones]]), create=True)
+        rows, next_rows = all_rows[:len(slots)], all_rows[len(slots):]
+        values = table.values # Only after every row exists: creating rows may reallocate it
+        next_q_max = np.zeros(len(slots), dtype=np.float32)
+        next_q_max[~dones] = values[next_rows].max(axis=1)
+        actions = self.actions[slots].astype(np.int64)
+        errors = self.rewards[slots] + agent.discount_factor * next_q_max - values[rows, actions]
+
+        if self.prioritized:
+            priorities = np.abs(errors) + self.min_priority
+            self.priorities[slots] = priorities
+            self.max_priority = max(self.max_priority, float(priorities.max()))
+
+        cells = rows * table.n_cells + actions
+        unique_cells, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+        error_sums = np.zeros(len(unique_cells), dtype=np.float64)
+        np.add.at(error_sums, inverse, weights * errors)
+        step_size = 1.0 - (1.0 - agent.learning_rate) ** counts
+        flat_values = values.reshape(-1)
+        flat_values[unique_cells] += (step_size * error_sums / counts).astype(np.float32)
+
+        if agent.update_listener is not None:
+            unique_rows, unique_actions = np.divmod(unique_cells, table.n_cells)
+            agent.update_listener(table.keys[unique_rows].copy(), unique_actions, flat_values[unique_cells])
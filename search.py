@@ -0,0 +1,284 @@
+import time
+
+from threats import ThreatTracker
+
+# Scores are from the point of view of the side to move. A win found `ply` moves
+# from the root scores WIN_SCORE - ply so shorter wins (and longer losses) are preferred.
+WIN_SCORE = 1000
+WIN_THRESHOLD = WIN_SCORE // 2 # Anything beyond this is a forced win/loss
+EVAL_LIMIT = WIN_THRESHOLD - 1 # Static evaluations are clamped below the forced scores
+INF = float('inf')
+
+# Transposition table bound types
+EXACT = 0
+LOWER = 1 # Score is a lower bound (search failed high)
+UPPER = 2 # Score is an upper bound (search failed low)
+
+class SearchTimeout(Exception):
+    pass
+
+class SearchResult:
+    def __init__(self, score, best_moves, depth, nodes, complete):
+        self.score = score
+        self.best_moves = best_moves # All root moves tied for the best score
+        self.depth = depth # Deepest fully completed iteration
+        self.nodes = nodes
+        self.complete = complete # True when the result is exact (searched to the end of the game)
+
+    @property
+    def outcome(self):
+        # Collapses the score to 1 (forced win), -1 (forced loss) or 0 (anything else)
+        if self.score >= WIN_THRESHOLD:
+            return 1
+        if self.score <= -WIN_THRESHOLD:
+            return -1
+        return 0
+
+class AlphaBetaSearch:
+    # Iterative-deepening negamax with alpha-beta pruning. Positions are (own, other)
+    # bitboards from the point of view of the side to move, so one table entry serves
+    # a position regardless of which symbol is moving. Moves are made by OR-ing a bit into
+    # an int and undone by returning, and the table is keyed by a Zobrist hash carried down
+    # the recursion, so a node allocates nothing beyond its list of moves.
+    # With threats=True a ThreatTracker follows the search: it scores positions at the depth
+    # limit, ends nodes where the side to move wins at once or faces two winning cells,
+    # restricts nodes facing one winning cell to the block, and orders moves by how much
+    # they gain on it.
+    def __init__(self, geometry, time_limit=1.0, node_limit=None, max_depth=None, tt_size=1 << 18, tt=None,
+                 threats=True):
+        self.geometry = geometry
+        self.time_limit = time_limit # Seconds per search, None for no limit
+        self.node_limit = node_limit # Nodes per search, None for no limit
+        self.max_depth = max_depth if max_depth is not None else geometry.n_cells
+        # Slots of (hash, depth, bound, score, best_move). Searches running in other threads
+        # may share one table: slots are replaced whole and every probe checks the key.
+        self.tt = tt if tt is not None else [None] * tt_size
+        self.tt_size = len(self.tt)
+        self.history = [0] * geometry.n_cells # History heuristic for quiet move ordering
+        self.order_keys = [0] * geometry.n_cells # Sort keys filled in by order_moves
+
+        # Static ordering: cells on more winning lines first (centre before edges)
+        self.static_order = sorted(range(geometry.n_cells), key=lambda cell: -len(geometry.lines_by_cell[cell]))
+        self.threats = ThreatTracker(geometry) if threats else None
+
+        self.nodes = 0
+        self.deadline = None
+        self.node_budget = None
+        self.stopped = False # Set by stop(); unlike the deadline, search() never clears it
+
+    def spawn(self):
+        # Same settings and transposition table, separate per-search state (e.g. for another thread)
+        return AlphaBetaSearch(self.geometry, time_limit=self.time_limit, node_limit=self.node_limit,
+                               max_depth=self.max_depth, tt=self.tt, threats=self.threats is not None)
+
+    def stop(self):
+        # Called from another thread: the running search, and any started after it (a stop
+        # may land just before search() sets its deadline), ends as if its time had run out
+        self.stopped = True
+        self.deadline = 0.0
+
+    def clear(self):
+        self.tt[:] = [None] * self.tt_size
+        self.history = [0] * self.geometry.n_cells
+
+    def search(self, own, other, time_limit=None, node_limit=None):
+        time_limit = self.time_limit if time_limit is None else time_limit
+        node_limit = self.node_limit if node_limit is None else node_limit
+        self.deadline = None if time_limit is None else time.perf_counter() + time_limit
+        self.node_budget = node_limit
+        self.nodes = 0
+        # Older history scores are decayed so ordering follows the current position
+        self.history = [h >> 2 for h in self.history]
+
+        empty = self.geometry.empty_bits(own, other)
+        if not empty:
+            return SearchResult(0, [], 0, 0, True)
+        n_empty = bin(empty).count("1")
+        if self.threats is not None:
+            self.threats.reset(own, other)
+        key = self.geometry.zobrist(own, other)
+        swapped_key = self.geometry.zobrist(other, own)
+
+        result = None
+        root_order = None
+        for depth in range(1, min(self.max_depth, n_empty) + 1):
+            try:
+                score, best_moves = self.search_root(own, other, key, swapped_key, depth, root_order)
+            except SearchTimeout:
+                break
+            # A forced win/loss only comes from real terminal positions, so it is
+            # exact even when found before the full depth
+            complete = depth >= n_empty or abs(score) >= WIN_THRESHOLD
+            result = SearchResult(score, best_moves, depth, self.nodes, complete)
+            if complete:
+                break
+            root_order = best_moves
+
+        if result is None:
+            # Not even the first iteration finished; fall back to the static ordering
+            moves = [cell for cell in self.static_order if empty >> cell & 1]
+            return SearchResult(0, moves[:1], 0, self.nodes, False)
+        result.nodes = self.nodes
+        return result
+
+    def search_root(self, own, other, key, swapped_key, depth, root_order):
+        geometry = self.geometry
+        empty = geometry.empty_bits(own, other)
+        moves = self.order_moves(empty, root_order)
+        threats = self.threats
+
+        best_score = -INF
+        best_moves = []
+        for move in moves:
+            # A window just below the best score keeps ties exact so every equally
+            # good root move is reported
+            alpha = best_score - 1 if best_score > -INF else -INF
+            # A timeout leaves the tracker mid-line; search() resets it before the next use
+            if threats is not None:
+                threats.make(move)
+            score = -self.negamax(other, own | (1 << move), depth - 1, -INF, -alpha, 1, move,
+                                  swapped_key ^ geometry.zobrist_other[move], key ^ geometry.zobrist_own[move])
+            if threats is not None:
+                threats.unmake(move)
+            if score > best_score:
+                best_score = score
+                best_moves = [move]
+            elif score == best_score:
+                best_moves.append(move)
+        return best_score, best_moves
+
+    def order_moves(self, empty, preferred=None):
+        moves = [cell for cell in self.static_order if empty >> cell & 1]
+        if self.threats is not None:
+            # Biggest threat gain first, history among equal gains
+            keys = self.order_keys
+            self.threats.move_gains(moves, keys, self.history)
+        else:
+            keys = self.history
+        moves.sort(key=keys.__getitem__, reverse=True) # Stable: equal keys keep the static order
+        if preferred:
+            front = [move for move in preferred if empty >> move & 1]
+            moves = front + [move for move in moves if move not in front]
+        return moves
+
+    def evaluate(self, own, other):
+        # Static evaluation of a non-terminal position at the depth limit, kept inside the
+        # range of non-forced scores
+        if self.threats is None:
+            return 0
+        return max(-EVAL_LIMIT, min(EVAL_LIMIT, self.threats.evaluate()))
+
+    def negamax(self, own, other, depth, alpha, beta, ply, last_move, key, swapped_key):
+        # key is geometry.zobrist(own, other), swapped_key geometry.zobrist(other, own)
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.check_budget()
+
+        geometry = self.geometry
+        # Only the player who just moved can have completed a line
+        if geometry.has_win(other, last_move):
+            return -(WIN_SCORE - ply)
+        empty = geometry.empty_bits(own, other)
+        if not empty:
+            return 0
+        threats = self.threats
+        forced = None
+        if threats is not None:
+            side = threats.turn
+            if threats.wins[side]:
+                return WIN_SCORE - (ply + 1)
+            blocks = threats.win_cells(side ^ 1, empty)
+            if blocks:
+                if blocks & (blocks - 1):
+                    return -(WIN_SCORE - (ply + 2)) # Two winning cells cannot both be blocked
+                forced = blocks.bit_length() - 1 # Any other move loses at once
+        if depth <= 0:
+            return self.evaluate(own, other)
+
+        slot = key % self.tt_size
+        entry = self.tt[slot]
+        tt_move = None
+        if entry is not None and entry[0] == key:
+            tt_move = entry[4]
+            if entry[1] >= depth:
+                score = self.score_from_tt(entry[3], ply)
+                bound = entry[2]
+                if bound == EXACT:
+                    return score
+                if bound == LOWER and score >= beta:
+                    return score
+                if bound == UPPER and score <= alpha:
+                    return score
+
+        original_alpha = alpha
+        best_score = -INF
+        best_move = None
+        # The table's move is tried before the others are ordered, which is skipped
+        # entirely when it cuts off
+        if forced is not None:
+            moves = (forced,)
+            staged = False
+        elif tt_move is not None and empty >> tt_move & 1:
+            moves = (tt_move,)
+            staged = True
+        else:
+            moves = self.order_moves(empty)
+            staged = False
+        zobrist_own = geometry.zobrist_own
+        zobrist_other = geometry.zobrist_other
+        while True:
+            for move in moves:
+                if threats is not None:
+                    threats.make(move)
+                score = -self.negamax(other, own | (1 << move), depth - 1, -beta, -alpha, ply + 1, move,
+                                      swapped_key ^ zobrist_other[move], key ^ zobrist_own[move])
+                if threats is not None:
+                    threats.unmake(move)
+                if score > best_score:
+                    best_score = score
+                    best_move = move
+                    if score > alpha:
+                        alpha = score
+                        if alpha >= beta:
+                            self.history[move] += depth * depth
+                            break
+            else:
+                if staged:
+                    moves = self.order_moves(empty & ~(1 << tt_move))
+                    staged = False
+                    continue
+            break
+
+        if best_score <= original_alpha:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        # Always-replace scheme: the newest search is the most relevant one
+        self.tt[slot] = (key, depth, bound, self.score_to_tt(best_score, ply), best_move)
+        return best_score
+
+    def check_budget(self):
+        if self.stopped:
+            raise SearchTimeout()
+        if self.node_budget is not None and self.nodes >= self.node_budget:
+            raise SearchTimeout()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+
+    # Win scores depend on the distance from the root, so they are stored relative
+    # to the node and converted back when read at a different ply
+    def score_to_tt(self, score, ply):
+        if score >= WIN_THRESHOLD:
+            return score + ply
+        if score <= -WIN_THRESHOLD:
+            return score - ply
+        return score
+
+    def score_from_tt(self, score, ply):
+        if score >= WIN_THRESHOLD:
+            return score - ply
+        if score <= -WIN_THRESHOLD:
+            return score + ply
+        return score
@@ -0,0 +1,155 @@
+import os
+import sys
+import threading
+from array import array
+from pathlib import Path
+
+from bitboard import get_geometry, iter_bits, ternary_rank_table
+
+# Full solutions are only practical while every position fits in a 3**n_cells table
+MAX_SOLVED_CELLS = 9
+SOLVED_DIR = Path(__file__).resolve().parent
+MAGIC = b"TTTS"
+
+# Values are stored offset by 2 so that 0 marks an unreachable position
+UNREACHED = 0
+
+_SOLVED_TABLES = {}
+_SOLVED_LOCK = threading.Lock()
+
+class SolvedTable:
+    # Game-theoretic value and best moves of every reachable position, indexed by the
+    # base-3 rank of the position seen from the side to move (own = 1, other = 2).
+    # Because it is relative to the mover, one table serves both X and O.
+    def __init__(self, geometry, values=None, best_masks=None):
+        if geometry.n_cells > MAX_SOLVED_CELLS:
+            raise ValueError(f"Cannot solve a {geometry.board_size}x{geometry.board_size} board")
+        self.geometry = geometry
+        self.size = 3 ** geometry.n_cells
+        self.rank_of = ternary_rank_table(geometry.n_cells)
+
+        if values is None:
+            self.values = bytearray(self.size)
+            self.best_masks = array("H", bytes(2 * self.size))
+            self.solve()
+        else:
+            self.values = values
+            self.best_masks = best_masks
+
+    def rank(self, own, other):
+        return self.rank_of[own] + 2 * self.rank_of[other]
+
+    def lookup(self, own, other):
+        # Returns (value, best_moves_mask) for the side to move, value in {1, 0, -1},
+        # or None for positions that cannot arise in a game
+        rank = self.rank_of[own] + 2 * self.rank_of[other]
+        stored = self.values[rank]
+        if stored == UNREACHED:
+            return None
+        return stored - 2, self.best_masks[rank]
+
+    def solve(self):
+        geometry = self.geometry
+        values = self.values
+        best_masks = self.best_masks
+        rank_of = self.rank_of
+
+        def solve_position(own, other, last_move):
+            rank = rank_of[own] + 2 * rank_of[other]
+            if values[rank] != UNREACHED:
+                return values[rank] - 2
+
+            best_mask = 0
+            if last_move is not None and geometry.has_win(other, last_move):
+                best = -1
+            else:
+                empty = geometry.empty_bits(own, other)
+                if not empty:
+                    best = 0
+                else:
+                    # Every move reaching the best outcome is kept, like minimax ties
+                    best = -2
+                    for move in iter_bits(empty):
+                        score = -solve_position(other, own | (1 << move), move)
+                        if score > best:
+                            best = score
+                            best_mask = 1 << move
+                        elif score == best:
+                            best_mask |= 1 << move
+
+            values[rank] = best + 2
+            best_masks[rank] = best_mask
+            return best
+
+        # Starting from the empty board reaches the positions of both the first and
+        # the second player to move
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, 100 + 4 * geometry.n_cells))
+        try:
+            solve_position(0, 0, None)
+        finally:
+            sys.setrecursionlimit(limit)
+
+    # --- Compact on-disk format: magic, board size, win length, values, best-move masks ---
+    def save(self, path):
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(bytes((self.geometry.board_size, self.geometry.win_condition)))
+            f.write(self.values)
+            masks = array("H", self.best_masks)
+            if sys.byteorder != "little":
+                masks.byteswap()
+            masks.tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, geometry, path):
+        data = Path(path).read_bytes()
+        size = 3 ** geometry.n_cells
+        header = MAGIC + bytes((geometry.board_size, geometry.win_condition))
+        if data[:len(header)] != header or len(data) != len(header) + 3 * size:
+            raise ValueError(f"{path} is not a solved table for this board")
+        values = bytearray(data[len(header):len(header) + size])
+        best_masks = array("H")
+        best_masks.frombytes(data[len(header) + size:])
+        if sys.byteorder != "little":
+            best_masks.byteswap()
+        return cls(geometry, values, best_masks)
+
+def solved_table_path(board_size, win_condition):
+    return SOLVED_DIR / f"solved_{board_size}x{board_size}_{win_condition}inrow.bin"
+
+def get_solved_table(board_size, win_condition):
+    # Loaded (or built and cached to disk) once per process and shared by every agent;
+    # None when the board is too large to solve
+    key = (board_size, win_condition)
+    if key in _SOLVED_TABLES:
+        return _SOLVED_TABLES[key]
+    with _SOLVED_LOCK:
+        if key not in _SOLVED_TABLES:
+            geometry = get_geometry(board_size, win_condition)
+            table = None
+            if geometry.n_cells <= MAX_SOLVED_CELLS:
+                path = solved_table_path(board_size, win_condition)
+                try:
+                    table = SolvedTable.load(geometry, path)
+                except (OSError, ValueError):
+                    table = SolvedTable(geometry)
+                    try:
+                        table.save(path)
+                    except OSError as e:
+                        print(f"Could not cache solved table: {e}")
+            _SOLVED_TABLES[key] = table
+    return _SOLVED_TABLES[key]
+
+def register_solved_table(board_size, win_condition, table):
+    # Makes get_solved_table return an already built table, e.g. one mapped from shared memory
+    with _SOLVED_LOCK:
+        _SOLVED_TABLES[(board_size, win_condition)] = table
+
+if __name__ == "__main__":
+    solved = get_solved_table(3, 3)
+    reachable = sum(1 for value in solved.values if value != UNREACHED)
+    print(f"Solved {reachable} positions, saved to {solved_table_path(3, 3)}")
@@ -0,0 +1,35 @@
+import random
+
+import pytest
+
+from agent import TicTacToeAgent, train
+
+def test_boards_beyond_64_bit_keys_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        TicTacToeAgent("X", board_size=6, win_condition=4, q_value_file=tmp_path / "q.json")
+
+def test_won_board_has_no_move(tmp_path):
+    # X has the top row, four cells are still empty
+    agent = TicTacToeAgent("O", q_value_file=tmp_path / "q.json")
+    board = ["X", "X", "X",
+             "O", "O", " ",
+             " ", " ", " "]
+    assert agent.select_move(board) is None
+    assert agent.select_moves([board]).tolist() == [-1]
+
+def test_select_moves_matches_select_move(tmp_path):
+    random.seed(0)
+    agent = TicTacToeAgent("X", q_value_file=tmp_path / "q.json", epsilon=0.3)
+    train(agent, n_games=300, checkpoint_every=100, snapshot_every=300)
+    rng = random.Random(1)
+    boards = []
+    while len(boards) < 200:
+        board = [" "] * 9
+        for ply in range(rng.randrange(0, 8, 2)):
+            board[rng.choice([cell for cell in range(9) if board[cell] == " "])] = "XO"[ply % 2]
+        if not agent.game_over(board):
+            boards.append(board)
+    random.seed(2)
+    expected = [agent.select_move(board) for board in boards]
+    random.seed(2)
+    assert agent.select_moves(boards).tolist() == expected
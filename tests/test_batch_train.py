@@ -0,0 +1,29 @@
+import numpy as np
+
+from agent import TicTacToeAgent
+from batch_train import train_batched
+from parallel_train import train_parallel
+
+def train_twice(tmp_path, train_fn, **kwargs):
+    # Q-tables of two runs from the same seed
+    tables = []
+    for run in range(2):
+        agent = TicTacToeAgent("X", q_value_file=tmp_path / f"q{run}.json", epsilon=0.3)
+        train_fn(agent, **kwargs)
+        tables.append(agent.q_value.snapshot())
+    return tables
+
+def assert_same_tables(first, second):
+    keys, values = first
+    other_keys, other_values = second
+    assert len(keys) > 0
+    order, other_order = np.argsort(keys), np.argsort(other_keys)
+    assert np.array_equal(keys[order], other_keys[other_order])
+    assert np.array_equal(values[order], other_values[other_order])
+
+def test_batched_training_is_reproducible(tmp_path):
+    assert_same_tables(*train_twice(tmp_path, train_batched, n_games=3000, batch_size=512, seed=7))
+
+def test_parallel_training_is_reproducible(tmp_path):
+    assert_same_tables(*train_twice(tmp_path, train_parallel, n_games=2000, n_workers=2, sync_every=500,
+                                    seed=7, batch_size=256))
@@ -0,0 +1,50 @@
+import random
+
+from bitboard import get_geometry, winning_lines
+
+def random_position(geometry, rng, n_pieces):
+    cells = rng.sample(range(geometry.n_cells), n_pieces)
+    x_bits = o_bits = 0
+    for i, cell in enumerate(cells):
+        if i % 2 == 0:
+            x_bits |= 1 << cell
+        else:
+            o_bits |= 1 << cell
+    return x_bits, o_bits
+
+def test_has_win_matches_winning_lines():
+    rng = random.Random(0)
+    for board_size, win_condition in ((3, 3), (4, 3), (5, 4)):
+        geometry = get_geometry(board_size, win_condition)
+        lines = winning_lines(board_size, win_condition)[0]
+        for _ in range(500):
+            bits = random_position(geometry, rng, rng.randrange(geometry.n_cells + 1))[0]
+            expected = any(all(bits >> cell & 1 for cell in line) for line in lines)
+            assert geometry.has_win(bits) == expected
+            # Lines through the last move are enough when it completed the win
+            for cell in range(geometry.n_cells):
+                if bits >> cell & 1 and not geometry.has_win(bits & ~(1 << cell)):
+                    assert geometry.has_win(bits, cell) == expected
+
+def test_has_win_lines():
+    geometry = get_geometry(5, 4)
+    assert geometry.has_win(0b1111 << 5) # Row
+    assert geometry.has_win(sum(1 << (5 * row + 2) for row in range(1, 5))) # Column
+    assert geometry.has_win(sum(1 << (6 * i) for i in range(4))) # Diagonal
+    assert geometry.has_win(sum(1 << (4 * i + 8) for i in range(4))) # Anti-diagonal
+    assert not geometry.has_win(0b111 << 5)
+    assert not geometry.has_win((0b11 << 3) | (0b11 << 5)) # Wraps around the row end
+
+def test_canonical_key_is_shared_by_symmetric_images():
+    rng = random.Random(0)
+    for board_size, win_condition in ((3, 3), (5, 4)):
+        geometry = get_geometry(board_size, win_condition)
+        for _ in range(200):
+            x_bits, o_bits = random_position(geometry, rng, rng.randrange(geometry.n_cells + 1))
+            key, t = geometry.canonical(x_bits, o_bits)
+            # t maps the position onto the canonical image
+            assert key == geometry.key(geometry.transform_bits(x_bits, t), geometry.transform_bits(o_bits, t))
+            for u in range(8):
+                image = geometry.transform_bits(x_bits, u), geometry.transform_bits(o_bits, u)
+                assert geometry.canonical(*image)[0] == key
+                assert geometry.key(*image) >= key
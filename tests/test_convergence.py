@@ -0,0 +1,23 @@
+import random
+
+from agent import TicTacToeAgent, train
+from convergence import ConvergenceMonitor
+
+def test_training_stops_once_stable(tmp_path):
+    random.seed(0)
+    agent = TicTacToeAgent("X", q_value_file=tmp_path / "q.json", epsilon=0.3)
+    # Loose tolerances: any window is stable, so training stops after `patience` windows
+    monitor = ConvergenceMonitor(patience=2, value_tolerance=1.0, policy_tolerance=1.0)
+    train(agent, n_games=1000, checkpoint_every=100, snapshot_every=1000, report_every=100, convergence=monitor)
+    assert monitor.converged
+    assert monitor.windows == 2
+
+def test_training_runs_on_without_patience(tmp_path):
+    random.seed(0)
+    agent = TicTacToeAgent("X", q_value_file=tmp_path / "q.json", epsilon=0.3)
+    monitor = ConvergenceMonitor(value_tolerance=1.0, policy_tolerance=1.0, epsilon_decay=0.5, min_epsilon=0.05)
+    train(agent, n_games=500, checkpoint_every=100, snapshot_every=500, report_every=100, convergence=monitor)
+    assert not monitor.converged
+    assert monitor.windows == 5
+    # 0.3 halved per window, floored at the minimum
+    assert agent.epsilon == 0.05
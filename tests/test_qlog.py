@@ -0,0 +1,28 @@
+import random
+
+import numpy as np
+
+from agent import TicTacToeAgent, train
+from qlog import QUpdateLog
+from qtable import QTable, binary_path
+
+def test_failed_snapshot_keeps_log(tmp_path, monkeypatch):
+    random.seed(0)
+    q_value_file = tmp_path / "q.json"
+    agent = TicTacToeAgent("X", q_value_file=q_value_file, epsilon=0.3)
+    train(agent, n_games=200, checkpoint_every=50, snapshot_every=100)
+    saved_values = agent.q_value.values.copy()
+
+    def full_disk(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+    monkeypatch.setattr(QTable, "save", full_disk)
+    train(agent, n_games=400, resume=True, checkpoint_every=50, snapshot_every=100)
+    monkeypatch.undo()
+    trained_values = agent.q_value.values.copy()
+    assert not np.array_equal(saved_values, trained_values, equal_nan=True)
+
+    # The last good snapshot plus the log replay every update since
+    resumed = TicTacToeAgent("X", q_value_file=q_value_file)
+    assert QUpdateLog(q_value_file, resumed.n_cells).restore(resumed) == 400
+    assert binary_path(q_value_file).exists()
+    np.testing.assert_array_equal(resumed.q_value.values, trained_values)
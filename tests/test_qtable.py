@@ -0,0 +1,55 @@
+import random
+
+import numpy as np
+import pytest
+
+from agent import TicTacToeAgent, train
+from batch_train import train_batched
+from qtable import QTable, binary_path, compact_file
+from replay import ReplayBuffer
+from test_replay import random_game_states
+
+def test_compact_min_visits_uses_saved_counts(tmp_path):
+    random.seed(0)
+    q_value_file = tmp_path / "q.json"
+    agent = TicTacToeAgent("X", q_value_file=q_value_file, epsilon=0.3, track_usage=True)
+    train(agent, n_games=300, checkpoint_every=100, snapshot_every=300)
+    path = binary_path(q_value_file)
+    table = QTable.open(path)
+    assert table.visits is not None
+    assert table.visits.max() > 1
+    compact_file(path, tmp_path / "all.qbin")
+    compact_file(path, tmp_path / "visited.qbin", min_visits=5)
+    assert len(QTable.open(tmp_path / "visited.qbin")) < len(QTable.open(tmp_path / "all.qbin"))
+
+def test_compact_min_visits_needs_counts(tmp_path):
+    random.seed(0)
+    agent = TicTacToeAgent("X", q_value_file=tmp_path / "q.json", epsilon=0.3)
+    train(agent, n_games=100, checkpoint_every=100, snapshot_every=100)
+    with pytest.raises(ValueError):
+        compact_file(binary_path(agent.q_value_file), min_visits=5)
+
+def assert_rows_sound(table):
+    # Every used row has a finite value on each legal move: no NaN, no stuck -inf
+    rows = table.used_rows()
+    values = table.values[rows]
+    assert not np.isnan(values).any()
+    assert not (np.isneginf(values) & table.legal_masks(table.keys[rows])).any()
+
+def test_batched_training_under_memory_budget(tmp_path):
+    # A batch holds more rows than the budget allows; the rows it updates at the end
+    # must not be evicted and reused while the batch is still being played
+    agent = TicTacToeAgent("X", board_size=5, win_condition=4, q_value_file=tmp_path / "q.json",
+                           memory_budget=200_000)
+    train_batched(agent, 2048, batch_size=1024, seed=0)
+    assert_rows_sound(agent.q_value)
+
+def test_replay_learn_under_memory_budget(tmp_path):
+    rng = random.Random(0)
+    agent = TicTacToeAgent("X", board_size=5, win_condition=4, q_value_file=tmp_path / "q.json",
+                           memory_budget=200_000)
+    replay = ReplayBuffer(capacity=4096, batch_size=4096, seed=0)
+    while len(replay) < 4096:
+        replay.add_game(*random_game_states(agent.geometry, rng), 1.0)
+    replay.learn(agent)
+    assert_rows_sound(agent.q_value)
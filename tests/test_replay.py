@@ -0,0 +1,42 @@
+import random
+
+import numpy as np
+
+from agent import TicTacToeAgent, train
+from replay import ReplayBuffer
+
+def random_game_states(geometry, rng):
+    # Keys of X to move positions along one random game, with the moves X played
+    x_bits = o_bits = 0
+    states = []
+    actions = []
+    for ply in range(geometry.n_cells):
+        move = rng.choice([cell for cell in range(geometry.n_cells) if not (x_bits | o_bits) >> cell & 1])
+        if ply % 2 == 0:
+            states.append(geometry.key(x_bits, o_bits))
+            actions.append(move)
+            x_bits |= 1 << move
+        else:
+            o_bits |= 1 << move
+    return states, actions
+
+def test_replay_learn_creates_rows_past_capacity(tmp_path):
+    # Exploration moves leave their states for the minibatch update to create, which can
+    # grow the 5x5 table (and reallocate its values) in the middle of learn()
+    rng = random.Random(0)
+    agent = TicTacToeAgent("X", board_size=5, win_condition=4, q_value_file=tmp_path / "q.json")
+    capacity = len(agent.q_value.values)
+    replay = ReplayBuffer(capacity=4096, batch_size=4096, seed=0)
+    while len(replay) < 4096:
+        replay.add_game(*random_game_states(agent.geometry, rng), 1.0)
+    replay.learn(agent)
+    assert len(agent.q_value) > capacity
+    assert np.isfinite(agent.q_value.values[agent.q_value.used_rows()]).any()
+
+def test_replay_training_5x5(tmp_path):
+    random.seed(0)
+    agent = TicTacToeAgent("X", board_size=5, win_condition=4, q_value_file=tmp_path / "q.json", epsilon=0.5,
+                           search_nodes=50)
+    agent.replay = ReplayBuffer(batch_size=1024, learn_every=4, seed=0)
+    train(agent, n_games=300, checkpoint_every=100, snapshot_every=300, report_every=100)
+    assert len(agent.q_value) > 0
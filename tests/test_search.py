@@ -0,0 +1,48 @@
+import time
+
+from bitboard import get_geometry
+from mcts import MCTSSearch
+from search import AlphaBetaSearch
+
+def test_stop_before_search_still_stops_it():
+    # A ponder thread can be cancelled just before its search sets the deadline
+    geometry = get_geometry(5, 4)
+    for engine in (AlphaBetaSearch(geometry, time_limit=3.0), MCTSSearch(geometry, time_limit=3.0)):
+        engine.stop()
+        start = time.perf_counter()
+        result = engine.search(0, 1 << 12)
+        assert time.perf_counter() - start < 0.5
+        assert not result.complete
+
+def bits(*cells):
+    return sum(1 << cell for cell in cells)
+
+def engines(geometry):
+    return (AlphaBetaSearch(geometry, time_limit=None, node_limit=20000),
+            AlphaBetaSearch(geometry, time_limit=None, node_limit=20000, threats=False))
+
+def test_search_takes_a_forced_win():
+    geometry = get_geometry(3, 3)
+    for engine in engines(geometry):
+        result = engine.search(bits(0, 1), bits(3, 4))
+        assert result.best_moves == [2]
+        assert result.outcome == 1
+    geometry = get_geometry(5, 4)
+    for engine in engines(geometry):
+        result = engine.search(bits(5, 6, 7), bits(10, 11, 12))
+        assert 8 in result.best_moves
+        assert result.outcome == 1
+
+def test_search_blocks_a_threat():
+    geometry = get_geometry(3, 3)
+    for engine in engines(geometry):
+        assert engine.search(bits(0, 7), bits(3, 4)).best_moves == [5]
+    # The other side has 6, 7, 8 with 9 taken, so 5 is its only winning cell
+    geometry = get_geometry(5, 4)
+    for engine in engines(geometry):
+        assert engine.search(bits(0, 9, 20), bits(6, 7, 8)).best_moves == [5]
+
+def test_search_sees_a_lost_double_threat():
+    geometry = get_geometry(5, 4)
+    for engine in engines(geometry):
+        assert engine.search(bits(0, 20, 24), bits(6, 7, 8)).outcome == -1
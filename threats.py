@@ -0,0 +1,130 @@
+class ThreatTracker:
+    # Per-line piece counts for both sides of a position, kept up to date by make/unmake
+    # during a search. Side 0 is the side to move at reset(); `turn` is the side to move
+    # now. From the counts it maintains, in O(1) per line touched by a move:
+    #   scores[side] - sum of weights[count] over the lines that side can still complete
+    #                  (none of the other side's pieces), so evaluate() is constant time
+    #   wins[side]   - lines one piece short of a win for that side and still open, whose
+    #                  empty cell wins on the spot (or must be blocked by the other side)
+    def __init__(self, geometry):
+        self.geometry = geometry
+        self.win_condition = geometry.win_condition
+        self.line_masks = geometry.line_masks
+        line_ids = {line: i for i, line in enumerate(geometry.lines)}
+        self.cell_lines = tuple(tuple(line_ids[line] for line in lines) for lines in geometry.lines_by_cell)
+        # A line with more pieces is worth much more; four times per piece keeps a line one
+        # move from completion above any number of weaker ones on the boards we play
+        self.weights = (0,) + tuple(4 ** (count - 1) for count in range(1, self.win_condition + 1))
+        self.reset(0, 0)
+
+    def reset(self, own, other):
+        n_lines = len(self.line_masks)
+        self.counts = ([0] * n_lines, [0] * n_lines)
+        self.scores = [0, 0]
+        self.wins = (set(), set())
+        self.turn = 0
+        near_win = self.win_condition - 1
+        weights = self.weights
+        for i, mask in enumerate(self.line_masks):
+            mine = bin(own & mask).count("1")
+            theirs = bin(other & mask).count("1")
+            self.counts[0][i] = mine
+            self.counts[1][i] = theirs
+            if not theirs:
+                self.scores[0] += weights[mine]
+                if mine == near_win:
+                    self.wins[0].add(i)
+            if not mine:
+                self.scores[1] += weights[theirs]
+                if theirs == near_win:
+                    self.wins[1].add(i)
+
+    def make(self, cell):
+        side = self.turn
+        mine = self.counts[side]
+        theirs = self.counts[side ^ 1]
+        wins = self.wins[side]
+        their_wins = self.wins[side ^ 1]
+        weights = self.weights
+        near_win = self.win_condition - 1
+        gain = 0
+        loss = 0
+        for line in self.cell_lines[cell]:
+            count = mine[line]
+            opposing = theirs[line]
+            if not opposing:
+                gain += weights[count + 1] - weights[count]
+                if count == near_win:
+                    wins.discard(line)
+                elif count + 1 == near_win:
+                    wins.add(line)
+            if not count:
+                # The line was still open for the other side and is blocked now
+                loss += weights[opposing]
+                if opposing == near_win:
+                    their_wins.discard(line)
+            mine[line] = count + 1
+        self.scores[side] += gain
+        self.scores[side ^ 1] -= loss
+        self.turn = side ^ 1
+
+    def unmake(self, cell):
+        side = self.turn ^ 1
+        mine = self.counts[side]
+        theirs = self.counts[side ^ 1]
+        wins = self.wins[side]
+        their_wins = self.wins[side ^ 1]
+        weights = self.weights
+        near_win = self.win_condition - 1
+        gain = 0
+        loss = 0
+        for line in self.cell_lines[cell]:
+            count = mine[line] - 1
+            opposing = theirs[line]
+            mine[line] = count
+            if not opposing:
+                gain += weights[count + 1] - weights[count]
+                if count == near_win:
+                    wins.add(line)
+                elif count + 1 == near_win:
+                    wins.discard(line)
+            if not count:
+                loss += weights[opposing]
+                if opposing == near_win:
+                    their_wins.add(line)
+        self.scores[side] -= gain
+        self.scores[side ^ 1] += loss
+        self.turn = side
+
+    def evaluate(self):
+        # Static score for the side to move
+        return self.scores[self.turn] - self.scores[self.turn ^ 1]
+
+    def win_cells(self, side, empty):
+        # Mask of the cells where `side` completes a line with its next move
+        cells = 0
+        line_masks = self.line_masks
+        for line in self.wins[side]:
+            cells |= line_masks[line] & empty
+        return cells
+
+    def move_gains(self, moves, out, tiebreak):
+        # Writes out[cell] for every move: how much it changes evaluate() for the side to
+        # move (lines it extends plus lines of the other side it blocks), scaled so that
+        # tiebreak[cell] (non-negative, below 2 ** 40) orders moves of equal gain. Filling
+        # a preallocated list keeps move ordering free of per-node containers.
+        side = self.turn
+        mine = self.counts[side]
+        theirs = self.counts[side ^ 1]
+        weights = self.weights
+        cell_lines = self.cell_lines
+        for cell in moves:
+            gain = 0
+            for line in cell_lines[cell]:
+                count = mine[line]
+                opposing = theirs[line]
+                if not opposing:
+                    gain += weights[count + 1] - weights[count]
+                if not count:
+                    gain += weights[opposing]
+            out[cell] = (gain << 40) + tiebreak[cell]